@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+HTTP vs CoAP benchmark. Starts http/server.py and coap/server.py locally on
+free ports and drives them with the same load, for every combination of
+transport mode, concurrency and payload size given:
+
+    http-keepalive  httpx, connections reused across requests
+    http-close      httpx, "Connection: close" (a new TCP connection per request)
+    coap-con        aiocoap, confirmable requests
+    coap-non        aiocoap, non-confirmable requests
+
+Payload size 0 is a GET of /time (the resource the clients use); any other
+size is a POST of that many bytes to /echo, which returns them. CoAP payloads
+over 1024 bytes go blockwise.
+
+    python3 bench_http_coap.py
+    python3 bench_http_coap.py --requests 5000 --concurrency 1 16 64 --payload 0 512 4096
+    python3 bench_http_coap.py --modes coap-con coap-non --concurrency 1
+
+Reported per scenario: throughput, latency percentiles, bytes and packets on
+the wire per request (loopback interface counters, so IP/TCP/UDP headers,
+handshakes and ACKs are included) and server and client CPU time per request.
+Wire and CPU figures are read from /proc and need Linux; other traffic on the
+loopback interface during the run is counted too.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import aiocoap
+import httpx
+from aiocoap import Context, Message
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HTTP_SERVER = os.path.join(HERE, 'http', 'server.py')
+COAP_SERVER = os.path.join(HERE, 'coap', 'server.py')
+MODES = ('http-keepalive', 'http-close', 'coap-con', 'coap-non')
+
+# ================= MEASUREMENT =================
+def free_port(kind):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def process_cpu(pid):
+    """ User + system CPU seconds of a process, None where /proc is missing """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rpartition(')')[2].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15; the split starts at field 3
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+def loopback_counters(iface='lo'):
+    """ (bytes, packets) sent on the loopback interface, None where /proc is missing """
+    try:
+        with open('/proc/net/dev') as f:
+            for line in f:
+                name, _, data = line.partition(':')
+                if name.strip() == iface:
+                    fields = data.split()
+                    return int(fields[8]), int(fields[9])
+    except OSError:
+        pass
+    return None
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+# ================= SERVERS =================
+class Servers:
+    """ Runs both servers (with per-request logging off) for the duration of a with block """
+    def __init__(self, startup_timeout=20):
+        self.http_port = free_port(socket.SOCK_STREAM)
+        self.coap_port = free_port(socket.SOCK_DGRAM)
+        self.startup_timeout = startup_timeout
+        self.http = self.coap = None
+
+    def __enter__(self):
+        self.http = subprocess.Popen([sys.executable, HTTP_SERVER, '--port', str(self.http_port), '--quiet'],
+                                     stdout=subprocess.DEVNULL)
+        self.coap = subprocess.Popen([sys.executable, COAP_SERVER, '--port', str(self.coap_port), '--quiet'],
+                                     stdout=subprocess.DEVNULL)
+        return self
+
+    async def wait_ready(self):
+        deadline = time.monotonic() + self.startup_timeout
+        async with httpx.AsyncClient() as client:
+            while True:
+                self.check_running()
+                try:
+                    (await client.get(self.http_url('/time'), timeout=1)).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"HTTP server did not answer on port {self.http_port}")
+                    await asyncio.sleep(0.2)
+        context = await Context.create_client_context()
+        try:
+            while True:
+                self.check_running()
+                request = Message(code=aiocoap.GET, uri=self.coap_url('/time'), mtype=aiocoap.NON)
+                try:
+                    await asyncio.wait_for(context.request(request).response, 1)
+                    break
+                except (asyncio.TimeoutError, aiocoap.error.Error):
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"CoAP server did not answer on port {self.coap_port}")
+                    await asyncio.sleep(0.2)
+        finally:
+            await context.shutdown()
+
+    def check_running(self):
+        for name, process in (('HTTP', self.http), ('CoAP', self.coap)):
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} server exited with code {process.returncode}")
+
+    def http_url(self, path):
+        return f'http://127.0.0.1:{self.http_port}{path}'
+
+    def coap_url(self, path):
+        return f'coap://127.0.0.1:{self.coap_port}{path}'
+
+    def __exit__(self, *exc):
+        for process in (self.http, self.coap):
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+# ================= CLIENTS =================
+class HttpDriver:
+    def __init__(self, servers, keepalive, concurrency, payload):
+        self.servers = servers
+        self.pid = servers.http.pid
+        self.payload = payload
+        if keepalive:
+            self.client = httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency,
+                                                                max_keepalive_connections=concurrency))
+        else:
+            self.client = httpx.AsyncClient(headers={'Connection': 'close'},
+                                            limits=httpx.Limits(max_connections=concurrency,
+                                                                max_keepalive_connections=0))
+
+    async def open(self, workers):
+        pass
+
+    async def request(self, worker, timeout):
+        if self.payload:
+            response = await self.client.post(self.servers.http_url('/echo'), content=self.payload, timeout=timeout)
+        else:
+            response = await self.client.get(self.servers.http_url('/time'), timeout=timeout)
+        response.raise_for_status()
+        if self.payload and len(response.content) != len(self.payload):
+            raise ValueError("short echo")
+
+    async def close(self):
+        await self.client.aclose()
+
+class CoapDriver:
+    """
+    One client context (UDP socket) per worker, like one TCP connection per
+    worker for HTTP, and like separate devices. Concurrent blockwise uploads
+    from a single endpoint to one resource would collide at the server.
+    """
+    def __init__(self, servers, confirmable, payload):
+        self.servers = servers
+        self.pid = servers.coap.pid
+        self.payload = payload
+        self.mtype = aiocoap.CON if confirmable else aiocoap.NON
+        self.contexts = []
+
+    async def open(self, workers):
+        self.contexts = [await Context.create_client_context() for _ in range(workers)]
+
+    async def request(self, worker, timeout):
+        if self.payload:
+            message = Message(code=aiocoap.POST, uri=self.servers.coap_url('/echo'), mtype=self.mtype,
+                              payload=self.payload)
+        else:
+            message = Message(code=aiocoap.GET, uri=self.servers.coap_url('/time'), mtype=self.mtype)
+        response = await asyncio.wait_for(self.contexts[worker].request(message).response, timeout)
+        if not response.code.is_successful():
+            raise ValueError(f"response code {response.code}")
+        if self.payload and len(response.payload) != len(self.payload):
+            raise ValueError("short echo")
+
+    async def close(self):
+        for context in self.contexts:
+            await context.shutdown()
+
+async def drive(driver, requests, concurrency, timeout):
+    """ Sends `requests` requests from `concurrency` workers; returns latencies and errors """
+    latencies, errors = [], {}
+    remaining = requests
+
+    async def worker(index):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                await driver.request(index, timeout)
+            except Exception as e:
+                name = 'timeout' if isinstance(e, asyncio.TimeoutError) else type(e).__name__
+                errors[name] = errors.get(name, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return latencies, errors
+
+async def run_scenario(servers, args, mode, concurrency, size):
+    print(f"Running {mode}, concurrency {concurrency}, {size} byte payloads...")
+    payload = os.urandom(size) if size else b''
+    if mode.startswith('http'):
+        driver = HttpDriver(servers, mode == 'http-keepalive', concurrency, payload)
+    else:
+        driver = CoapDriver(servers, mode == 'coap-con', payload)
+    await driver.open(concurrency)
+    try:
+        if args.warmup:
+            await drive(driver, args.warmup, concurrency, args.timeout)
+        # Let the warm-up's connection teardown (FIN/ACKs) leave the wire before counting
+        await asyncio.sleep(0.2)
+
+        wire_before = loopback_counters()
+        server_before = process_cpu(driver.pid)
+        client_before = time.process_time()
+        start = time.perf_counter()
+        latencies, errors = await drive(driver, args.requests, concurrency, args.timeout)
+        elapsed = time.perf_counter() - start
+        client_cpu = time.process_time() - client_before
+        server_after = process_cpu(driver.pid)
+        await asyncio.sleep(0.2)
+        wire_after = loopback_counters()
+    finally:
+        await driver.close()
+
+    ok = len(latencies)
+    latencies.sort()
+    result = {
+        'mode': mode,
+        'concurrency': concurrency,
+        'payload': size,
+        'ok': ok,
+        'errors': errors,
+        'rate': ok / elapsed if elapsed > 0 else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+        'wire_bytes': None,
+        'wire_packets': None,
+        'server_cpu': None,
+        'client_cpu': client_cpu / ok if ok else None,
+    }
+    if ok and wire_before is not None and wire_after is not None:
+        result['wire_bytes'] = (wire_after[0] - wire_before[0]) / ok
+        result['wire_packets'] = (wire_after[1] - wire_before[1]) / ok
+    if ok and server_before is not None and server_after is not None:
+        result['server_cpu'] = (server_after - server_before) / ok
+    return result
+
+def print_results(results):
+    optional = lambda value, scale, width: f"{value * scale:>{width}.1f}" if value is not None else f"{'n/a':>{width}}"
+    print(f"\n{'mode':<15} {'conc':>5} {'payload':>8} {'ok':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'wire B/req':>11} {'pkts/req':>9} "
+          f"{'srv us/req':>11} {'cli us/req':>11}")
+    for r in results:
+        print(f"{r['mode']:<15} {r['concurrency']:>5} {r['payload']:>8} {r['ok']:>7} {sum(r['errors'].values()):>7} "
+              f"{r['rate']:>8.0f} {r['p50'] * 1000:>8.2f} {r['p95'] * 1000:>8.2f} {r['p99'] * 1000:>8.2f} "
+              f"{r['max'] * 1000:>8.2f} {optional(r['wire_bytes'], 1, 11)} {optional(r['wire_packets'], 1, 9)} "
+              f"{optional(r['server_cpu'], 1e6, 11)} {optional(r['client_cpu'], 1e6, 11)}")
+    for r in results:
+        if r['errors']:
+            details = ', '.join(f"{name} {count}" for name, count in sorted(r['errors'].items()))
+            print(f"Errors in {r['mode']} c={r['concurrency']} payload={r['payload']}: {details}")
+
+async def run(args):
+    results = []
+    with Servers() as servers:
+        print(f"HTTP server on port {servers.http_port}, CoAP server on port {servers.coap_port}")
+        await servers.wait_ready()
+        try:
+            for mode in args.modes:
+                for concurrency in args.concurrency:
+                    for size in args.payload:
+                        results.append(await run_scenario(servers, args, mode, concurrency, size))
+        except asyncio.CancelledError:
+            print("Interrupted")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--requests', type=int, default=2000, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16], help="requests in flight at once")
+    parser.add_argument('--payload', type=int, nargs='+', default=[0, 256],
+                        help="request/response payload sizes in bytes (0 = GET /time)")
+    parser.add_argument('--warmup', type=int, default=50, help="unmeasured requests before each scenario")
+    parser.add_argument('--timeout', type=float, default=10, help="seconds before a request counts as failed")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Interrupted")
+        return
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    print(f"{args.requests} requests per scenario, {args.warmup} warm-up")
+    print_results(results)
+
+if __name__ == "__main__":
+    main()
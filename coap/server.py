@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import argparse
 import asyncio
 import logging
 import datetime
@@ -28,7 +29,15 @@ class TimeResource(resource.Resource):
         # Create a CoAP message with a 'Content' code and the payload
         return aiocoap.Message(code=aiocoap.CONTENT, payload=payload)
 
-async def main():
+class EchoResource(resource.Resource):
+    """
+    Returns the payload of a POST as sent, so clients (e.g. bench_http_coap.py)
+    can choose the payload size. Payloads over one block use blockwise transfer.
+    """
+    async def render_post(self, request):
+        return aiocoap.Message(code=aiocoap.CHANGED, payload=request.payload)
+
+async def main(port=5683):
     """
     Main function to set up and run the CoAP server.
     """
@@ -37,20 +46,29 @@ async def main():
     
     # Add our TimeResource to the site at the path "time"
     root.add_resource(('time',), TimeResource())
+    root.add_resource(('echo',), EchoResource())
 
     # Set up the CoAP server context
     # This binds the server to all available network interfaces on port 5683
-    await aiocoap.Context.create_server_context(root)
+    await aiocoap.Context.create_server_context(root, bind=('::', port))
 
     # Wait indefinitely for requests
-    print("CoAP server started on coap://[::]:5683")
+    print(f"CoAP server started on coap://[::]:{port}")
     print("Serving resource at /time")
     
     # Keep the server running
     await asyncio.get_running_loop().create_future()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5683)
+    parser.add_argument('--quiet', action='store_true', help="warnings only")
+    args = parser.parse_args()
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("coap-server").setLevel(logging.WARNING)
+
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.port))
     except KeyboardInterrupt:
         print("Server shutting down.")
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Packets per second of netmon's capture backends, with and without the
+netmon accounting (rate buckets + MQTT parsing) behind them.
+
+Offline, on a pcap file (pcap backend vs scapy dissecting the same file):
+    python3 bench_capture.py synth mqtt.pcap --packets 200000   # synthetic MQTT traffic
+    python3 bench_capture.py pcap mqtt.pcap --repeat 3
+
+Live, each backend in turn for a fixed time while traffic is generated
+elsewhere (root required):
+    sudo python3 bench_capture.py live --iface lo --seconds 10
+"""
+
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+
+from capture import PcapCapture, RawSocketCapture, ScapyCapture
+from mqttwire import MqttAccounting
+from ratecounter import RateCounter
+
+FILTER_PORT = 1883
+WINDOWS = [5, 15, 60]
+
+# ================= SYNTHETIC PCAP =================
+def frame(src, sport, dst, dport, seq, flags, payload):
+    """ Ethernet + IPv4 + TCP frame (checksums left at 0) """
+    tcp = struct.pack('!HHIIBBHHH', sport, dport, seq, 0, 5 << 4, flags, 65535, 0, 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0x4000, 64, 6, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return b'\x00' * 12 + b'\x08\x00' + ip + tcp
+
+def mqtt_packet(ptype, body):
+    remaining = len(body)
+    header = bytearray([ptype << 4 | (2 if ptype == 8 else 0)])
+    while True:
+        digit, remaining = remaining & 0x7F, remaining >> 7
+        header.append(digit | (0x80 if remaining else 0))
+        if not remaining:
+            return bytes(header) + body
+
+def synth(args):
+    """
+    Writes a pcap of `clients` devices publishing to a broker: mostly
+    PUBLISH (QoS 1, PUBACK back), some PINGREQ/PINGRESP, with a share of
+    segments carrying two MQTT packets and of packets split over two segments.
+    """
+    rng = random.Random(1)
+    broker = '10.0.0.1'
+    clients = [(f'10.0.1.{i + 2}', 40000 + i) for i in range(args.clients)]
+    seqs = {}
+    ts = 1_700_000_000.0
+
+    with open(args.output, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+
+        def write(src, sport, dst, dport, flags, payload):
+            nonlocal ts
+            key = (src, sport, dst, dport)
+            seq = seqs.get(key, rng.randrange(1 << 32))
+            data = frame(src, sport, dst, dport, seq, flags, payload)
+            seqs[key] = (seq + len(payload) + (1 if flags & 0x02 else 0)) & 0xFFFFFFFF
+            ts += rng.expovariate(args.rate)
+            f.write(struct.pack('<IIII', int(ts), int(ts % 1 * 1e6), len(data), len(data)))
+            f.write(data)
+
+        for ip, port in clients:
+            write(ip, port, broker, FILTER_PORT, 0x02, b'')
+
+        written = 0
+        packet_id = 0
+        while written < args.packets:
+            ip, port = clients[min(int(rng.paretovariate(1.2)) - 1, len(clients) - 1)]  # A few heavy talkers
+            if rng.random() < 0.05:
+                write(ip, port, broker, FILTER_PORT, 0x18, mqtt_packet(12, b''))
+                write(broker, FILTER_PORT, ip, port, 0x18, mqtt_packet(13, b''))
+                written += 2
+                continue
+
+            packet_id = packet_id % 65535 + 1
+            topic = f'esp32/{port}/data'.encode()
+            body = struct.pack('!H', len(topic)) + topic + struct.pack('!H', packet_id)
+            body += bytes(rng.choice((16, 64, 256, 1500, 6000)))
+            publish = mqtt_packet(3, body)
+            publish = bytes([publish[0] | 0x02]) + publish[1:]  # QoS 1
+            puback = mqtt_packet(4, struct.pack('!H', packet_id))
+
+            r = rng.random()
+            if r < 0.1:
+                # Two packets in one segment
+                write(ip, port, broker, FILTER_PORT, 0x18, publish + mqtt_packet(12, b''))
+                written += 1
+            elif r < 0.2 or len(publish) > 1460:
+                # Split over segments, sometimes inside the fixed header
+                cut = 2 if r < 0.15 else rng.randrange(1, len(publish))
+                for i in range(0, cut, 1460):
+                    write(ip, port, broker, FILTER_PORT, 0x10, publish[i:min(i + 1460, cut)])
+                    written += 1
+                for i in range(cut, len(publish), 1460):
+                    write(ip, port, broker, FILTER_PORT, 0x18, publish[i:i + 1460])
+                    written += 1
+            else:
+                write(ip, port, broker, FILTER_PORT, 0x18, publish)
+                written += 1
+            write(broker, FILTER_PORT, ip, port, 0x18, puback)
+            written += 1
+    print(f"Wrote {written} segments from {len(clients)} clients to {args.output}")
+
+# ================= BENCHMARKS =================
+def netmon_handler():
+    """ The same work as netmon.process_packet, on fresh counters """
+    traffic = RateCounter(WINDOWS)
+    accounting = MqttAccounting(FILTER_PORT, lambda: RateCounter(WINDOWS))
+
+    def handler(timestamp, wire_len, src, sport, dst, dport, seq, flags, payload):
+        traffic.record(timestamp, wire_len)
+        accounting.packet(timestamp, src, sport, dst, dport, seq, flags, payload)
+    return handler, accounting
+
+def noop_handler(*_):
+    pass
+
+def report(name, packets, elapsed, extra=''):
+    print(f"{name:<28} {packets:>10} {elapsed:>8.2f} {packets / elapsed if elapsed else 0:>12.0f}  {extra}")
+
+def bench_pcap(args):
+    print(f"{'backend':<28} {'packets':>10} {'seconds':>8} {'packets/s':>12}")
+    accounting = None
+    for name, make in (('pcap (headers only)', lambda: (noop_handler, None)),
+                       ('pcap + netmon accounting', netmon_handler)):
+        for _ in range(args.repeat):
+            handler, accounting = make()
+            capture = PcapCapture(args.pcap, args.port)
+            start = time.perf_counter()
+            capture.run(handler)
+            report(name, capture.captured, time.perf_counter() - start)
+
+    if not args.no_scapy:
+        from scapy.utils import PcapReader
+        for _ in range(args.repeat):
+            handler, _ = netmon_handler()
+            capture = ScapyCapture(None, args.port)
+            on_packet = capture.adapter(handler)
+            start = time.perf_counter()
+            for packet in PcapReader(args.pcap):
+                on_packet(packet)
+            report('scapy + netmon accounting', capture.captured, time.perf_counter() - start)
+
+    if accounting is not None and accounting.clients:
+        packets = sum(sum(c.types) for c in accounting.clients.values())
+        stats = accounting.stats(max(c.last_seen for c in accounting.clients.values()))
+        print(f"\nMQTT: {packets} packets from {stats['clients']} clients, {stats['resyncs']} resyncs")
+
+def bench_live(args):
+    print(f"{'backend':<28} {'packets':>10} {'seconds':>8} {'packets/s':>12}")
+    backends = [('raw', lambda: RawSocketCapture(args.iface, args.port)),
+                ('raw (headers only)', lambda: RawSocketCapture(args.iface, args.port, payload=False))]
+    if not args.no_scapy:
+        backends.append(('scapy', lambda: ScapyCapture(args.iface, args.port)))
+    for name, make in backends:
+        handler, _ = netmon_handler()
+        capture = make()
+        thread = threading.Thread(target=capture.run, args=(handler,), daemon=True)
+        start = time.perf_counter()
+        thread.start()
+        time.sleep(args.seconds)
+        capture.stop()
+        elapsed = time.perf_counter() - start
+        stats = capture.stats()
+        drops = f"kernel drops {stats['kernel_drops']}" if 'kernel_drops' in stats else ''
+        report(f'{name} + netmon accounting', stats['captured'], elapsed, drops)
+        thread.join(2.0)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    s = sub.add_parser('synth', help="write a synthetic MQTT pcap")
+    s.add_argument('output')
+    s.add_argument('--packets', type=int, default=100000)
+    s.add_argument('--clients', type=int, default=50)
+    s.add_argument('--rate', type=float, default=5000, help="mean packets/s of the recorded timestamps")
+
+    p = sub.add_parser('pcap', help="replay a pcap through each backend")
+    p.add_argument('pcap')
+    p.add_argument('--port', type=int, default=FILTER_PORT)
+    p.add_argument('--repeat', type=int, default=1)
+    p.add_argument('--no-scapy', action='store_true')
+
+    l = sub.add_parser('live', help="capture live traffic with each backend")
+    l.add_argument('--iface', default='lo')
+    l.add_argument('--port', type=int, default=FILTER_PORT)
+    l.add_argument('--seconds', type=float, default=10)
+    l.add_argument('--no-scapy', action='store_true')
+
+    args = parser.parse_args()
+    {'synth': synth, 'pcap': bench_pcap, 'live': bench_live}[args.command](args)
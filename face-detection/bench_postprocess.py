@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-row Python post-processing vs the vectorised version in
+postprocess.py, on recorded yolov5-face outputs.
+
+Record outputs once (needs onnxruntime and the model):
+    python3 bench_postprocess.py --record known_faces/*.png -o outputs.npz
+
+Then benchmark (only needs numpy + opencv):
+    python3 bench_postprocess.py outputs.npz
+"""
+
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from postprocess import CONF_THRESHOLD, NMS_THRESHOLD, decode_predictions, non_max_suppression
+
+MODEL_PATH = "yolov5n-face.onnx"
+
+# ================= REFERENCE (ORIGINAL LOOP) =================
+def decode_predictions_loop(predictions, scale_x, scale_y, conf_threshold=CONF_THRESHOLD):
+    """ The original per-row loop from YoloFaceDetector.detect_and_recognize """
+    boxes = []
+    scores = []
+    for row in predictions:
+        score = row[4] * row[15]
+        if score > conf_threshold:
+            cx, cy, w, h = row[0], row[1], row[2], row[3]
+            boxes.append([
+                int((cx - w/2) * scale_x),
+                int((cy - h/2) * scale_y),
+                int(w * scale_x),
+                int(h * scale_y)
+            ])
+            scores.append(float(score))
+    return boxes, scores
+
+def postprocess_loop(predictions, scale_x, scale_y):
+    boxes, scores = decode_predictions_loop(predictions, scale_x, scale_y)
+    indices = cv2.dnn.NMSBoxes(boxes, scores, CONF_THRESHOLD, NMS_THRESHOLD)
+    return [boxes[i] for i in np.asarray(indices).reshape(-1)]
+
+def postprocess_vectorised(predictions, scale_x, scale_y):
+    boxes, scores = decode_predictions(predictions, scale_x, scale_y)
+    keep = non_max_suppression(boxes, scores)
+    return boxes[keep].tolist()
+
+# ================= RECORDING =================
+def record(image_paths, output_path, model_path):
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    inp = session.get_inputs()[0]
+    input_h, input_w = inp.shape[2], inp.shape[3]
+    output_name = session.get_outputs()[0].name
+
+    predictions, sizes = [], []
+    for path in image_paths:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"  Skipping unreadable image {path}")
+            continue
+        blob = cv2.resize(img, (input_w, input_h))
+        blob = cv2.cvtColor(blob, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+        blob = np.expand_dims(blob.transpose(2, 0, 1), axis=0)
+        out = session.run([output_name], {inp.name: blob})[0]
+        predictions.append(np.squeeze(out))
+        sizes.append(img.shape[:2])
+        print(f"  Recorded {path}: {predictions[-1].shape[0]} rows")
+
+    if not predictions:
+        print("Nothing recorded.")
+        sys.exit(1)
+
+    np.savez_compressed(output_path,
+                        predictions=np.stack(predictions),
+                        sizes=np.asarray(sizes, dtype=np.int32),
+                        input_size=np.asarray([input_h, input_w], dtype=np.int32))
+    print(f"Saved {len(predictions)} outputs to {output_path}")
+
+# ================= BENCHMARK =================
+def time_per_call(fn, args, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) / repeat
+
+def benchmark(path, repeat):
+    data = np.load(path)
+    predictions = data['predictions']
+    sizes = data['sizes']
+    input_h, input_w = data['input_size'].tolist()
+
+    total_loop = total_vec = 0.0
+    print(f"{'frame':>5} {'rows':>6} {'faces':>5} {'loop ms':>9} {'numpy ms':>9} {'speedup':>8}")
+    for n, (pred, (orig_h, orig_w)) in enumerate(zip(predictions, sizes)):
+        args = (pred, orig_w / input_w, orig_h / input_h)
+
+        expected = postprocess_loop(*args)
+        got = postprocess_vectorised(*args)
+        if expected != got:
+            print(f"MISMATCH on frame {n}: loop={expected} numpy={got}")
+            sys.exit(1)
+
+        t_loop = time_per_call(postprocess_loop, args, repeat)
+        t_vec = time_per_call(postprocess_vectorised, args, repeat)
+        total_loop += t_loop
+        total_vec += t_vec
+        print(f"{n:>5} {len(pred):>6} {len(got):>5} {t_loop*1000:>9.3f} {t_vec*1000:>9.3f} {t_loop/t_vec:>7.1f}x")
+
+    frames = len(predictions)
+    print(f"Mean per frame: loop {total_loop/frames*1000:.3f} ms, "
+          f"numpy {total_vec/frames*1000:.3f} ms ({total_loop/total_vec:.1f}x faster)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help="outputs .npz to benchmark, or images with --record")
+    parser.add_argument('--record', action='store_true', help="run the model on images and save its outputs")
+    parser.add_argument('-o', '--output', default='outputs.npz', help="where --record writes to")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--repeat', type=int, default=50, help="timed calls per frame")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.inputs, args.output, args.model)
+    else:
+        for path in args.inputs:
+            benchmark(path, args.repeat)
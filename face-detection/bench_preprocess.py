@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Compares the original per-frame preprocessing with the reusable-buffer
+Preprocessor (stretch and letterbox), reporting time and bytes allocated
+per frame.
+
+    python3 bench_preprocess.py                    # synthetic UXGA frame
+    python3 bench_preprocess.py known_faces/*.png  # real images
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from preprocess import Preprocessor
+
+INPUT_W = 640
+INPUT_H = 640
+
+def preprocess_original(img, input_w=INPUT_W, input_h=INPUT_H):
+    """ The original YoloFaceDetector.preprocess """
+    img_resized = cv2.resize(img, (input_w, input_h))
+    img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+    img_data = img_rgb.astype(np.float32) / 255.0
+    img_data = img_data.transpose(2, 0, 1)
+    return np.expand_dims(img_data, axis=0)
+
+def ms_per_frame(fn, frames, repeat):
+    for img in frames:  # warm-up, lets the Preprocessor size its buffers
+        fn(img)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for img in frames:
+            fn(img)
+    return (time.perf_counter() - start) / (repeat * len(frames)) * 1000
+
+def allocated_per_frame(fn, frames):
+    """ Peak bytes allocated (NumPy arrays included) while preprocessing one frame """
+    peaks = []
+    for img in frames:
+        fn(img)
+        tracemalloc.start()
+        fn(img)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*')
+    parser.add_argument('--size', default='1600x1200', help="synthetic frame size when no images are given")
+    parser.add_argument('--input', default=f'{INPUT_W}x{INPUT_H}', help="model input WxH")
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    input_w, input_h = (int(v) for v in args.input.split('x'))
+    if args.images:
+        frames = [img for img in (cv2.imread(p, cv2.IMREAD_COLOR) for p in args.images) if img is not None]
+    else:
+        w, h = (int(v) for v in args.size.split('x'))
+        frames = [np.random.default_rng(0).integers(0, 256, (h, w, 3), dtype=np.uint8)]
+
+    # Stretch mode must reproduce the original tensor
+    stretch = Preprocessor(input_w, input_h, letterbox=False)
+    diff = np.abs(stretch(frames[0]) - preprocess_original(frames[0], input_w, input_h)).max()
+    print(f"Stretch mode max abs difference vs original: {diff:.2e}")
+
+    candidates = [
+        ('original', lambda img: preprocess_original(img, input_w, input_h)),
+        ('reuse/stretch', Preprocessor(input_w, input_h, letterbox=False)),
+        ('reuse/letterbox', Preprocessor(input_w, input_h, letterbox=True)),
+    ]
+
+    print(f"{'mode':<16} {'ms/frame':>9} {'allocated B/frame':>18}")
+    for name, fn in candidates:
+        ms = ms_per_frame(fn, frames, args.repeat)
+        allocated = allocated_per_frame(fn, frames)
+        print(f"{name:<16} {ms:>9.3f} {allocated:>18.0f}")
+
+    for name, fn in candidates[1:]:
+        print(f"{name} stats: {fn.stats()}")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from collections import deque
+
+import cv2
+
+# ================= LAZY FRAME =================
+class LazyFrame:
+    """
+    A processed frame whose annotation and JPEG encoding are deferred until a
+    viewer asks for it. Annotation runs once; each (quality, width) variant is
+    encoded once and shared by every viewer that asks for it.
+    """
+    def __init__(self, image, annotate=None, encode_seconds=None):
+        self.image = image
+        self.annotate = annotate
+        self.encode_seconds = encode_seconds  # Optional metrics.Histogram
+        self.encoded = {}
+        self.lock = threading.Lock()
+
+    def jpeg(self, quality=95, width=0):
+        key = (quality, width)
+        with self.lock:
+            data = self.encoded.get(key)
+            if data is not None:
+                return data
+
+            if self.annotate is not None:
+                self.annotate(self.image)
+                self.annotate = None
+
+            start = time.perf_counter()
+            img = self.image
+            if width and width < img.shape[1]:
+                height = max(1, round(img.shape[0] * width / img.shape[1]))
+                img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+            ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            data = self.encoded[key] = buffer.tobytes() if ok else b''
+            if self.encode_seconds is not None:
+                self.encode_seconds.observe(time.perf_counter() - start)
+            return data
+
+# ================= MJPEG BROADCASTER =================
+class FrameBroadcaster:
+    """
+    Publishes each new processed frame once, with a sequence number, to every
+    subscriber. Subscribers wait on a condition instead of polling and always
+    jump to the latest frame: a slow client skips frames rather than queueing
+    them, and never holds up the publisher.
+    """
+    def __init__(self, fps_window=30):
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.clients = 0
+        self.publish_times = deque(maxlen=fps_window)
+
+        # Stats
+        self.frames_published = 0
+        self.frames_sent = 0
+        self.frames_skipped = 0
+
+    def publish(self, frame):
+        with self.cond:
+            self.frame = frame
+            self.seq += 1
+            self.frames_published += 1
+            self.publish_times.append(time.monotonic())
+            self.cond.notify_all()
+
+    def latest(self):
+        with self.cond:
+            return self.seq, self.frame
+
+    def subscribe(self, timeout=1.0):
+        """
+        Generator of (seq, frame) for one client. Yields every new frame the
+        client is ready for; frames published while it was busy are skipped.
+        """
+        with self.cond:
+            self.clients += 1
+        last_seq = 0
+        try:
+            while True:
+                with self.cond:
+                    if not self.cond.wait_for(lambda: self.seq > last_seq and self.frame is not None, timeout):
+                        continue
+                    if last_seq:
+                        self.frames_skipped += self.seq - last_seq - 1
+                    last_seq, frame = self.seq, self.frame
+                    self.frames_sent += 1
+                yield last_seq, frame
+        finally:
+            with self.cond:
+                self.clients -= 1
+
+    def fps(self):
+        """ Publish rate over the last few frames; 0 if the stream has stalled """
+        with self.cond:
+            times = list(self.publish_times)
+        if len(times) < 2 or time.monotonic() - times[-1] > 2.0:
+            return 0.0
+        return (len(times) - 1) / max(times[-1] - times[0], 1e-9)
+
+    def stats(self):
+        fps = self.fps()
+        with self.cond:
+            return {
+                'clients': self.clients,
+                'fps': round(fps, 2),
+                'seq': self.seq,
+                'frames_published': self.frames_published,
+                'frames_sent': self.frames_sent,
+                'frames_skipped': self.frames_skipped,
+            }
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+from broadcast import FrameBroadcaster
+
+DEFAULT_CAMERA = "cam"
+
+def camera_from_topic(topic, pattern):
+    """
+    Extracts the camera id from an image topic, using the '+' levels of the
+    subscription pattern: camera_from_topic('esp32/door/image', 'esp32/+/image') -> 'door'.
+    Patterns without '+' are a single camera, DEFAULT_CAMERA.
+    """
+    levels = pattern.split('/')
+    if '+' not in levels:
+        return DEFAULT_CAMERA
+    parts = topic.split('/')
+    if len(parts) != len(levels):
+        return None
+    return '/'.join(p for p, l in zip(parts, levels) if l == '+')
+
+# ================= PER-CAMERA STATE =================
+class Camera:
+    """ Latest-frame slot and per-camera pipeline state """
+    def __init__(self, camera_id):
+        self.id = camera_id
+        self.raw_jpeg_bytes = None        # Latest frame from the ESP32 (older ones are overwritten)
+        self.seq = 0                      # Sequence number of raw_jpeg_bytes
+        self.taken_seq = 0                # Last sequence number handed to a worker
+        self.received_at = 0.0            # time.monotonic() when raw_jpeg_bytes arrived
+        self.broadcaster = FrameBroadcaster()  # Annotated frames for the web stream
+        self.tracker = None               # Set by the owner; tracks are per camera
+        self.busy = False                 # A worker is processing this camera
+        self.last_served = 0.0            # When a worker last picked this camera
+
+        # Stats
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_superseded = 0        # Overwritten by a newer frame before a worker took them
+
+        # Rate Limiter State
+        self.last_publish_time = 0
+        self.last_published_name = ""
+
+# ================= FAIR SCHEDULER =================
+class FrameScheduler:
+    """
+    Hands cameras to workers. Every camera has one latest-frame slot, a camera
+    is never processed by two workers at once, and among the cameras that have
+    a frame, the one served longest ago goes first, so a camera sending at a
+    high rate cannot starve the others.
+
+    Frames carry a per-camera sequence number: workers sleep until a frame they
+    have not seen arrives, and each frame is handed out at most once. A frame
+    replaced by a newer one before any worker took it counts as superseded.
+    """
+    def __init__(self, camera_factory=Camera):
+        self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)
+        self.cameras = {}
+        self.camera_factory = camera_factory
+
+    def get(self, camera_id, create=True):
+        with self.lock:
+            camera = self.cameras.get(camera_id)
+            if camera is None and create:
+                camera = self.cameras[camera_id] = self.camera_factory(camera_id)
+                print(f"New camera: {camera_id}")
+            return camera
+
+    def ids(self):
+        with self.lock:
+            return sorted(self.cameras)
+
+    def put(self, camera_id, jpeg_bytes):
+        camera = self.get(camera_id)
+        with self.lock:
+            if camera.seq > camera.taken_seq:
+                camera.frames_superseded += 1
+            camera.raw_jpeg_bytes = jpeg_bytes
+            camera.received_at = time.monotonic()
+            camera.seq += 1
+            camera.frames_received += 1
+            self.frame_ready.notify()
+
+    def _ready(self):
+        return [c for c in self.cameras.values() if c.seq > c.taken_seq and not c.busy]
+
+    def acquire(self, timeout=None):
+        """
+        Blocks until a camera has a new frame, then returns
+        (camera, jpeg bytes, seq, received_at).
+        Returns (None, None, None, None) if timeout (seconds) expires first.
+        """
+        with self.lock:
+            if not self.frame_ready.wait_for(lambda: self._ready(), timeout):
+                return None, None, None, None
+            camera = min(self._ready(), key=lambda c: c.last_served)
+            camera.busy = True
+            camera.last_served = time.monotonic()
+            camera.taken_seq = camera.seq
+            camera.frames_processed += 1
+            return camera, camera.raw_jpeg_bytes, camera.seq, camera.received_at
+
+    def release(self, camera, processed_frame=None):
+        if processed_frame is not None:
+            camera.broadcaster.publish(processed_frame)
+        with self.lock:
+            camera.busy = False
+            # A frame may have arrived for this camera while it was busy
+            if camera.seq > camera.taken_seq:
+                self.frame_ready.notify()
+
+    def stats(self):
+        with self.lock:
+            return {c.id: {
+                'frames_received': c.frames_received,
+                'frames_processed': c.frames_processed,
+                'frames_superseded': c.frames_superseded,
+            } for c in self.cameras.values()}
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Packet capture backends for netmon.py. Every backend calls
+
+    handler(timestamp, wire_len, src, sport, dst, dport, seq, flags, payload)
+
+for each TCP segment to or from `port`, where payload is a bytes-like view
+of the TCP payload that is only valid during the call.
+
+- raw:   AF_PACKET socket with an in-kernel BPF filter; parses only the
+         IP/TCP headers with struct, no per-packet Python objects (Linux, root).
+- scapy: scapy's sniff(), the original implementation; portable but slow.
+- pcap:  replays a pcap file, as fast as possible or at the recorded pace.
+"""
+
+import ctypes
+import socket
+import struct
+import time
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+SO_ATTACH_FILTER = 26
+PACKET_OUTGOING = 4
+
+TCP_HEADER = struct.Struct('!HHIIBB')  # sport, dport, seq, ack, data offset, flags
+U16 = struct.Struct('!H')
+
+# ================= HEADER PARSING =================
+def parse_ip(buf, offset, end, port):
+    """ IPv4/IPv6 + TCP headers at buf[offset:end]; None if not TCP on `port` """
+    try:
+        version = buf[offset] >> 4
+        if version == 4:
+            if buf[offset + 9] != 6 or U16.unpack_from(buf, offset + 6)[0] & 0x1FFF:
+                return None  # Not TCP, or a non-first fragment
+            end = min(end, offset + U16.unpack_from(buf, offset + 2)[0])  # Drop Ethernet padding
+            src = socket.inet_ntoa(buf[offset + 12:offset + 16])
+            dst = socket.inet_ntoa(buf[offset + 16:offset + 20])
+            offset += (buf[offset] & 0x0F) * 4
+        elif version == 6:
+            if buf[offset + 6] != 6:
+                return None  # Not TCP (extension headers are not followed)
+            end = min(end, offset + 40 + U16.unpack_from(buf, offset + 4)[0])
+            src = socket.inet_ntop(socket.AF_INET6, bytes(buf[offset + 8:offset + 24]))
+            dst = socket.inet_ntop(socket.AF_INET6, bytes(buf[offset + 24:offset + 40]))
+            offset += 40
+        else:
+            return None
+        sport, dport, seq, _, data_offset, flags = TCP_HEADER.unpack_from(buf, offset)
+    except (IndexError, struct.error):
+        return None  # Truncated headers
+    if port and sport != port and dport != port:
+        return None
+    start = offset + (data_offset >> 4) * 4
+    return src, sport, dst, dport, seq, flags, buf[start:max(start, end)]
+
+def parse_link(buf, end, port, type_offset, ip_offset):
+    """ Link layers with a 16-bit ethertype (Ethernet, Linux SLL/SLL2); skips one VLAN tag """
+    try:
+        ethertype = U16.unpack_from(buf, type_offset)[0]
+        if ethertype == 0x8100:
+            ethertype = U16.unpack_from(buf, type_offset + 4)[0]
+            ip_offset += 4
+    except struct.error:
+        return None
+    if ethertype != 0x0800 and ethertype != 0x86DD:
+        return None
+    return parse_ip(buf, ip_offset, end, port)
+
+def parse_ethernet(buf, end, port):
+    return parse_link(buf, end, port, 12, 14)
+
+# pcap link type -> parser(buf, end, port)
+LINK_TYPES = {
+    0: lambda buf, end, port: parse_ip(buf, 4, end, port),     # BSD loopback
+    1: parse_ethernet,
+    101: lambda buf, end, port: parse_ip(buf, 0, end, port),   # Raw IP
+    113: lambda buf, end, port: parse_link(buf, end, port, 14, 16),  # Linux cooked
+    228: lambda buf, end, port: parse_ip(buf, 0, end, port),   # Raw IPv4
+    229: lambda buf, end, port: parse_ip(buf, 0, end, port),   # Raw IPv6
+    276: lambda buf, end, port: parse_link(buf, end, port, 0, 20),   # Linux cooked v2
+}
+
+# ================= RAW SOCKET =================
+def tcp_port_filter(port):
+    """
+    Classic BPF program for "ip and tcp and port <port>" (as `tcpdump -dd`
+    would emit, IPv4 only, first fragments only), so the kernel drops
+    unrelated traffic before it is copied to user space.
+    """
+    program = [
+        (0x28, 0, 0, 12),        # ldh [12]            ethertype
+        (0x15, 0, 10, 0x0800),   # jeq IPv4            else drop
+        (0x30, 0, 0, 23),        # ldb [23]            IP protocol
+        (0x15, 0, 8, 6),         # jeq TCP             else drop
+        (0x28, 0, 0, 20),        # ldh [20]            flags + fragment offset
+        (0x45, 6, 0, 0x1FFF),    # jset fragment       drop
+        (0xB1, 0, 0, 14),        # ldxb 4*([14]&0xf)   IP header length
+        (0x48, 0, 0, 14),        # ldh [x+14]          source port
+        (0x15, 2, 0, port),      # jeq port            accept
+        (0x48, 0, 0, 16),        # ldh [x+16]          destination port
+        (0x15, 0, 1, port),      # jeq port            accept, else drop
+        (0x06, 0, 0, 0x40000),   # ret accept (whole packet)
+        (0x06, 0, 0, 0),         # ret drop
+    ]
+    return b''.join(struct.pack('HBBI', *insn) for insn in program), len(program)
+
+class RawSocketCapture:
+    """
+    AF_PACKET reader. With payload=False only the first `snaplen` bytes of
+    each frame are copied (MSG_TRUNC still reports the real length), which is
+    enough for byte/packet rates but not for MQTT accounting.
+    """
+    name = 'raw'
+
+    def __init__(self, iface, port, payload=True, snaplen=128, rcvbuf=8 << 20, kernel_filter=True):
+        self.iface = iface
+        self.port = port
+        self.payload = payload
+        self.snaplen = snaplen
+        self.rcvbuf = rcvbuf
+        self.kernel_filter = kernel_filter
+        self.running = False
+        self.sock = None
+        self.captured = 0
+        self.kernel_drops = 0
+
+    def open(self):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        if self.kernel_filter:
+            code, length = tcp_port_filter(self.port)
+            self._filter = ctypes.create_string_buffer(code, len(code))
+            fprog = struct.pack('HL', length, ctypes.addressof(self._filter))
+            sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+        sock.bind((self.iface, 0))
+        sock.settimeout(0.5)  # So stop() is noticed on an idle link
+        self.sock = sock
+
+    def run(self, handler):
+        if self.sock is None:
+            self.open()
+        sock = self.sock
+        buf = bytearray(262144)
+        view = memoryview(buf)
+        size, flags = (0, 0) if self.payload else (self.snaplen, socket.MSG_TRUNC)
+        loopback = self.iface == 'lo'
+        port = self.port
+        now = time.time
+        self.running = True
+        while self.running:
+            try:
+                wire_len, addr = sock.recvfrom_into(buf, size, flags)
+            except socket.timeout:
+                continue
+            if loopback and addr[2] == PACKET_OUTGOING:
+                continue  # Loopback frames are seen once leaving and once arriving
+            parsed = parse_ethernet(view, min(wire_len, len(buf)) if self.payload else min(wire_len, size), port)
+            if parsed is None:
+                continue
+            self.captured += 1
+            if not self.payload:
+                parsed = parsed[:6] + (b'',)
+            handler(now(), wire_len, *parsed)
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        """ Packets handled, and packets the kernel dropped because the socket buffer was full """
+        if self.sock is not None:
+            try:
+                _, drops = struct.unpack('II', self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+                self.kernel_drops += drops  # The kernel resets its counters on every read
+            except OSError:
+                pass
+        return {'captured': self.captured, 'kernel_drops': self.kernel_drops}
+
+# ================= SCAPY =================
+class ScapyCapture:
+    """ scapy sniff(); builds a full packet object per frame """
+    name = 'scapy'
+
+    def __init__(self, iface, port):
+        self.iface = iface
+        self.port = port
+        self.running = False
+        self.captured = 0
+
+    def adapter(self, handler):
+        from scapy.all import IP, IPv6, TCP
+
+        def on_packet(packet):
+            if TCP not in packet:
+                return
+            ip = packet[IP] if IP in packet else packet[IPv6] if IPv6 in packet else None
+            if ip is None:
+                return
+            tcp = packet[TCP]
+            self.captured += 1
+            handler(float(packet.time), len(packet), ip.src, tcp.sport, ip.dst, tcp.dport,
+                    tcp.seq, int(tcp.flags), bytes(tcp.payload))
+        return on_packet
+
+    def run(self, handler):
+        from scapy.all import sniff
+        self.running = True
+        # store=0 prevents storing packets in RAM (memory leak prevention)
+        sniff(iface=self.iface, filter=f"tcp and port {self.port}", prn=self.adapter(handler),
+              store=0, stop_filter=lambda _: not self.running)
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        return {'captured': self.captured}
+
+# ================= PCAP REPLAY =================
+class PcapCapture:
+    """
+    Replays a classic pcap file (not pcapng), read into memory: as fast as possible by default,
+    with the recorded timestamps; with pace=True at the recorded pace, with
+    timestamps shifted to the current time so live rate windows make sense.
+    """
+    name = 'pcap'
+
+    def __init__(self, path, port, pace=False, loops=1):
+        self.path = path
+        self.port = port
+        self.pace = pace
+        self.loops = loops
+        self.running = False
+        self.captured = 0
+        self.skipped = 0
+
+    def run(self, handler):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        view = memoryview(data)
+        magic = data[:4]
+        if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+            endian = '<'
+        elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+            endian = '>'
+        else:
+            raise ValueError(f"{self.path}: not a pcap file (pcapng is not supported)")
+        frac = 1e-9 if magic in (b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d') else 1e-6
+        linktype = struct.unpack_from(endian + 'I', data, 20)[0] & 0xFFFF
+        parse = LINK_TYPES.get(linktype)
+        if parse is None:
+            raise ValueError(f"{self.path}: unsupported link type {linktype}")
+
+        record = struct.Struct(endian + 'IIII')
+        port = self.port
+        self.running = True
+        for _ in range(self.loops):
+            pos = 24
+            offset = None
+            while self.running and pos + 16 <= len(data):
+                ts_sec, ts_frac, caplen, wire_len = record.unpack_from(data, pos)
+                pos += 16
+                frame = view[pos:pos + caplen]
+                pos += caplen
+                timestamp = ts_sec + ts_frac * frac
+                if self.pace:
+                    if offset is None:
+                        offset = time.time() - timestamp
+                    wait = timestamp + offset - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                    timestamp += offset
+
+                parsed = parse(frame, caplen, port)
+                if parsed is None:
+                    self.skipped += 1
+                    continue
+                if caplen < wire_len:
+                    parsed = parsed[:6] + (b'',)  # Payload cut by the snaplen: useless for MQTT parsing
+                self.captured += 1
+                handler(timestamp, wire_len, *parsed)
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        return {'captured': self.captured, 'skipped': self.skipped}
+
+def open_capture(backend, iface=None, port=1883, pcap=None, payload=True, pace=False):
+    if backend == 'raw':
+        return RawSocketCapture(iface, port, payload=payload)
+    if backend == 'scapy':
+        return ScapyCapture(iface, port)
+    if backend == 'pcap':
+        return PcapCapture(pcap, port, pace=pace)
+    raise ValueError(f"Unknown capture backend {backend!r}")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import cv2
+import numpy as np
+
+# libjpeg can decode straight to 1/2, 1/4 and 1/8 scale, skipping most of the IDCT work
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# SOFn markers carry the frame size (DHT, JPG and DAC share the range but do not)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def jpeg_size(data):
+    """ Reads (width, height) from the JPEG SOF header without decoding; None if not found """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # no length field
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):  # end of image / start of scan before any SOF
+            return None
+        length = (data[i + 2] << 8) | data[i + 3]
+        if marker in SOF_MARKERS and i + 9 <= n:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+def reduction_factor(src_w, src_h, input_w, input_h, letterbox=True):
+    """
+    Largest of 1/2/4/8 that still leaves the decoded frame at least as large as
+    what the preprocessor would scale it to, so detection sees the same detail.
+    """
+    if letterbox:
+        limit = max(src_w / input_w, src_h / input_h)
+    else:
+        limit = min(src_w / input_w, src_h / input_h)
+    factor = 1
+    for f in (2, 4, 8):
+        if f <= limit:
+            factor = f
+    return factor
+
+class FullResolution:
+    """ Decodes the full-resolution frame on first use only (for recognition crops) """
+    def __init__(self, data):
+        self.data = data
+        self.image = None
+
+    def __call__(self):
+        if self.image is None:
+            self.image = cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+        return self.image
+
+def decode_for_detection(data, input_w, input_h, letterbox=True):
+    """
+    Decodes a JPEG at the smallest scale the detector can use.
+    Returns (image, full): full is None when the image is already full
+    resolution, otherwise a FullResolution to decode it on demand.
+    """
+    np_arr = np.frombuffer(data, np.uint8)
+    size = jpeg_size(data)
+    factor = reduction_factor(size[0], size[1], input_w, input_h, letterbox) if size else 1
+    img = cv2.imdecode(np_arr, REDUCED_FLAGS[factor])
+    if factor == 1:
+        return img, None
+    if img is None:
+        return cv2.imdecode(np_arr, cv2.IMREAD_COLOR), None
+    return img, FullResolution(data)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+
+import numpy as np
+
+ENCODING_DIM = 128  # dlib face descriptor size
+
+# ================= ON-DISK ENCODING CACHE =================
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class EncodingCache:
+    """
+    Remembers the face encoding of each enrolled image, keyed by file name,
+    content hash and mtime, so only new or changed images go through dlib.
+
+    An unchanged mtime is trusted without re-reading the file; a changed mtime
+    falls back to the content hash (e.g. a `touch` or a copy with the same bytes
+    does not cost a re-encode). Images without a detectable face are cached too,
+    as an encoding of None.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}  # filename -> (sha1, mtime, encoding or None)
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            data = np.load(self.path, allow_pickle=False)
+            for name, sha1, mtime, has_face, enc in zip(data['files'], data['sha1'], data['mtime'],
+                                                        data['has_face'], data['encodings']):
+                self.entries[str(name)] = (str(sha1), float(mtime), enc.copy() if has_face else None)
+        except Exception as e:
+            print(f"  Ignoring unreadable encoding cache {self.path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        files = sorted(self.entries)
+        encodings = np.zeros((len(files), ENCODING_DIM), dtype=np.float64)
+        has_face = np.zeros(len(files), dtype=bool)
+        for i, name in enumerate(files):
+            enc = self.entries[name][2]
+            if enc is not None:
+                encodings[i] = enc
+                has_face[i] = True
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     files=np.asarray(files, dtype=str),
+                     sha1=np.asarray([self.entries[n][0] for n in files], dtype=str),
+                     mtime=np.asarray([self.entries[n][1] for n in files], dtype=np.float64),
+                     has_face=has_face,
+                     encodings=encodings)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def lookup(self, filename, path):
+        """ Returns (hit, encoding, sha1). On a miss the caller encodes and calls store() """
+        mtime = os.path.getmtime(path)
+        cached = self.entries.get(filename)
+        if cached and cached[1] == mtime:
+            return True, cached[2], cached[0]
+
+        sha1 = file_sha1(path)
+        if cached and cached[0] == sha1:
+            self.entries[filename] = (sha1, mtime, cached[2])
+            self.dirty = True
+            return True, cached[2], sha1
+        return False, None, sha1
+
+    def store(self, filename, path, sha1, encoding):
+        self.entries[filename] = (sha1, os.path.getmtime(path), encoding)
+        self.dirty = True
+
+    def prune(self, keep_filenames):
+        """ Drops entries for images that are no longer in the directory """
+        for name in list(self.entries):
+            if name not in keep_filenames:
+                del self.entries[name]
+                self.dirty = True
+
+# ================= MATRIX-BACKED INDEX =================
+class FaceIndex:
+    """
+    Known encodings in one contiguous (N, 128) matrix, with a vectorised
+    top-k euclidean distance lookup for several query faces at once.
+    """
+    def __init__(self, names=(), encodings=None):
+        self.names = list(names)
+        if encodings is None or len(self.names) == 0:
+            self.matrix = np.empty((0, ENCODING_DIM), dtype=np.float64)
+        else:
+            self.matrix = np.ascontiguousarray(np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM))
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    def __len__(self):
+        return len(self.names)
+
+    def distances(self, queries):
+        """ (Q, 128) queries -> (Q, N) euclidean distances, via one matrix product """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, ENCODING_DIM)
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        d2 = q_sq[:, None] + self.sq_norms[None, :] - 2.0 * (queries @ self.matrix.T)
+        np.maximum(d2, 0.0, out=d2)
+        return np.sqrt(d2, out=d2)
+
+    def top_k(self, queries, k=1):
+        """
+        Returns (indices, distances), both (Q, k'), with k' = min(k, N), sorted
+        by increasing distance for every query.
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, ENCODING_DIM)
+        k = min(k, len(self.names))
+        if k == 0 or len(queries) == 0:
+            return np.empty((len(queries), 0), np.int64), np.empty((len(queries), 0), np.float64)
+
+        dist = self.distances(queries)
+        if k < dist.shape[1]:
+            idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(dist.shape[1]), dist.shape).copy()
+        part = np.take_along_axis(dist, idx, axis=1)
+        order = np.argsort(part, axis=1)
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+    def match(self, queries, threshold, unknown="Unknown"):
+        """ Best name per query, or `unknown` when no known face is closer than threshold """
+        idx, dist = self.top_k(queries, k=1)
+        if idx.shape[1] == 0:
+            return [unknown] * len(idx), [float('inf')] * len(idx)
+        names = [self.names[i] if d < threshold else unknown for i, d in zip(idx[:, 0], dist[:, 0])]
+        return names, dist[:, 0].tolist()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Compact append-only log of raw MQTT frames with a fixed-size index.
+
+<name>        "FLOG1\\n", then records: <d receive time><I payload len><H topic len> topic payload
+<name>.idx    "FIDX1\\n", then one <Q offset><d receive time> entry per record
+
+The index makes len() and random access O(1) and can always be rebuilt from
+the data file (e.g. after the recorder was killed mid-write).
+"""
+
+import os
+import struct
+
+DATA_MAGIC = b'FLOG1\n'
+INDEX_MAGIC = b'FIDX1\n'
+RECORD = struct.Struct('<dIH')
+INDEX_ENTRY = struct.Struct('<Qd')
+
+# ================= WRITER =================
+class FrameLogWriter:
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx'
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            # Re-index first so appends continue after the last complete record
+            FrameLogReader(path, repair=True).close()
+        self.data = open(path, 'ab')
+        self.index = open(self.index_path, 'ab')
+        if new:
+            self.data.write(DATA_MAGIC)
+        if self.index.tell() == 0:
+            self.index.write(INDEX_MAGIC)
+        self.count = 0
+
+    def append(self, timestamp, topic, payload):
+        topic_bytes = topic.encode('utf-8')
+        offset = self.data.tell()
+        self.data.write(RECORD.pack(timestamp, len(payload), len(topic_bytes)))
+        self.data.write(topic_bytes)
+        self.data.write(payload)
+        self.index.write(INDEX_ENTRY.pack(offset, timestamp))
+        self.count += 1
+
+    def flush(self):
+        self.data.flush()
+        self.index.flush()
+
+    def close(self):
+        self.flush()
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ================= READER =================
+class FrameLogReader:
+    """
+    Reads a frame log. Entries missing from the index are recovered by scanning
+    the data file. Only repair=True (used by the writer) rewrites the index and
+    drops a trailing partial record; plain readers never modify the files, so
+    a log can be replayed while it is still being recorded.
+    """
+    def __init__(self, path, repair=False):
+        self.path = path
+        self.repair = repair
+        self.index_path = path + '.idx'
+        self.data = open(path, 'rb')
+        if self.data.read(len(DATA_MAGIC)) != DATA_MAGIC:
+            raise ValueError(f"{path} is not a frame log")
+        self.size = os.path.getsize(path)
+        self.entries = self._load_index()
+
+    def _load_index(self):
+        entries = []
+        try:
+            with open(self.index_path, 'rb') as f:
+                if f.read(len(INDEX_MAGIC)) == INDEX_MAGIC:
+                    raw = f.read()
+                    usable = len(raw) - len(raw) % INDEX_ENTRY.size
+                    entries = list(INDEX_ENTRY.iter_unpack(raw[:usable]))
+        except FileNotFoundError:
+            pass
+
+        # Drop entries that point past the data actually written, then index
+        # whatever complete records follow the last good one
+        valid = []
+        for offset, ts in entries:
+            if not self._complete(offset):
+                break
+            valid.append((offset, ts))
+        start = self._next_offset(valid[-1][0]) if valid else len(DATA_MAGIC)
+        rebuilt = self._scan(start)
+        valid.extend(rebuilt)
+        if self.repair and (rebuilt or len(valid) != len(entries) or not self._ends_at(valid)):
+            self._write_index(valid)
+        return valid
+
+    def _ends_at(self, entries):
+        end = self._next_offset(entries[-1][0]) if entries else len(DATA_MAGIC)
+        return end == self.size
+
+    def _header(self, offset):
+        self.data.seek(offset)
+        raw = self.data.read(RECORD.size)
+        return RECORD.unpack(raw) if len(raw) == RECORD.size else None
+
+    def _next_offset(self, offset):
+        _, payload_len, topic_len = self._header(offset)
+        return offset + RECORD.size + topic_len + payload_len
+
+    def _complete(self, offset):
+        header = self._header(offset)
+        return header is not None and offset + RECORD.size + header[2] + header[1] <= self.size
+
+    def _scan(self, offset):
+        found = []
+        while self._complete(offset):
+            ts = self._header(offset)[0]
+            found.append((offset, ts))
+            offset = self._next_offset(offset)
+        return found
+
+    def _write_index(self, entries):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            for entry in entries:
+                f.write(INDEX_ENTRY.pack(*entry))
+        os.replace(tmp, self.index_path)
+        # Make the writer's appends land after the last complete record
+        with open(self.path, 'r+b') as f:
+            end = self._next_offset(entries[-1][0]) if entries else len(DATA_MAGIC)
+            if end < self.size:
+                f.truncate(end)
+                self.size = end
+
+    def __len__(self):
+        return len(self.entries)
+
+    def timestamp(self, i):
+        return self.entries[i][1]
+
+    def read(self, i):
+        """ Returns (timestamp, topic, payload) of record i """
+        offset, _ = self.entries[i]
+        ts, payload_len, topic_len = self._header(offset)
+        topic = self.data.read(topic_len).decode('utf-8')
+        payload = self.data.read(payload_len)
+        return ts, topic, payload
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield self.read(i)
+
+    def close(self):
+        self.data.close()
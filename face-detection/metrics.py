@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import bisect
+import math
+import threading
+import time
+
+# Seconds; covers sub-millisecond NMS up to multi-second stalls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in items)
+    return '{' + body + '}'
+
+def _format_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(v) if isinstance(v, float) else str(v)
+
+# ================= METRIC TYPES =================
+class Histogram:
+    """ Fixed-bucket histogram: O(log buckets) per observation, no stored samples """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value, n=1):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += n
+            self.sum += value * n
+            self.count += n
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """ Estimate by linear interpolation inside the bucket holding the q-th observation """
+        counts, _, total = self.snapshot()
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def samples(self, name, labels):
+        counts, total_sum, total = self.snapshot()
+        cumulative = 0
+        for bound, c in zip(self.buckets + (float('inf'),), counts):
+            cumulative += c
+            yield f"{name}_bucket{_format_labels(labels, {'le': _format_value(float(bound))})} {cumulative}"
+        yield f"{name}_sum{_format_labels(labels)} {_format_value(total_sum)}"
+        yield f"{name}_count{_format_labels(labels)} {total}"
+
+    def summary(self):
+        _, total_sum, total = self.snapshot()
+        return {
+            'count': total,
+            'mean_ms': round(total_sum / total * 1000, 3) if total else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p95_ms': round(self.quantile(0.95) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+        }
+
+class QuantileSketch:
+    """
+    Streaming quantiles with bounded memory and relative error (DDSketch):
+    values fall into logarithmic bins of ratio gamma, so any quantile of the
+    values seen is returned within `relative_accuracy` of a true sample.
+    When more than max_bins are needed the lowest bins are merged, which only
+    costs accuracy at the low end. Zero is counted on its own; negatives are
+    not supported.
+    """
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+            return
+        i = math.ceil(math.log(value) / self.log_gamma)
+        bins = self.bins
+        bins[i] = bins.get(i, 0) + 1
+        if len(bins) > self.max_bins:
+            low = sorted(bins)[:2]
+            bins[low[1]] += bins.pop(low[0])
+
+    def merge(self, other):
+        for i, c in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + c
+        while len(self.bins) > self.max_bins:
+            low = sorted(self.bins)[:2]
+            self.bins[low[1]] += self.bins.pop(low[0])
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                value = 2 * self.gamma ** i / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+class SlidingQuantiles:
+    """
+    Quantiles over roughly the last `window` seconds: a ring of `slices`
+    sketches, each covering window/slices seconds, merged when read. Count
+    and sum are cumulative, as Prometheus summaries expect.
+    """
+    def __init__(self, window=60.0, slices=6, relative_accuracy=0.01, max_bins=2048,
+                 quantiles=SUMMARY_QUANTILES):
+        self.slice_seconds = window / slices
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.quantiles = quantiles
+        self.ring = [QuantileSketch(relative_accuracy, max_bins) for _ in range(slices)]
+        self.epochs = [-1] * slices
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value, now=None):
+        epoch = int((time.monotonic() if now is None else now) / self.slice_seconds)
+        slot = epoch % len(self.ring)
+        with self.lock:
+            if self.epochs[slot] != epoch:
+                self.ring[slot] = QuantileSketch(self.relative_accuracy, self.max_bins)
+                self.epochs[slot] = epoch
+            self.ring[slot].observe(value)
+            self.count += 1
+            self.sum += value
+
+    def observe_many(self, values, now=None):
+        """ observe() for a batch of values seen at about the same time, taking the lock once """
+        if not values:
+            return
+        epoch = int((time.monotonic() if now is None else now) / self.slice_seconds)
+        slot = epoch % len(self.ring)
+        with self.lock:
+            if self.epochs[slot] != epoch:
+                self.ring[slot] = QuantileSketch(self.relative_accuracy, self.max_bins)
+                self.epochs[slot] = epoch
+            sketch = self.ring[slot]
+            for value in values:
+                sketch.observe(value)
+            self.count += len(values)
+            self.sum += sum(values)
+
+    def sketch(self, now=None):
+        """ The merged sketch of the slices still inside the window """
+        epoch = int((time.monotonic() if now is None else now) / self.slice_seconds)
+        merged = QuantileSketch(self.relative_accuracy, self.max_bins)
+        with self.lock:
+            for slot, sketch in enumerate(self.ring):
+                if 0 <= epoch - self.epochs[slot] < len(self.ring):
+                    merged.merge(sketch)
+        return merged
+
+    def samples(self, name, labels):
+        sketch = self.sketch()
+        for q in self.quantiles:
+            yield f"{name}{_format_labels(labels, {'quantile': _format_value(q)})} {_format_value(sketch.quantile(q))}"
+        with self.lock:
+            total_sum, total = self.sum, self.count
+        yield f"{name}_sum{_format_labels(labels)} {_format_value(total_sum)}"
+        yield f"{name}_count{_format_labels(labels)} {total}"
+
+    def summary(self):
+        sketch = self.sketch()
+        out = {'count': sketch.count, 'min': sketch.min if sketch.count else 0.0, 'max': sketch.max}
+        for q in self.quantiles:
+            out[f"p{q * 100:g}"] = sketch.quantile(q)
+        return out
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def samples(self, name, labels):
+        yield f"{name}{_format_labels(labels)} {_format_value(self.value)}"
+
+    def summary(self):
+        return self.value
+
+# ================= REGISTRY =================
+class Registry:
+    """
+    Holds metrics by (name, labels) and renders them in the Prometheus text
+    format. Collectors are callables run at scrape time that return extra
+    (name, type, help, labels, value) samples, for counters that already live
+    elsewhere (scheduler, tracker, ...).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}     # name -> (type, help, {labels tuple: metric})
+        self.collectors = []
+
+    def _get(self, kind, factory, name, help, labels):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            family = self.metrics.setdefault(name, (kind, help, {}))
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def histogram(self, name, help, labels=None, buckets=LATENCY_BUCKETS):
+        return self._get('histogram', lambda: Histogram(buckets), name, help, labels)
+
+    def counter(self, name, help, labels=None):
+        return self._get('counter', Counter, name, help, labels)
+
+    def quantiles(self, name, help, labels=None, window=60.0, relative_accuracy=0.01):
+        return self._get('summary', lambda: SlidingQuantiles(window, relative_accuracy=relative_accuracy),
+                         name, help, labels)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            families = [(name, kind, help, list(members.items())) for name, (kind, help, members) in self.metrics.items()]
+        for name, kind, help, members in sorted(families):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in sorted(members, key=lambda m: m[0]):
+                lines.extend(metric.samples(name, dict(key)))
+
+        # Samples of one family must be contiguous, whichever collector produced them
+        collected = {}
+        for collector in self.collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+                continue
+            for name, kind, help, labels, value in samples:
+                family = collected.setdefault(name, (kind, help, []))
+                family[2].append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, (kind, help, samples) in collected.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """ Compact JSON-friendly view (percentiles instead of buckets), for the MQTT stats topic """
+        out = {}
+        with self.lock:
+            families = [(name, list(members.items())) for name, (_, _, members) in self.metrics.items()]
+        for name, members in families:
+            for key, metric in members:
+                label = ','.join(str(v) for _, v in key)
+                out[f"{name}[{label}]" if label else name] = metric.summary()
+        return out
+
+REGISTRY = Registry()
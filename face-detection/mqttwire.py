@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import threading
+
+# ================= MQTT FIXED HEADER =================
+PACKET_TYPES = {
+    1: 'CONNECT', 2: 'CONNACK', 3: 'PUBLISH', 4: 'PUBACK', 5: 'PUBREC',
+    6: 'PUBREL', 7: 'PUBCOMP', 8: 'SUBSCRIBE', 9: 'SUBACK', 10: 'UNSUBSCRIBE',
+    11: 'UNSUBACK', 12: 'PINGREQ', 13: 'PINGRESP', 14: 'DISCONNECT', 15: 'AUTH',
+}
+
+SEQ_MASK = 0xFFFFFFFF
+
+class MqttStreamParser:
+    """
+    Splits one direction of a TCP stream into MQTT packets using only the
+    fixed header (type nibble + remaining-length varint). Packet bodies are
+    skipped, not buffered, so state is a byte counter plus at most 5 header
+    bytes: a segment may carry several packets, and a packet (or even its
+    header) may be split across segments.
+
+    feed() takes each segment with its TCP sequence number. Retransmitted
+    bytes are dropped; after a gap (lost or unseen segment) packet boundaries
+    are unknown, so the parser resyncs by assuming the next segment starts a
+    packet, which is how MQTT clients normally write.
+    """
+    __slots__ = ('next_seq', 'skip', 'header', 'last_seen', 'resyncs')
+
+    def __init__(self):
+        self.next_seq = None
+        self.skip = 0
+        self.header = bytearray()
+        self.last_seen = 0.0
+        self.resyncs = 0
+
+    def reset(self):
+        self.skip = 0
+        self.header.clear()
+
+    def feed(self, seq, data):
+        """ Returns [(packet_type, packet_length)] for every header completed by this segment """
+        if self.next_seq is not None:
+            ahead = (seq - self.next_seq) & SEQ_MASK
+            if ahead >= 0x80000000:
+                # Starts before what we have seen: retransmission, keep only new bytes
+                overlap = (self.next_seq - seq) & SEQ_MASK
+                if overlap >= len(data):
+                    return []
+                data = data[overlap:]
+                seq = self.next_seq
+            elif ahead:
+                self.resyncs += 1
+                self.reset()
+        self.next_seq = (seq + len(data)) & SEQ_MASK
+
+        packets = []
+        header = self.header
+        i, n = 0, len(data)
+        while i < n:
+            if self.skip:
+                step = min(self.skip, n - i)
+                self.skip -= step
+                i += step
+                continue
+
+            b = data[i]
+            i += 1
+            header.append(b)
+            if len(header) == 1:
+                if b >> 4 == 0:  # Reserved type: not an MQTT boundary
+                    self.resyncs += 1
+                    self.reset()
+                    return packets
+                continue
+            if b & 0x80:
+                if len(header) == 5:  # Varint longer than 4 bytes: malformed
+                    self.resyncs += 1
+                    self.reset()
+                    return packets
+                continue
+
+            remaining = 0
+            for shift, digit in enumerate(header[1:]):
+                remaining |= (digit & 0x7F) << (7 * shift)
+            packets.append((header[0] >> 4, len(header) + remaining))
+            self.skip = remaining
+            header.clear()
+        return packets
+
+# ================= ACCOUNTING =================
+class ClientStats:
+    """ Cumulative counters for one client connection plus a smoothed recent rate """
+    __slots__ = ('bytes_in', 'bytes_out', 'packets_in', 'packets_out', 'types',
+                 'last_seen', 'prev_bytes', 'prev_packets', 'bps', 'pps')
+
+    def __init__(self):
+        self.bytes_in = self.bytes_out = 0      # MQTT bytes to / from the broker
+        self.packets_in = self.packets_out = 0
+        self.types = [0] * 16                   # Packet count per MQTT type, both directions
+        self.last_seen = 0.0
+        self.prev_bytes = self.prev_packets = 0
+        self.bps = self.pps = 0.0
+
+class MqttAccounting:
+    """
+    Per-flow MQTT parsing and aggregate counters keyed by client (ip, port)
+    and packet type. The client is whichever end is not on broker_port.
+
+    packet() is called from the capture thread only; stats() from the stats
+    thread. The lock only covers adding and removing clients and flows, so the
+    per-packet path does not contend with the reader.
+    """
+    def __init__(self, broker_port, counter_factory, top_n=5, smoothing=0.3, idle_timeout=300):
+        self.broker_port = broker_port
+        self.counter_factory = counter_factory  # () -> RateCounter, one per packet type
+        self.top_n = top_n
+        self.smoothing = smoothing              # EWMA weight of the latest interval
+        self.idle_timeout = idle_timeout
+        self.flows = {}                         # (src, sport, dst, dport) -> MqttStreamParser
+        self.clients = {}                       # (ip, port) -> ClientStats
+        self.type_rates = {}                    # packet type -> RateCounter
+        self.lock = threading.Lock()
+        self.last_stats = None
+        self.resyncs = 0
+
+    def packet(self, timestamp, src, sport, dst, dport, seq, flags, payload):
+        """ One captured TCP segment; flags uses scapy/TCP bit values (FIN=0x01, SYN=0x02, RST=0x04) """
+        key = (src, sport, dst, dport)
+        flow = self.flows.get(key)
+        if flags & 0x02:
+            # SYN: a new stream starts after this sequence number
+            flow = MqttStreamParser()
+            flow.next_seq = (seq + 1) & SEQ_MASK
+            flow.last_seen = timestamp  # Or expire() drops it before its first data segment
+            with self.lock:
+                self.flows[key] = flow
+            return
+        if flags & 0x05:
+            # FIN/RST: count what it carries, then forget the flow
+            if flow is not None:
+                self.account(timestamp, key, flow.feed(seq, payload) if payload else [])
+                with self.lock:
+                    self.resyncs += flow.resyncs
+                    self.flows.pop(key, None)
+            return
+        if not payload:
+            return
+        if flow is None:
+            # Stream already running when capture started: assume a packet boundary
+            flow = MqttStreamParser()
+            with self.lock:
+                self.flows[key] = flow
+        flow.last_seen = timestamp
+        self.account(timestamp, key, flow.feed(seq, payload))
+
+    def account(self, timestamp, key, packets):
+        if not packets:
+            return
+        src, sport, dst, dport = key
+        to_broker = dport == self.broker_port
+        client_key = (src, sport) if to_broker else (dst, dport)
+        client = self.clients.get(client_key)
+        if client is None:
+            client = ClientStats()
+            with self.lock:
+                self.clients[client_key] = client
+        client.last_seen = timestamp
+
+        for ptype, length in packets:
+            client.types[ptype] += 1
+            if to_broker:
+                client.bytes_in += length
+                client.packets_in += 1
+            else:
+                client.bytes_out += length
+                client.packets_out += 1
+            counter = self.type_rates.get(ptype)
+            if counter is None:
+                counter = self.type_rates[ptype] = self.counter_factory()
+            counter.record(timestamp, length)
+
+    def expire(self, current_time):
+        with self.lock:
+            for key in [k for k, f in self.flows.items() if current_time - f.last_seen > self.idle_timeout]:
+                self.resyncs += self.flows.pop(key).resyncs
+            for key in [k for k, c in self.clients.items() if current_time - c.last_seen > self.idle_timeout]:
+                del self.clients[key]
+
+    def stats(self, current_time):
+        """
+        Per-type rates for every window and the top-N clients by smoothed
+        MQTT bytes/s. Call once per stats interval: each call updates the
+        smoothed client rates from the counters' change since the last one.
+        """
+        self.expire(current_time)
+        interval = current_time - self.last_stats if self.last_stats else 0.0
+        self.last_stats = current_time
+
+        with self.lock:
+            clients = list(self.clients.items())
+            type_rates = list(self.type_rates.items())
+            resyncs = self.resyncs + sum(f.resyncs for f in self.flows.values())
+            flows = len(self.flows)
+
+        for _, c in clients:
+            total_bytes = c.bytes_in + c.bytes_out
+            total_packets = c.packets_in + c.packets_out
+            if interval > 0:
+                bps = (total_bytes - c.prev_bytes) * 8 / interval
+                pps = (total_packets - c.prev_packets) / interval
+                c.bps += self.smoothing * (bps - c.bps)
+                c.pps += self.smoothing * (pps - c.pps)
+            c.prev_bytes, c.prev_packets = total_bytes, total_packets
+
+        types = {}
+        for ptype, counter in sorted(type_rates):
+            name = PACKET_TYPES.get(ptype, str(ptype))
+            types[name] = {}
+            for window, (bps, pps) in counter.rates(current_time).items():
+                types[name][f'bps_{window}s'] = bps
+                types[name][f'pps_{window}s'] = pps
+
+        top = sorted(clients, key=lambda item: item[1].bps, reverse=True)[:self.top_n]
+        talkers = []
+        for (ip, port), c in top:
+            talkers.append({
+                'client': f'{ip}:{port}',
+                'bps': int(c.bps),
+                'pps': round(c.pps, 2),
+                'bytes_in': c.bytes_in,
+                'bytes_out': c.bytes_out,
+                'packets': {PACKET_TYPES[t]: n for t, n in enumerate(c.types) if n and t in PACKET_TYPES},
+            })
+
+        return {
+            'types': types,
+            'top_talkers': talkers,
+            'clients': len(clients),
+            'flows': flows,
+            'resyncs': resyncs,
+        }
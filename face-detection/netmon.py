@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 
+import argparse
+import math
 import time
 import threading
 import paho.mqtt.client as mqtt
-from scapy.all import sniff, TCP, IP
-from collections import deque
 import json
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from capture import open_capture
+from metrics import REGISTRY
+from mqttwire import MqttAccounting
+from ratecounter import PeakRate, RateCounter
 
 # ================= CONFIGURATION =================
 MONITOR_INTERFACE = "eth0"  # Change to your interface (e.g., 'wlan0', 'lo')
 FILTER_PORT = 1883
+CAPTURE_BACKEND = "raw"  # 'raw' (AF_PACKET, fast), 'scapy' (portable) or 'pcap' (replay a file)
 
 # MQTT Settings (Where to publish the stats)
 MQTT_BROKER = ""
@@ -18,10 +26,43 @@ MQTT_USER = ""
 MQTT_PASS = ""
 TOPIC_STATS = "monitor/traffic/1883"
 
+# Rate windows (seconds) published as bps_<w>s / pps_<w>s
+WINDOWS = [5, 15, 60]
+EXTRA_WINDOWS = []  # e.g. [1, 300]
+BUCKET_SECONDS = 1.0  # Counter resolution; use e.g. 0.25 for sub-second windows (windows must be multiples of it)
+
+# MQTT protocol accounting (per client and per packet type)
+MQTT_ACCOUNTING = True
+TOP_TALKERS = 5
+CLIENT_IDLE_TIMEOUT = 300  # Forget clients/flows silent for this many seconds
+
+# Distributions and microbursts
+SKETCH_WINDOW = 60        # Seconds of history behind the size / inter-arrival percentiles
+SKETCH_ACCURACY = 0.01    # Relative error of the percentiles
+PEAK_RESOLUTION = 0.01    # Peak rates are measured over 10 ms intervals
+
+# Prometheus endpoint (http://METRICS_HOST:METRICS_PORT/metrics); 0 disables it
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
 # ================= GLOBAL STATE =================
-# Stores tuples of (timestamp, byte_count)
-packet_history = deque()
-history_lock = threading.Lock()
+traffic = RateCounter(WINDOWS + EXTRA_WINDOWS, BUCKET_SECONDS)
+capture = None
+latest_stats = {}
+peak = PeakRate(PEAK_RESOLUTION)
+peak_history = deque(maxlen=math.ceil(max(WINDOWS + EXTRA_WINDOWS)))  # Per-second (bps, pps) peaks
+last_arrival = None
+# Sizes and inter-arrival gaps gathered by the capture thread (plain list appends,
+# no lock) and moved into the sketches once per stats tick
+size_batch = []
+gap_batch = []
+
+packet_size = REGISTRY.quantiles('netmon_packet_size_bytes', 'Captured packet sizes on the wire',
+                                 window=SKETCH_WINDOW, relative_accuracy=SKETCH_ACCURACY)
+interarrival = REGISTRY.quantiles('netmon_interarrival_seconds', 'Time between consecutive captured packets',
+                                  window=SKETCH_WINDOW, relative_accuracy=SKETCH_ACCURACY)
+mqtt_traffic = MqttAccounting(FILTER_PORT, lambda: RateCounter(WINDOWS + EXTRA_WINDOWS, BUCKET_SECONDS),
+                              top_n=TOP_TALKERS, idle_timeout=CLIENT_IDLE_TIMEOUT)
 
 # ================= MQTT SETUP =================
 client = mqtt.Client()
@@ -36,75 +77,154 @@ def connect_mqtt():
         print(f"MQTT Connection Error: {e}")
 
 # ================= PACKET SNIFFER =================
-def process_packet(packet):
-    """ Callback for every packet captured on port 1883 """
-    # Get packet length (Wire length is best, otherwise IP len)
-    pkt_len = len(packet)
-    
-    current_time = time.time()
-    
-    with history_lock:
-        packet_history.append((current_time, pkt_len))
-
-def start_sniffer():
-    print(f"Starting capture on {MONITOR_INTERFACE} port {FILTER_PORT}...")
-    # Filter for TCP traffic on port 1883
-    bpf_filter = f"tcp and port {FILTER_PORT}"
-    
-    # store=0 prevents storing packets in RAM (memory leak prevention)
-    sniff(iface=MONITOR_INTERFACE, filter=bpf_filter, prn=process_packet, store=0)
+def process_packet(timestamp, pkt_len, src, sport, dst, dport, seq, flags, payload):
+    """ Callback for every TCP segment captured on port 1883 (see capture.py) """
+    global last_arrival
+    traffic.record(timestamp, pkt_len)
+    peak.record(timestamp, pkt_len)
+    size_batch.append(pkt_len)
+    if last_arrival is not None:
+        gap_batch.append(max(0.0, timestamp - last_arrival))
+    last_arrival = timestamp
+
+    if MQTT_ACCOUNTING:
+        mqtt_traffic.packet(timestamp, src, sport, dst, dport, seq, flags, payload)
+
+def start_sniffer(backend=CAPTURE_BACKEND, iface=MONITOR_INTERFACE, pcap=None):
+    global capture
+    source = pcap if backend == 'pcap' else iface
+    print(f"Starting {backend} capture on {source} port {FILTER_PORT}...")
+    # pcap files are replayed at the recorded pace so the live rate windows are meaningful
+    capture = open_capture(backend, iface=iface, port=FILTER_PORT, pcap=pcap,
+                           payload=MQTT_ACCOUNTING, pace=True)
+    capture.run(process_packet)
 
 # ================= CALCULATOR LOOP =================
-def calculate_rate(window_seconds, current_time):
-    """ Calculates BPS over the last X seconds """
-    total_bytes = 0
-    cutoff_time = current_time - window_seconds
-    
-    # Iterate through history
-    # Note: In a high-traffic production env, this iteration might be slow.
-    # For MQTT traffic, a deque is usually sufficient.
-    for ts, size in reversed(packet_history):
-        if ts < cutoff_time:
-            break
-        total_bytes += size
-        
-    # Bits per second = (Bytes * 8) / Time Window
-    bps = (total_bytes * 8) / window_seconds
-    return int(bps)
+def peak_span(window):
+    """ Whole seconds of peak history behind a window; peaks are published under this span """
+    return max(1, math.ceil(window))
 
 def stats_loop():
+    global latest_stats, size_batch, gap_batch
     while True:
         time.sleep(1) # Calculate every second
         current_time = time.time()
-        
-        # 1. Clean up old history (older than 60s)
-        with history_lock:
-            while len(packet_history) > 0 and packet_history[0][0] < (current_time - 65):
-                packet_history.popleft()
-            
-            # Copy to avoid locking during calculation
-            # (Optional optimization, but safe for simple scripts to just calculate inside lock)
-            
-            # 2. Calculate Rates
-            bps_5s = calculate_rate(5, current_time)
-            bps_15s = calculate_rate(15, current_time)
-            bps_60s = calculate_rate(60, current_time)
-
-        # 3. Publish
-        data = {
-                'bps_5s' : bps_5s,
-                'bps_15s' : bps_15s,
-                'bps_60s' : bps_60s
-        }
+
+        # Swap the batches out; an append racing with the swap can at worst be missed
+        sizes, size_batch = size_batch, []
+        gaps, gap_batch = gap_batch, []
+        packet_size.observe_many(sizes)
+        interarrival.observe_many(gaps)
+
+        # 1. Calculate Rates (all windows in one pass over the buckets)
+        rates = traffic.rates(current_time)
+
+        # 2. Publish
+        data = {}
+        for window, (bps, pps) in rates.items():
+            data[f'bps_{window}s'] = bps
+        for window, (bps, pps) in rates.items():
+            data[f'pps_{window}s'] = pps
+
+        # Peak 10 ms rates over each window, from one peak per second
+        peak_history.append(peak.take())
+        history = list(peak_history)
+        for window in rates:
+            span = peak_span(window)
+            recent = history[-span:]
+            data[f'peak_bps_{span}s'] = max(bps for bps, _ in recent)
+            data[f'peak_pps_{span}s'] = max(pps for _, pps in recent)
+        data['packet_size'] = {k: round(v) for k, v in packet_size.summary().items()}
+        data['interarrival_ms'] = {k: v if k == 'count' else round(v * 1000, 3)
+                                   for k, v in interarrival.summary().items()}
+        if MQTT_ACCOUNTING:
+            data['mqtt'] = mqtt_traffic.stats(current_time)
+        if capture is not None:
+            data['capture'] = capture.stats()
+        latest_stats = data
         payload = json.dumps(data)
         print(f"[Stats] {payload}")
         
         if client.is_connected():
             client.publish(TOPIC_STATS, payload)
 
+# ================= PROMETHEUS =================
+def collect_netmon():
+    """ Gauges from the last stats_loop pass, plus the capture counters """
+    data = latest_stats
+    resolution = f"{int(PEAK_RESOLUTION * 1000)}ms"
+    for window in sorted(set(WINDOWS + EXTRA_WINDOWS)):
+        labels = {'window': f'{window}s'}
+        if f'bps_{window}s' not in data:
+            continue
+        yield ('netmon_rate_bits_per_second', 'gauge', 'Average traffic rate', labels, data[f'bps_{window}s'])
+        yield ('netmon_rate_packets_per_second', 'gauge', 'Average packet rate', labels, data[f'pps_{window}s'])
+
+    for span in sorted(set(peak_span(w) for w in WINDOWS + EXTRA_WINDOWS)):
+        if f'peak_bps_{span}s' not in data:
+            continue
+        peak_labels = {'window': f'{span}s', 'resolution': resolution}
+        yield ('netmon_peak_bits_per_second', 'gauge', 'Highest short-interval traffic rate in the window',
+               peak_labels, data[f'peak_bps_{span}s'])
+        yield ('netmon_peak_packets_per_second', 'gauge', 'Highest short-interval packet rate in the window',
+               peak_labels, data[f'peak_pps_{span}s'])
+
+    mqtt_stats = data.get('mqtt')
+    if mqtt_stats:
+        for name, rates in mqtt_stats['types'].items():
+            for window in sorted(set(WINDOWS + EXTRA_WINDOWS)):
+                yield ('netmon_mqtt_packets_per_second', 'gauge', 'MQTT packet rate by type',
+                       {'type': name, 'window': f'{window}s'}, rates[f'pps_{window}s'])
+        for talker in mqtt_stats['top_talkers']:
+            yield ('netmon_mqtt_client_bits_per_second', 'gauge', 'Smoothed MQTT traffic of the top talkers',
+                   {'client': talker['client']}, talker['bps'])
+        yield ('netmon_mqtt_clients', 'gauge', 'Clients seen recently', {}, mqtt_stats['clients'])
+        yield ('netmon_mqtt_resyncs_total', 'counter', 'Streams re-synchronised after lost segments',
+               {}, mqtt_stats['resyncs'])
+
+    capture_stats = data.get('capture', {})
+    if 'captured' in capture_stats:
+        yield ('netmon_capture_packets_total', 'counter', 'Packets handled by the capture backend',
+               {}, capture_stats['captured'])
+    if 'kernel_drops' in capture_stats:
+        yield ('netmon_capture_kernel_drops_total', 'counter', 'Packets dropped by the kernel before capture',
+               {}, capture_stats['kernel_drops'])
+
+REGISTRY.add_collector(collect_netmon)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per scrape is noise
+
+def start_metrics_server():
+    server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Prometheus metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
 # ================= MAIN =================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publishes port 1883 traffic rates to MQTT")
+    parser.add_argument('--backend', choices=('raw', 'scapy', 'pcap'), default=CAPTURE_BACKEND)
+    parser.add_argument('--iface', default=MONITOR_INTERFACE)
+    parser.add_argument('--pcap', help="pcap file to replay (implies --backend pcap)")
+    args = parser.parse_args()
+    if args.pcap:
+        args.backend = 'pcap'
+
     connect_mqtt()
+    if METRICS_PORT:
+        start_metrics_server()
 
     # Start Stats Thread
     t_stats = threading.Thread(target=stats_loop)
@@ -114,7 +234,7 @@ if __name__ == "__main__":
     # Start Sniffer (Blocks main thread)
     # sudo is usually required for this part
     try:
-        start_sniffer()
+        start_sniffer(args.backend, args.iface, args.pcap)
     except PermissionError:
         print("Error: Packet sniffing requires root privileges. Try running with 'sudo'.")
     except Exception as e:
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import os
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+OPT_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL,
+}
+
+def optimized_model_path(model_path, cache_dir, opt_level):
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir, f"{name}.{opt_level}.opt.onnx")
+
+def make_session(model_path, intra_op_threads=0, inter_op_threads=0, execution_mode='sequential',
+                 opt_level='all', optimized_cache_dir=None, allow_spinning=True,
+                 providers=('CPUExecutionProvider',)):
+    """
+    Builds an InferenceSession with explicit threading and graph optimisation.
+
+    Thread counts of 0 keep the onnxruntime default (one per core). With
+    optimized_cache_dir set, the optimised graph is saved there on the first
+    run and loaded, without optimising again, while it is newer than the model.
+    allow_spinning=False stops idle ORT threads from busy-waiting, which
+    otherwise steals CPU from dlib and OpenCV on shared machines.
+    """
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = EXECUTION_MODES[execution_mode]
+    options.graph_optimization_level = OPT_LEVELS[opt_level]
+    if not allow_spinning:
+        options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+        options.add_session_config_entry('session.inter_op.allow_spinning', '0')
+
+    load_path = model_path
+    if optimized_cache_dir and opt_level != 'disable':
+        cached = optimized_model_path(model_path, optimized_cache_dir, opt_level)
+        if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(model_path):
+            load_path = cached
+            options.graph_optimization_level = OPT_LEVELS['disable']
+        else:
+            os.makedirs(optimized_cache_dir, exist_ok=True)
+            options.optimized_model_filepath = cached
+
+    return ort.InferenceSession(load_path, sess_options=options, providers=list(providers))
+
+def warmup(session, runs=2):
+    """ Runs the model on a blank input so the first real frames are not slow; returns seconds per run """
+    if runs <= 0:
+        return []
+    inp = session.get_inputs()[0]
+    shape = [d if isinstance(d, int) and d > 0 else 1 for d in inp.shape]
+    dummy = np.zeros(shape, dtype=np.float32)
+    output_name = session.get_outputs()[0].name
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run([output_name], {inp.name: dummy})
+        times.append(time.perf_counter() - start)
+    return times
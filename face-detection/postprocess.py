@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import cv2
+import numpy as np
+
+# ================= CONFIGURATION =================
+CONF_THRESHOLD = 0.5
+NMS_THRESHOLD = 0.4
+
+# yolov5-face output row layout:
+#   [cx, cy, w, h, objectness, 5 x (landmark x, landmark y), face class score]
+COL_OBJ = 4
+COL_CLS = 15
+
+# ================= VECTORISED DECODING =================
+def decode_predictions(predictions, scale_x, scale_y, pad_x=0.0, pad_y=0.0, conf_threshold=CONF_THRESHOLD):
+    """
+    Turns the raw (N, 16) model output into boxes and scores, working on whole
+    arrays instead of row by row.
+
+    Model coordinates map back to the original image with
+    orig = (model - pad) * scale; pad is non-zero only for letterboxed input.
+
+    Returns (boxes, scores): boxes is an int32 (K, 4) array of [x, y, w, h] in
+    original image coordinates, scores is a float32 (K,) array.
+    """
+    predictions = np.asarray(predictions)
+    if predictions.ndim != 2 or predictions.shape[0] == 0:
+        return np.empty((0, 4), np.int32), np.empty((0,), np.float32)
+
+    scores = predictions[:, COL_OBJ] * predictions[:, COL_CLS]
+    mask = scores > conf_threshold
+    if not mask.any():
+        return np.empty((0, 4), np.int32), np.empty((0,), np.float32)
+
+    sel = predictions[mask, :4]
+    scores = scores[mask]
+
+    # Same arithmetic (and dtype) as the per-row version, so results match exactly
+    half_w = sel[:, 2] / 2
+    half_h = sel[:, 3] / 2
+    boxes = np.empty(sel.shape, dtype=sel.dtype)
+    boxes[:, 0] = (sel[:, 0] - half_w - pad_x) * scale_x
+    boxes[:, 1] = (sel[:, 1] - half_h - pad_y) * scale_y
+    boxes[:, 2] = sel[:, 2] * scale_x
+    boxes[:, 3] = sel[:, 3] * scale_y
+
+    # astype truncates towards zero, just like int()
+    return boxes.astype(np.int32), scores.astype(np.float32)
+
+def non_max_suppression(boxes, scores, conf_threshold=CONF_THRESHOLD, nms_threshold=NMS_THRESHOLD):
+    """ Runs OpenCV NMS on the (already filtered) boxes, returns a flat index array """
+    if len(boxes) == 0:
+        return np.empty((0,), np.int32)
+    indices = cv2.dnn.NMSBoxes(boxes.tolist(), scores.tolist(), conf_threshold, nms_threshold)
+    return np.asarray(indices, dtype=np.int32).reshape(-1)
+
+def postprocess(predictions, scale_x, scale_y, pad_x=0.0, pad_y=0.0,
+                conf_threshold=CONF_THRESHOLD, nms_threshold=NMS_THRESHOLD):
+    """ decode_predictions + NMS. Returns (boxes, scores) of the kept detections only """
+    boxes, scores = decode_predictions(predictions, scale_x, scale_y, pad_x, pad_y, conf_threshold)
+    keep = non_max_suppression(boxes, scores, conf_threshold, nms_threshold)
+    return boxes[keep], scores[keep]
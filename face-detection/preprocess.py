@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import time
+
+import cv2
+import numpy as np
+
+# ================= CONFIGURATION =================
+PAD_VALUE = 114  # Grey border, same as the yolov5 training letterbox
+
+# ================= REUSABLE PREPROCESSOR =================
+class Preprocessor:
+    """
+    Turns a BGR uint8 frame into the (1, 3, H, W) float32 RGB tensor the model
+    expects, writing into buffers that are allocated once and reused for every
+    frame of the same size.
+
+    With letterbox=True the frame is scaled to fit while keeping its aspect
+    ratio and the rest is padded; otherwise it is stretched (old behaviour).
+    After each call, `mapping` holds (scale_x, scale_y, pad_x, pad_y) so that
+    model coordinates map back with orig = (model - pad) * scale.
+
+    The returned tensor is the shared buffer: it is only valid until the next call.
+    """
+    def __init__(self, input_w, input_h, letterbox=True, pad_value=PAD_VALUE):
+        self.input_w = input_w
+        self.input_h = input_h
+        self.letterbox = letterbox
+        self.pad_value = pad_value
+
+        self.tensor = np.empty((1, 3, input_h, input_w), dtype=np.float32)
+        self.canvas = np.full((input_h, input_w, 3), pad_value, dtype=np.uint8)
+        self.resized = None
+        self.region = None
+        self.geometry = None
+        self.mapping = (1.0, 1.0, 0.0, 0.0)
+
+        # Stats
+        self.allocations = 2
+        self.frames = 0
+        self.total_time = 0.0
+
+    def _setup(self, orig_h, orig_w):
+        """ (Re)computes the geometry for a new source size; only runs when the size changes """
+        if not self.letterbox:
+            self.region = (0, 0, self.input_w, self.input_h)
+            self.mapping = (orig_w / self.input_w, orig_h / self.input_h, 0.0, 0.0)
+        else:
+            r = min(self.input_w / orig_w, self.input_h / orig_h)
+            new_w = max(1, min(self.input_w, int(round(orig_w * r))))
+            new_h = max(1, min(self.input_h, int(round(orig_h * r))))
+            left = (self.input_w - new_w) // 2
+            top = (self.input_h - new_h) // 2
+            self.region = (left, top, new_w, new_h)
+            self.mapping = (orig_w / new_w, orig_h / new_h, float(left), float(top))
+
+            if self.resized is None or self.resized.shape[:2] != (new_h, new_w):
+                self.resized = np.empty((new_h, new_w, 3), dtype=np.uint8)
+                self.allocations += 1
+            self.canvas[...] = self.pad_value
+
+        self.geometry = (orig_h, orig_w)
+
+    def __call__(self, img):
+        start = time.perf_counter()
+        orig_h, orig_w = img.shape[:2]
+        if self.geometry != (orig_h, orig_w):
+            self._setup(orig_h, orig_w)
+
+        if self.letterbox:
+            left, top, new_w, new_h = self.region
+            cv2.resize(img, (new_w, new_h), dst=self.resized, interpolation=cv2.INTER_LINEAR)
+            self.canvas[top:top+new_h, left:left+new_w] = self.resized
+        else:
+            cv2.resize(img, (self.input_w, self.input_h), dst=self.canvas, interpolation=cv2.INTER_LINEAR)
+
+        # Fused BGR->RGB + HWC->NCHW + /255: each output plane is written once,
+        # straight from the matching (swapped) input channel.
+        for c in range(3):
+            np.multiply(self.canvas[:, :, 2 - c], 1.0 / 255.0, out=self.tensor[0, c], dtype=np.float32)
+
+        self.frames += 1
+        self.total_time += time.perf_counter() - start
+        return self.tensor
+
+    def stats(self):
+        avg_ms = (self.total_time / self.frames * 1000) if self.frames else 0.0
+        return {'frames': self.frames, 'avg_ms': round(avg_ms, 3), 'buffer_allocations': self.allocations}
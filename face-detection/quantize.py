@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Builds an int8 version of the face detector and compares it with the fp32 one.
+
+Quantize (static QDQ, calibrated on real frames):
+    python3 quantize.py quantize --calibrate known_faces/*.png frames.flog
+
+Compare speed and detection agreement on images and/or frame logs:
+    python3 quantize.py compare known_faces/*.png frames.flog
+
+Then set MODEL_PATH = "yolov5n-face.int8.onnx" in web-ui.py.
+"""
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from framelog import FrameLogReader
+from metrics import Histogram
+from ort_session import make_session, warmup
+from postprocess import postprocess
+from preprocess import Preprocessor
+from tracker import iou_matrix
+
+FP32_MODEL = "yolov5n-face.onnx"
+INT8_MODEL = "yolov5n-face.int8.onnx"
+MATCH_IOU = 0.5
+
+# ================= INPUT FRAMES =================
+def load_frames(paths, limit=0):
+    """ Decoded BGR frames from image files and frame logs (*.flog) """
+    frames = []
+    for path in paths:
+        if path.endswith('.flog'):
+            log = FrameLogReader(path)
+            for _, _, payload in log:
+                img = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+                if img is not None:
+                    frames.append(img)
+                if limit and len(frames) >= limit:
+                    break
+            log.close()
+        else:
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+            if img is not None:
+                frames.append(img)
+        if limit and len(frames) >= limit:
+            break
+    return frames
+
+class Model:
+    def __init__(self, path, threads, letterbox=True):
+        self.session = make_session(path, intra_op_threads=threads, inter_op_threads=1)
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.output_name = self.session.get_outputs()[0].name
+        self.preprocessor = Preprocessor(inp.shape[3], inp.shape[2], letterbox=letterbox)
+        warmup(self.session, 2)
+
+    def detect(self, img):
+        tensor = self.preprocessor(img)
+        start = time.perf_counter()
+        out = self.session.run([self.output_name], {self.input_name: tensor})[0]
+        elapsed = time.perf_counter() - start
+        boxes, scores = postprocess(np.squeeze(out), *self.preprocessor.mapping)
+        return boxes, scores, elapsed
+
+# ================= QUANTIZE =================
+class CalibrationReader:
+    """ Feeds preprocessed frames to onnxruntime's static quantization calibrator """
+    def __init__(self, frames, input_name, input_w, input_h):
+        self.input_name = input_name
+        self.preprocessor = Preprocessor(input_w, input_h, letterbox=True)
+        self.frames = iter(frames)
+
+    def get_next(self):
+        img = next(self.frames, None)
+        if img is None:
+            return None
+        return {self.input_name: self.preprocessor(img).copy()}
+
+def quantize(args):
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    frames = load_frames(args.calibrate, args.limit)
+    if not frames:
+        print("Need calibration frames (--calibrate images or .flog files).")
+        return
+    session = make_session(args.model)
+    inp = session.get_inputs()[0]
+
+    prepared = args.output + '.prep.onnx'
+    try:
+        quant_pre_process(args.model, prepared)
+        print(f"Calibrating on {len(frames)} frames...")
+        quantize_static(prepared, args.output,
+                        CalibrationReader(frames, inp.name, inp.shape[3], inp.shape[2]),
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        per_channel=True,
+                        calibrate_method=CalibrationMethod.MinMax)
+    finally:
+        # Intermediate model with shape information only
+        if os.path.exists(prepared):
+            os.remove(prepared)
+    print(f"Saved {args.output}")
+
+# ================= COMPARE =================
+def compare(args):
+    frames = load_frames(args.inputs, args.limit)
+    if not frames:
+        print("No frames to compare on.")
+        return
+    ref = Model(args.model, args.threads)
+    test = Model(args.int8, args.threads)
+
+    ref_time, test_time = Histogram(), Histogram()
+    ref_total = test_total = matched = 0
+    ious, score_diffs = [], []
+    for _ in range(args.repeat):
+        for img in frames:
+            ref_boxes, ref_scores, t_ref = ref.detect(img)
+            test_boxes, test_scores, t_test = test.detect(img)
+            ref_time.observe(t_ref)
+            test_time.observe(t_test)
+
+            ref_total += len(ref_boxes)
+            test_total += len(test_boxes)
+            if len(ref_boxes) and len(test_boxes):
+                iou = iou_matrix(ref_boxes, test_boxes)
+                used = set()
+                # Greedy: highest-scoring fp32 box first, each int8 box used once
+                for r in np.argsort(-ref_scores):
+                    candidates = iou[r].copy()
+                    candidates[list(used)] = -1.0
+                    t = int(np.argmax(candidates))
+                    if candidates[t] >= MATCH_IOU:
+                        used.add(t)
+                        matched += 1
+                        ious.append(iou[r, t])
+                        score_diffs.append(abs(float(ref_scores[r]) - float(test_scores[t])))
+
+    print(f"{len(frames)} frames x {args.repeat}, {args.threads or 'default'} threads")
+    print(f"{'model':<6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, h in (('fp32', ref_time), ('int8', test_time)):
+        s = h.summary()
+        print(f"{name:<6} {s['mean_ms']:>9.2f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f}")
+    speedup = ref_time.sum / test_time.sum if test_time.sum else 0.0
+    print(f"Speed-up: {speedup:.2f}x")
+
+    recall = matched / ref_total if ref_total else 1.0
+    precision = matched / test_total if test_total else 1.0
+    print(f"Detections: fp32 {ref_total}, int8 {test_total}, matched {matched} (IoU >= {MATCH_IOU})")
+    print(f"Agreement: recall {recall:.3f}, precision {precision:.3f}, "
+          f"mean IoU {np.mean(ious) if ious else 0:.3f}, mean |score diff| {np.mean(score_diffs) if score_diffs else 0:.3f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    q = sub.add_parser('quantize', help="create the int8 model")
+    q.add_argument('--calibrate', nargs='+', required=True, help="images and/or .flog frame logs")
+    q.add_argument('--model', default=FP32_MODEL)
+    q.add_argument('-o', '--output', default=INT8_MODEL)
+    q.add_argument('--limit', type=int, default=200, help="max calibration frames")
+
+    c = sub.add_parser('compare', help="speed and detection agreement, fp32 vs int8")
+    c.add_argument('inputs', nargs='+', help="images and/or .flog frame logs")
+    c.add_argument('--model', default=FP32_MODEL)
+    c.add_argument('--int8', default=INT8_MODEL)
+    c.add_argument('--threads', type=int, default=0, help="intra-op threads per session (0 = default)")
+    c.add_argument('--repeat', type=int, default=1)
+    c.add_argument('--limit', type=int, default=0, help="max frames")
+
+    args = parser.parse_args()
+    if args.command == 'quantize':
+        quantize(args)
+    else:
+        compare(args)
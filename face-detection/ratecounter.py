@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+BUCKET_SECONDS = 1.0
+
+# ================= RATE COUNTER =================
+class RateCounter:
+    """
+    Bytes and packets in fixed time buckets kept in a ring, so memory and the
+    cost of computing rates do not depend on the packet rate.
+
+    record() is only called from the capture thread (single writer) and only
+    touches one slot; rates() reads the ring without locking. A read racing
+    with a write can at worst miss the packet being recorded at that moment.
+    """
+    def __init__(self, windows, bucket_seconds=BUCKET_SECONDS):
+        self.windows = sorted(set(windows))
+        self.bucket_seconds = bucket_seconds
+        # Window sizes in buckets; +1 slot for the bucket currently being filled
+        self.window_buckets = []
+        for w in self.windows:
+            buckets = round(w / bucket_seconds)
+            if buckets < 1 or abs(buckets * bucket_seconds - w) > 1e-9 * max(1.0, w):
+                raise ValueError(f"Window {w}s is not a whole multiple of the {bucket_seconds}s bucket")
+            self.window_buckets.append(int(buckets))
+        self.size = max(self.window_buckets) + 1
+        self.epochs = [-1] * self.size   # Absolute bucket number held by each slot
+        self.bytes = [0] * self.size
+        self.packets = [0] * self.size
+
+    def record(self, timestamp, size):
+        bucket = int(timestamp / self.bucket_seconds)
+        slot = bucket % self.size
+        if self.epochs[slot] != bucket:
+            # Slot still holds an old bucket: recycle it
+            self.bytes[slot] = 0
+            self.packets[slot] = 0
+            self.epochs[slot] = bucket
+        self.bytes[slot] += size
+        self.packets[slot] += 1
+
+    def rates(self, current_time):
+        """
+        Returns {window: (bps, pps)} over the last complete buckets (the bucket
+        being filled is left out), computing every window in one pass.
+        """
+        current = int(current_time / self.bucket_seconds)
+        totals_bytes = [0] * len(self.windows)
+        totals_packets = [0] * len(self.windows)
+        for slot in range(self.size):
+            age = current - self.epochs[slot]
+            if age < 1 or age >= self.size:
+                continue
+            b = self.bytes[slot]
+            p = self.packets[slot]
+            for i, wb in enumerate(self.window_buckets):
+                if age <= wb:
+                    totals_bytes[i] += b
+                    totals_packets[i] += p
+
+        result = {}
+        for i, window in enumerate(self.windows):
+            span = self.window_buckets[i] * self.bucket_seconds
+            result[window] = (int(totals_bytes[i] * 8 / span), round(totals_packets[i] / span, 2))
+        return result
+
+# ================= PEAK RATE =================
+class PeakRate:
+    """
+    Highest rate over short `resolution` intervals (e.g. 10 ms), to catch the
+    microbursts that per-second averages flatten. record() is called from the
+    capture thread; take() from the stats thread returns the peak since the
+    previous take() as (bps, pps) and starts a new period.
+    """
+    def __init__(self, resolution=0.01):
+        self.resolution = resolution
+        self.bucket = -1
+        self.bytes = 0
+        self.packets = 0
+        self.peak_bytes = 0
+        self.peak_packets = 0
+
+    def record(self, timestamp, size):
+        bucket = int(timestamp / self.resolution)
+        if bucket != self.bucket:
+            if self.bytes > self.peak_bytes:
+                self.peak_bytes = self.bytes
+            if self.packets > self.peak_packets:
+                self.peak_packets = self.packets
+            self.bytes = self.packets = 0
+            self.bucket = bucket
+        self.bytes += size
+        self.packets += 1
+
+    def take(self):
+        # The interval being filled counts too, so a burst in progress is not missed
+        peak_bytes = max(self.peak_bytes, self.bytes)
+        peak_packets = max(self.peak_packets, self.packets)
+        self.peak_bytes = self.peak_packets = 0
+        return int(peak_bytes * 8 / self.resolution), round(peak_packets / self.resolution, 2)
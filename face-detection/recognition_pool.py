@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# ================= CONFIGURATION =================
+SLOT_BYTES = 2 * 1024 * 1024  # Largest face crop that fits a slot (800x800 RGB); larger ones are downscaled
+QUEUE_SIZE = 16               # Face crops in flight; more are dropped
+TIMEOUT = 0.5                 # Seconds a frame waits for its faces
+
+DROPPED = object()  # encode() result for a face that was not encoded in time
+
+# ================= WORKER SIDE =================
+_attached = {}  # shm name -> SharedMemory, per worker process
+
+def _init_worker():
+    global face_recognition
+    import face_recognition
+
+def _encode(shm_name, shape):
+    """ Runs in a worker process: encodes the RGB face crop stored in a shared memory slot """
+    shm = _attached.get(shm_name)
+    if shm is None:
+        shm = _attached[shm_name] = shared_memory.SharedMemory(name=shm_name)
+    h, w = shape[:2]
+    face = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    encodings = face_recognition.face_encodings(face, [(0, w, h, 0)])
+    return encodings[0] if len(encodings) > 0 else None
+
+# ================= PARENT SIDE =================
+class RecognitionPool:
+    """
+    Computes face encodings in worker processes, away from the GIL.
+
+    Face crops are copied into preallocated shared memory slots and only the
+    slot name and shape are pickled. The number of free slots bounds the work
+    in flight: when none is free the face is dropped rather than
+    queued, and faces not done within the timeout are dropped too, so a slow
+    worker costs a face, never the frame. Results come back in input order.
+    """
+    def __init__(self, processes, queue_size=QUEUE_SIZE, timeout=TIMEOUT, slot_bytes=SLOT_BYTES):
+        self.timeout = timeout
+        self.slot_bytes = slot_bytes
+        self.slots = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(queue_size)]
+        self.free = queue.Queue()
+        for i in range(queue_size):
+            self.free.put(i)
+
+        # spawn: workers must not inherit the parent's threads, ONNX sessions or sockets
+        self.executor = ProcessPoolExecutor(max_workers=processes,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker)
+        self.stats_lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.dropped_full = 0
+        self.downscaled = 0
+        self.timed_out = 0
+        self.errors = 0
+        atexit.register(self.close)
+
+    def _count(self, field):
+        with self.stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _fit(self, face_rgb):
+        """
+        Downscales a crop that does not fit a slot. Encodings are computed on a
+        150x150 aligned chip, so a smaller crop of a close face loses nothing.
+        """
+        h, w = face_rgb.shape[:2]
+        pixel_bytes = face_rgb.nbytes // (h * w)
+        scale = (self.slot_bytes / face_rgb.nbytes) ** 0.5
+        width, height = max(1, int(w * scale)), max(1, int(h * scale))
+        while width * height * pixel_bytes > self.slot_bytes:  # Float rounding
+            width, height = max(1, width - 1), max(1, height - 1)
+        self._count('downscaled')
+        return cv2.resize(face_rgb, (width, height), interpolation=cv2.INTER_AREA)
+
+    def _submit(self, face_rgb):
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            self._count('dropped_full')
+            return None
+        if face_rgb.nbytes > self.slot_bytes:
+            face_rgb = self._fit(face_rgb)
+
+        shm = self.slots[slot]
+        np.copyto(np.ndarray(face_rgb.shape, dtype=np.uint8, buffer=shm.buf), face_rgb)
+        try:
+            future = self.executor.submit(_encode, shm.name, face_rgb.shape)
+        except Exception:
+            self.free.put(slot)
+            self._count('errors')
+            return None
+        # The slot is only reused once the worker is done with it, even after a timeout
+        future.add_done_callback(lambda f: self.free.put(slot))
+        self._count('submitted')
+        return future
+
+    def encode(self, img_rgb, boxes):
+        """
+        Encodes the [x, y, w, h] boxes of an RGB image in parallel.
+        Returns one result per box: the encoding, None if no face was found in
+        the box, or DROPPED if the face was dropped (queue full or timeout).
+        """
+        futures = [self._submit(img_rgb[y:y+h, x:x+w]) for x, y, w, h in boxes]
+        deadline = time.monotonic() + self.timeout
+
+        results = []
+        for future in futures:
+            if future is None:
+                results.append(DROPPED)
+                continue
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+                self._count('completed')
+            except FutureTimeoutError:
+                future.cancel()
+                results.append(DROPPED)
+                self._count('timed_out')
+            except Exception:
+                results.append(DROPPED)
+                self._count('errors')
+        return results
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'in_flight': len(self.slots) - self.free.qsize(),
+                'dropped_full': self.dropped_full,
+                'downscaled': self.downscaled,
+                'timed_out': self.timed_out,
+                'errors': self.errors,
+            }
+
+    def close(self):
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=False)
+        self.executor = None
+        for shm in self.slots:
+            try:
+                shm.close()
+                shm.unlink()
+            except Exception:
+                pass
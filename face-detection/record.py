@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Records raw camera frames from MQTT into a frame log (see framelog.py) for
+offline replay with replay.py.
+
+    python3 record.py frames.flog                 # until Ctrl+C
+    python3 record.py frames.flog --frames 500    # stop after 500 frames
+"""
+
+import argparse
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from framelog import FrameLogWriter
+
+# ================= CONFIGURATION =================
+MQTT_BROKER = ""
+MQTT_PORT = 1883
+MQTT_USER = ""
+MQTT_PASS = ""
+
+MQTT_TOPIC_IMAGE = "esp32/+/image"
+FLUSH_INTERVAL = 1.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', help="frame log to append to")
+    parser.add_argument('--topic', default=MQTT_TOPIC_IMAGE)
+    parser.add_argument('--frames', type=int, default=0, help="stop after this many frames (0 = no limit)")
+    parser.add_argument('--duration', type=float, default=0, help="stop after this many seconds (0 = no limit)")
+    args = parser.parse_args()
+
+    writer = FrameLogWriter(args.log)
+    done = threading.Event()
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(args.topic)
+            print(f"Recording {args.topic} to {args.log}...")
+        else:
+            print(f"Connection failed with code {rc}")
+
+    def on_message(client, userdata, msg):
+        if done.is_set():
+            return
+        writer.append(time.time(), msg.topic, msg.payload)
+        if args.frames and writer.count >= args.frames:
+            done.set()
+
+    client = mqtt.Client()
+    client.username_pw_set(MQTT_USER, MQTT_PASS)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    client.loop_start()
+
+    start = time.time()
+    try:
+        while not done.wait(FLUSH_INTERVAL):
+            writer.flush()
+            print(f"  {writer.count} frames", end='\r')
+            if args.duration and time.time() - start >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        writer.close()
+    print(f"Recorded {writer.count} frames in {time.time() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Replays a frame log (see record.py) through web-ui.py's pipeline, the same
+decode, YoloFaceDetector, tracker and FaceMatcher, without a broker or camera,
+then reports throughput, per-stage latency percentiles and recognition results.
+
+    python3 replay.py frames.flog                  # as fast as possible
+    python3 replay.py frames.flog --pace recorded  # at the recorded frame times
+"""
+
+import argparse
+import importlib.util
+import os
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from framelog import FrameLogReader
+from metrics import Histogram
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_web_ui():
+    """ Imports web-ui.py (not a valid module name) without running its __main__ """
+    spec = importlib.util.spec_from_file_location('web_ui', os.path.join(HERE, 'web-ui.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log')
+    parser.add_argument('--pace', choices=('max', 'recorded'), default='max')
+    parser.add_argument('--model', default=None, help="ONNX model (default: web-ui.py MODEL_PATH)")
+    parser.add_argument('--faces', default=None, help="known faces dir (default: web-ui.py FACES_DIR)")
+    parser.add_argument('--limit', type=int, default=0, help="replay at most this many frames")
+    parser.add_argument('--loops', type=int, default=1, help="replay the log this many times")
+    parser.add_argument('--full-decode', action='store_true', help="disable reduced-scale decoding")
+    parser.add_argument('--no-encode', action='store_true', help="skip the JPEG re-encode for the web stream")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print the names found in every frame")
+    args = parser.parse_args()
+
+    web_ui = load_web_ui()
+    matcher = web_ui.FaceMatcher(args.faces or web_ui.FACES_DIR)
+    detector = web_ui.YoloFaceDetector(args.model or web_ui.MODEL_PATH, matcher)
+    stage = web_ui.STAGE_SECONDS
+    cameras = {}
+
+    log = FrameLogReader(args.log)
+    total = len(log) if not args.limit else min(args.limit, len(log))
+    if total == 0:
+        print("Empty frame log.")
+        return
+    print(f"Replaying {total} frames x {args.loops} ({args.pace} pace)...")
+
+    frame_latency = Histogram()
+    names_seen = Counter()
+    frames = failed = 0
+    late = 0.0
+
+    start = time.perf_counter()
+    for loop in range(args.loops):
+        t_first = log.timestamp(0)
+        loop_start = time.perf_counter()
+        for i in range(total):
+            ts, topic, payload = log.read(i)
+            if args.pace == 'recorded':
+                due = loop_start + (ts - t_first)
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                else:
+                    late = max(late, -wait)
+
+            camera_id = web_ui.camera_from_topic(topic, web_ui.MQTT_TOPIC_IMAGE) or web_ui.DEFAULT_CAMERA
+            camera = cameras.get(camera_id)
+            if camera is None:
+                camera = cameras[camera_id] = web_ui.new_camera(camera_id)
+
+            t0 = time.perf_counter()
+            if args.full_decode:
+                img, full_image = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR), None
+            else:
+                img, full_image = web_ui.decode_for_detection(payload, detector.input_w, detector.input_h,
+                                                              detector.preprocessor.letterbox)
+            stage['decode'].observe(time.perf_counter() - t0)
+            if img is None:
+                failed += 1
+                continue
+
+            img, names = detector.detect_and_recognize(img, camera.tracker, full_image)
+            if not args.no_encode:
+                t1 = time.perf_counter()
+                cv2.imencode('.jpg', img)
+                stage['encode'].observe(time.perf_counter() - t1)
+
+            frame_latency.observe(time.perf_counter() - t0)
+            names_seen.update(names)
+            frames += 1
+            if args.verbose:
+                print(f"  [{i:>5}] {camera_id}: {', '.join(names) or 'No Face'}")
+    elapsed = time.perf_counter() - start
+    log.close()
+
+    print(f"\nFrames: {frames} processed, {failed} undecodable, {elapsed:.2f}s, {frames / elapsed:.1f} fps")
+    if args.pace == 'recorded':
+        print(f"Max lag behind recorded pace: {late * 1000:.1f} ms")
+
+    print(f"\n{'stage':<14} {'count':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = [(name, stage[name].summary()) for name in web_ui.STAGES if name not in ('mqtt_receive', 'publish')]
+    rows.append(('frame', frame_latency.summary()))
+    for name, s in rows:
+        print(f"{name:<14} {s['count']:>7} {s['mean_ms']:>9.2f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+    print("\nRecognition results:")
+    for name, count in names_seen.most_common():
+        print(f"  {name:<24} {count:>6}")
+    for camera_id, camera in sorted(cameras.items()):
+        print(f"Tracker [{camera_id}]: {camera.tracker.stats()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import itertools
+import time
+
+import numpy as np
+
+# ================= CONFIGURATION =================
+IOU_THRESHOLD = 0.3        # Min overlap to continue a track
+CENTROID_THRESHOLD = 0.5   # Fallback: max centre shift, as a fraction of the box diagonal
+MAX_MISSES = 5             # Frames a track survives without a detection
+REVERIFY_INTERVAL = 2.0    # Seconds before a known identity is recognised again
+UNKNOWN_INTERVAL = 0.5     # Same, for tracks currently labelled "Unknown"
+CONF_DROP = 0.15           # Re-recognise when the detection score falls this much below the verified one
+
+# ================= TRACK =================
+class Track:
+    def __init__(self, track_id, box, score, now):
+        self.id = track_id
+        self.box = box
+        self.score = score
+        self.name = None
+        self.verified_at = None
+        self.verified_score = None
+        self.created_at = now
+        self.last_seen = now
+        self.hits = 1
+        self.misses = 0
+
+    def needs_recognition(self, now, reverify_interval, unknown_interval, conf_drop):
+        if self.name is None:
+            return True
+        interval = unknown_interval if self.name == "Unknown" else reverify_interval
+        if now - self.verified_at >= interval:
+            return True
+        return self.score < self.verified_score - conf_drop
+
+# ================= TRACKER =================
+def iou_matrix(a, b):
+    """ Pairwise IoU between two (N, 4) and (M, 4) arrays of [x, y, w, h] boxes """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    iw = np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    ih = np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+class FaceTracker:
+    """
+    Gives detections stable track IDs across frames (greedy IoU matching, with
+    a centroid-distance fallback for small fast-moving faces) and remembers
+    each track's identity, so FaceMatcher only runs when a track is new, its
+    identity is stale, or its detection confidence dropped.
+
+    Counters: `recognition_hits` are faces whose identity was reused from
+    their track, `recognition_misses` are faces that had to be recognised.
+    """
+    def __init__(self, iou_threshold=IOU_THRESHOLD, centroid_threshold=CENTROID_THRESHOLD,
+                 max_misses=MAX_MISSES, reverify_interval=REVERIFY_INTERVAL,
+                 unknown_interval=UNKNOWN_INTERVAL, conf_drop=CONF_DROP):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_misses = max_misses
+        self.reverify_interval = reverify_interval
+        self.unknown_interval = unknown_interval
+        self.conf_drop = conf_drop
+
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+        # Stats
+        self.recognition_hits = 0
+        self.recognition_misses = 0
+        self.tracks_created = 0
+        self.tracks_expired = 0
+
+    def _associate(self, boxes):
+        """ Returns {detection index: track} using greedy best-IoU-first matching """
+        if not self.tracks or len(boxes) == 0:
+            return {}
+
+        track_boxes = np.asarray([t.box for t in self.tracks], dtype=np.float64)
+        det_boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        iou = iou_matrix(track_boxes, det_boxes)
+
+        # Centroid fallback, scored below any real overlap
+        tc = track_boxes[:, :2] + track_boxes[:, 2:] / 2
+        dc = det_boxes[:, :2] + det_boxes[:, 2:] / 2
+        shift = np.linalg.norm(tc[:, None, :] - dc[None, :, :], axis=2)
+        diag = np.linalg.norm(track_boxes[:, 2:], axis=1)[:, None]
+        near = (iou < self.iou_threshold) & (shift < self.centroid_threshold * diag)
+        score = np.where(iou >= self.iou_threshold, 1.0 + iou, 0.0)
+        score = np.where(near, 1.0 - shift / np.maximum(diag, 1e-9), score)
+
+        assigned = {}
+        used_tracks = set()
+        for flat in np.argsort(-score, axis=None):
+            t, d = np.unravel_index(flat, score.shape)
+            if score[t, d] <= 0:
+                break
+            if t in used_tracks or d in assigned:
+                continue
+            assigned[int(d)] = self.tracks[t]
+            used_tracks.add(t)
+        return assigned
+
+    def update(self, boxes, scores, now=None):
+        """
+        Feeds one frame of detections ([x, y, w, h] boxes and scores).
+        Returns the Track of every detection, in the same order.
+        """
+        now = time.monotonic() if now is None else now
+        assigned = self._associate(boxes)
+
+        result = []
+        for d, (box, score) in enumerate(zip(boxes, scores)):
+            track = assigned.get(d)
+            if track is None:
+                track = Track(next(self._ids), tuple(box), float(score), now)
+                self.tracks.append(track)
+                self.tracks_created += 1
+            else:
+                track.box = tuple(box)
+                track.score = float(score)
+                track.last_seen = now
+                track.hits += 1
+                track.misses = 0
+            result.append(track)
+
+        seen = {id(t) for t in result}
+        alive = []
+        for track in self.tracks:
+            if id(track) not in seen:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    self.tracks_expired += 1
+                    continue
+            alive.append(track)
+        self.tracks = alive
+        return result
+
+    def needs_recognition(self, track, now=None):
+        """ True if the track's identity has to be (re)computed; updates hit/miss counters """
+        now = time.monotonic() if now is None else now
+        if track.needs_recognition(now, self.reverify_interval, self.unknown_interval, self.conf_drop):
+            self.recognition_misses += 1
+            return True
+        self.recognition_hits += 1
+        return False
+
+    def set_identity(self, track, name, now=None):
+        track.name = name
+        track.verified_at = time.monotonic() if now is None else now
+        track.verified_score = track.score
+
+    def stats(self):
+        total = self.recognition_hits + self.recognition_misses
+        return {
+            'active_tracks': len(self.tracks),
+            'tracks_created': self.tracks_created,
+            'tracks_expired': self.tracks_expired,
+            'recognition_hits': self.recognition_hits,
+            'recognition_misses': self.recognition_misses,
+            'recognition_hit_rate': round(self.recognition_hits / total, 3) if total else 0.0,
+        }
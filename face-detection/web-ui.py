@@ -3,12 +3,23 @@
 import threading
 import time
 import os
+import json
 import cv2
 import numpy as np
-import onnxruntime as ort
 import paho.mqtt.client as mqtt
 import face_recognition
-from flask import Flask, Response, render_template_string
+from flask import Flask, Response, jsonify, render_template_string, request
+
+from postprocess import postprocess
+from preprocess import Preprocessor
+from ort_session import make_session, warmup
+from face_index import EncodingCache, FaceIndex
+from tracker import FaceTracker
+from decode import decode_for_detection
+from recognition_pool import RecognitionPool, DROPPED
+from metrics import REGISTRY
+from broadcast import LazyFrame
+from cameras import Camera, FrameScheduler, camera_from_topic, DEFAULT_CAMERA
 
 # ================= CONFIGURATION =================
 MQTT_BROKER = ""
@@ -16,190 +27,437 @@ MQTT_PORT = 1883
 MQTT_USER = ""
 MQTT_PASS = ""
 
-MQTT_TOPIC_IMAGE = "esp32/cam/image"
-MQTT_TOPIC_WHOIS = "esp32/cam/whois"
+# '+' levels of the image topic name the camera; {camera} in the whois topic is
+# replaced by it. "esp32/cam/image" (no wildcard) is a single camera named "cam".
+MQTT_TOPIC_IMAGE = "esp32/+/image"
+MQTT_TOPIC_WHOIS = "esp32/{camera}/whois"
+MQTT_TOPIC_STATS = "esp32/webui/stats"
+# Enrolment: publish a JPEG/PNG to esp32/webui/enroll/<name>; an empty payload removes <name>
+MQTT_TOPIC_ENROLL = "esp32/webui/enroll/+"
+STATS_INTERVAL = 0  # Seconds between pipeline stats published on MQTT_TOPIC_STATS (0 = off; /metrics is always on)
 
-MODEL_PATH = "yolov5n-face.onnx"
+MODEL_PATH = "yolov5n-face.onnx"  # or the int8 "yolov5n-face.int8.onnx" made by quantize.py
 FACES_DIR = "known_faces"
+ENCODING_CACHE = os.path.join(FACES_DIR, ".encodings.npz")  # None disables the cache
+MATCH_THRESHOLD = 0.55
+FACES_RELOAD_INTERVAL = 5  # Seconds between scans of FACES_DIR for added/changed/removed images (0 = off)
+LETTERBOX = True  # Keep the aspect ratio when scaling frames to the model input
+REVERIFY_INTERVAL = 2.0  # Seconds a tracked face keeps its identity before being recognised again
+NUM_WORKERS = 2  # Detection workers, each with its own ONNX session
+
+# ONNX Runtime session options
+ORT_INTRA_OP_THREADS = 0  # 0: split the CPU cores evenly between the NUM_WORKERS sessions
+ORT_INTER_OP_THREADS = 1
+ORT_EXECUTION_MODE = "sequential"  # or "parallel"
+ORT_OPT_LEVEL = "all"  # disable | basic | extended | all
+ORT_OPTIMIZED_CACHE_DIR = ".ort_cache"  # Optimised graphs are saved/reused here (None = off)
+ORT_ALLOW_SPINNING = False  # Busy-waiting ORT threads compete with dlib and OpenCV
+WARMUP_RUNS = 2
+RECOGNITION_PROCESSES = 0  # >0: compute face encodings in this many worker processes
+RECOGNITION_TIMEOUT = 0.5  # Seconds a frame waits for pooled recognition before dropping faces
+STREAM_JPEG_QUALITY = 95  # Default for /video_feed; viewers can ask for ?quality=&width=
+REDUCED_DECODE = True  # Decode at 1/2, 1/4 or 1/8 scale for detection; full resolution only for recognition
 
 # ================= GLOBAL VARIABLES =================
-frame_lock = threading.Lock()
-raw_jpeg_bytes = None       # The raw image coming from ESP32
-processed_jpeg_bytes = None # The image AFTER drawing boxes (for web stream)
-
 app = Flask(__name__)
 mqtt_client = None
 
-# Rate Limiter State
-last_publish_time = 0
-last_published_name = ""
+# ================= METRICS =================
+STAGES = ('mqtt_receive', 'decode', 'preprocess', 'inference', 'postprocess',
+          'recognition', 'annotate', 'encode', 'publish')
+STAGE_SECONDS = {stage: REGISTRY.histogram('webui_stage_seconds',
+                                           'Time spent in each pipeline stage (recognition: per face)',
+                                           {'stage': stage})
+                 for stage in STAGES}
+FRAMES_FAILED = REGISTRY.counter('webui_frames_failed_total', 'Frames that could not be decoded or processed')
 
 # ================= MULTI-FACE MATCHER =================
 class FaceMatcher:
-    def __init__(self, faces_dir):
-        self.known_encodings = []
-        self.known_names = []
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+    def __init__(self, faces_dir, cache_path=ENCODING_CACHE, threshold=MATCH_THRESHOLD, pool=None):
+        self.faces_dir = faces_dir
+        self.threshold = threshold
+        self.pool = pool  # Optional RecognitionPool
+        self.index = FaceIndex()  # Replaced as a whole on every change, never mutated
+        self.lock = threading.Lock()  # dlib models are shared, not thread-safe
+        self.sync_lock = threading.Lock()
+        self.files = {}  # filename -> (mtime, name, encoding or None)
+        self.cache = EncodingCache(cache_path)
         print(f"Loading known faces from '{faces_dir}'...")
         if not os.path.exists(faces_dir):
             os.makedirs(faces_dir)
-            return
-
-        for filename in os.listdir(faces_dir):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                path = os.path.join(faces_dir, filename)
+        self.sync()
+
+    def _encode_file(self, filename, path):
+        """ Returns (encoding or None, from_cache) """
+        hit, encoding, sha1 = self.cache.lookup(filename, path)
+        if not hit:
+            img = face_recognition.load_image_file(path)
+            with self.lock:
+                found = face_recognition.face_encodings(img)
+            encoding = found[0] if len(found) > 0 else None
+            self.cache.store(filename, path, sha1, encoding)
+        return encoding, hit
+
+    def sync(self):
+        """
+        Brings the index in line with faces_dir: only new or modified images
+        are encoded, deleted ones are dropped, and the new index is swapped in
+        with a single assignment so readers see either the old or the new one.
+        Returns (added, updated, removed) counts.
+        """
+        with self.sync_lock:
+            listing = {}
+            for entry in os.scandir(self.faces_dir):
+                if entry.is_file() and entry.name.lower().endswith(self.IMAGE_EXTENSIONS):
+                    listing[entry.name] = entry.stat().st_mtime
+
+            added = updated = encoded = 0
+            files = dict(self.files)
+            for filename in sorted(listing):
+                previous = files.get(filename)
+                if previous and previous[0] == listing[filename]:
+                    continue
+                path = os.path.join(self.faces_dir, filename)
                 try:
-                    img = face_recognition.load_image_file(path)
-                    encodings = face_recognition.face_encodings(img)
-                    if len(encodings) > 0:
-                        name = os.path.splitext(filename)[0]
-                        self.known_encodings.append(encodings[0])
-                        self.known_names.append(name)
-                        print(f"  Loaded: {name}")
+                    encoding, hit = self._encode_file(filename, path)
                 except Exception as e:
                     print(f"  Error loading {filename}: {e}")
-
-    def identify(self, face_image_rgb):
-        if len(self.known_encodings) == 0: return "Unknown"
-        if face_image_rgb.size == 0: return "Unknown"
+                    continue
+                name = os.path.splitext(filename)[0]
+                files[filename] = (listing[filename], name, encoding)
+                encoded += 0 if hit else 1
+                if previous:
+                    updated += 1
+                else:
+                    added += 1
+                if encoding is None:
+                    print(f"  No face found in {filename}")
+                else:
+                    print(f"  {'Updated' if previous else 'Loaded'}: {name}{'' if hit else ' (encoded)'}")
+
+            removed = [f for f in files if f not in listing]
+            for filename in removed:
+                print(f"  Removed: {files.pop(filename)[1]}")
+
+            if not (added or updated or removed):
+                return 0, 0, 0
+
+            known = [(name, enc) for _, name, enc in (files[f] for f in sorted(files)) if enc is not None]
+            self.files = files
+            self.index = FaceIndex([n for n, _ in known], [e for _, e in known])
+
+            self.cache.prune(set(listing))
+            try:
+                self.cache.save()
+            except Exception as e:
+                print(f"  Could not save encoding cache: {e}")
+            print(f"  {len(self.index)} known faces ({encoded} encoded, {added} added, "
+                  f"{updated} updated, {len(removed)} removed)")
+            return added, updated, len(removed)
+
+    def _face_path(self, name, ext):
+        safe = os.path.basename(name.strip())
+        if not safe or safe.startswith('.') or safe != name.strip():
+            raise ValueError(f"Invalid face name: {name!r}")
+        return os.path.join(self.faces_dir, safe + ext)
+
+    def enroll(self, name, image_bytes):
+        """ Saves a JPEG/PNG image as <name> (replacing older images of that name) and syncs """
+        if image_bytes[:2] == b'\xff\xd8':
+            ext = '.jpg'
+        elif image_bytes[:8] == b'\x89PNG\r\n\x1a\n':
+            ext = '.png'
+        else:
+            raise ValueError("Enrolment image must be JPEG or PNG")
+        path = self._face_path(name, ext)
+        self._delete_images(name, keep=path)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(image_bytes)
+        os.replace(tmp, path)
+        return self.sync()
+
+    def remove(self, name):
+        """ Deletes every image of <name> and syncs """
+        self._delete_images(name)
+        return self.sync()
+
+    def _delete_images(self, name, keep=None):
+        for ext in self.IMAGE_EXTENSIONS:
+            path = self._face_path(name, ext)
+            if path != keep and os.path.exists(path):
+                os.remove(path)
+
+    def names(self):
+        return sorted(set(self.index.names))
+
+    def identify_many(self, img_rgb, boxes):
+        """
+        Identifies several faces of one RGB image at once.
+        boxes are [x, y, w, h]; returns one name per box, or None for faces
+        the recognition pool dropped.
+        """
+        index = self.index  # One consistent snapshot, even if a reload swaps it meanwhile
+        if len(boxes) == 0: return []
+        if len(index) == 0: return ["Unknown"] * len(boxes)
+
+        if self.pool is not None:
+            return self._identify_pooled(index, img_rgb, boxes)
 
         try:
-            face_image_rgb = np.ascontiguousarray(face_image_rgb)
-            h, w, _ = face_image_rgb.shape
-            face_encodings = face_recognition.face_encodings(face_image_rgb, [(0, w, h, 0)])
-            
-            if len(face_encodings) > 0:
-                matches = face_recognition.face_distance(self.known_encodings, face_encodings[0])
-                best_match_index = np.argmin(matches)
-                if matches[best_match_index] < 0.55:
-                    return self.known_names[best_match_index]
-        except:
+            img_rgb = np.ascontiguousarray(img_rgb)
+            locations = [(y, x + w, y + h, x) for x, y, w, h in boxes]
+            with self.lock:
+                face_encodings = face_recognition.face_encodings(img_rgb, locations)
+            if len(face_encodings) == len(boxes):
+                names, _ = index.match(face_encodings, self.threshold)
+                return names
+        except Exception:
             pass
-        return "Unknown"
+        return ["Unknown"] * len(boxes)
+
+    def _identify_pooled(self, index, img_rgb, boxes):
+        results = self.pool.encode(img_rgb, boxes)
+        names = [None if r is DROPPED else "Unknown" for r in results]
+        found = [n for n, r in enumerate(results) if r is not None and r is not DROPPED]
+        if found:
+            matched, _ = index.match([results[n] for n in found], self.threshold)
+            for n, name in zip(found, matched):
+                names[n] = name
+        return names
+
+    def identify(self, face_image_rgb):
+        if face_image_rgb.size == 0: return "Unknown"
+        h, w = face_image_rgb.shape[:2]
+        return self.identify_many(face_image_rgb, [(0, 0, w, h)])[0]
 
 # ================= YOLO DETECTOR =================
 class YoloFaceDetector:
-    def __init__(self, model_path, matcher):
-        self.session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    def __init__(self, model_path, matcher, letterbox=LETTERBOX, tracker=None):
+        intra = ORT_INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // max(1, NUM_WORKERS))
+        self.session = make_session(model_path, intra_op_threads=intra, inter_op_threads=ORT_INTER_OP_THREADS,
+                                    execution_mode=ORT_EXECUTION_MODE, opt_level=ORT_OPT_LEVEL,
+                                    optimized_cache_dir=ORT_OPTIMIZED_CACHE_DIR,
+                                    allow_spinning=ORT_ALLOW_SPINNING)
+        times = warmup(self.session, WARMUP_RUNS)
+        if times:
+            print(f"Model warm-up: {', '.join(f'{t * 1000:.0f} ms' for t in times)}")
         self.input_name = self.session.get_inputs()[0].name
         self.output_name = self.session.get_outputs()[0].name
         self.input_h = self.session.get_inputs()[0].shape[2]
         self.input_w = self.session.get_inputs()[0].shape[3]
         self.matcher = matcher
+        self.preprocessor = Preprocessor(self.input_w, self.input_h, letterbox=letterbox)
+        self.tracker = tracker if tracker is not None else FaceTracker(reverify_interval=REVERIFY_INTERVAL)
 
     def preprocess(self, img):
-        img_resized = cv2.resize(img, (self.input_w, self.input_h))
-        img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
-        img_data = img_rgb.astype(np.float32) / 255.0
-        img_data = img_data.transpose(2, 0, 1)
-        return np.expand_dims(img_data, axis=0)
-
-    def detect_and_recognize(self, img):
+        # Writes into a buffer reused across frames (see preprocess.py)
+        return self.preprocessor(img)
+
+    def recognize(self, img, boxes):
+        """ Identifies boxes ([x, y, w, h]) of a BGR image, converting only the region around them to RGB """
+        x0 = min(x for x, y, w, h in boxes)
+        y0 = min(y for x, y, w, h in boxes)
+        x1 = max(x + w for x, y, w, h in boxes)
+        y1 = max(y + h for x, y, w, h in boxes)
+        region_rgb = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        return self.matcher.identify_many(region_rgb, [(x - x0, y - y0, w, h) for x, y, w, h in boxes])
+
+    def detect_and_recognize(self, img, tracker=None, full_image=None):
+        """ detect() + annotate(): returns the annotated img and the names found """
+        names, detections = self.detect(img, tracker, full_image)
+        annotate(img, detections)
+        return img, names
+
+    def detect(self, img, tracker=None, full_image=None):
+        """
+        Runs detection and recognition without touching img.
+        Returns (names, detections), detections being (x, y, w, h, label, color)
+        tuples for annotate().
+
+        tracker: the camera's FaceTracker (defaults to the detector's own)
+        full_image: when img was decoded at reduced scale, a callable returning
+        the full-resolution frame, used for the recognition crops only
+        """
+        if tracker is None:
+            tracker = self.tracker
+        t0 = time.perf_counter()
         input_tensor = self.preprocess(img)
+        t1 = time.perf_counter()
         outputs = self.session.run([self.output_name], {self.input_name: input_tensor})
         predictions = np.squeeze(outputs[0])
+        t2 = time.perf_counter()
 
         orig_h, orig_w = img.shape[:2]
-        scale_x = orig_w / self.input_w
-        scale_y = orig_h / self.input_h
-
-        boxes = []
-        scores = []
-
-        for row in predictions:
-            score = row[4] * row[15]
-            if score > 0.5:
-                cx, cy, w, h = row[0], row[1], row[2], row[3]
-                boxes.append([
-                    int((cx - w/2) * scale_x),
-                    int((cy - h/2) * scale_y),
-                    int(w * scale_x),
-                    int(h * scale_y)
-                ])
-                scores.append(float(score))
-
-        indices = cv2.dnn.NMSBoxes(boxes, scores, 0.5, 0.4)
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        found_names = []
-
-        if len(indices) > 0:
-            for i in indices.flatten():
-                x, y, w, h = boxes[i]
-                x, y = max(0, x), max(0, y)
-                w, h = min(w, orig_w - x), min(h, orig_h - y)
-
-                face_crop = img_rgb[y:y+h, x:x+w]
-                name = self.matcher.identify(face_crop)
-                found_names.append(name)
+        boxes, scores = postprocess(predictions, *self.preprocessor.mapping)
+        t3 = time.perf_counter()
+        STAGE_SECONDS['preprocess'].observe(t1 - t0)
+        STAGE_SECONDS['inference'].observe(t2 - t1)
+        STAGE_SECONDS['postprocess'].observe(t3 - t2)
+
+        faces = []
+        for i in range(len(boxes)):
+            x, y, w, h = boxes[i].tolist()
+            x, y = max(0, x), max(0, y)
+            w, h = min(w, orig_w - x), min(h, orig_h - y)
+            if w > 0 and h > 0:
+                faces.append((i, (x, y, w, h)))
+
+        # Faces keep the identity of their track; only new or stale tracks are
+        # recognised, all in one call
+        now = time.monotonic()
+        tracks = tracker.update([box for _, box in faces], [scores[i] for i, _ in faces], now)
+        pending = [n for n, track in enumerate(tracks) if tracker.needs_recognition(track, now)]
+        if pending:
+            t0 = time.perf_counter()
+            pending_boxes = [faces[n][1] for n in pending]
+            source = full_image() if full_image is not None else None
+            if source is not None:
+                sx, sy = source.shape[1] / orig_w, source.shape[0] / orig_h
+                pending_boxes = [(int(x * sx), int(y * sy), int(w * sx), int(h * sy)) for x, y, w, h in pending_boxes]
+            else:
+                source = img
+            names = self.recognize(source, pending_boxes)
+            for n, name in zip(pending, names):
+                if name is not None:  # Dropped faces are retried on the next frame
+                    tracker.set_identity(tracks[n], name, now)
+            STAGE_SECONDS['recognition'].observe((time.perf_counter() - t0) / len(pending), len(pending))
 
-                color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-                cv2.rectangle(img, (x, y), (x+w, y+h), color, 2)
-                cv2.putText(img, f"{name} ({scores[i]:.2f})", (x, y - 10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-        
-        return img, found_names
-
-# Initialize AI Components
-matcher = FaceMatcher(FACES_DIR)
-detector = YoloFaceDetector(MODEL_PATH, matcher)
+        found_names = []
+        detections = []
+        for (i, (x, y, w, h)), track in zip(faces, tracks):
+            name = track.name or "Unknown"
+            found_names.append(name)
+            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+            detections.append((x, y, w, h, f"#{track.id} {name} ({scores[i]:.2f})", color))
+
+        return found_names, detections
+
+def annotate(img, detections):
+    """ Draws detect()'s boxes and labels onto img, in place """
+    t0 = time.perf_counter()
+    for x, y, w, h, label, color in detections:
+        cv2.rectangle(img, (x, y), (x+w, y+h), color, 2)
+        cv2.putText(img, label, (x, y - 10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    STAGE_SECONDS['annotate'].observe(time.perf_counter() - t0)
+
+# AI Components, initialised in __main__ (worker processes re-import this file)
+matcher = None
+detectors = []
+
+def new_camera(camera_id):
+    camera = Camera(camera_id)
+    camera.tracker = FaceTracker(reverify_interval=REVERIFY_INTERVAL)
+    camera.frame_age = REGISTRY.histogram('webui_frame_age_seconds',
+                                          'Time from MQTT receive until the processed frame is ready',
+                                          {'camera': camera_id})
+    return camera
+
+scheduler = FrameScheduler(new_camera)
 
 # ================= BACKGROUND PROCESSING LOOP =================
-def processing_loop():
-    global raw_jpeg_bytes, processed_jpeg_bytes, last_publish_time, last_published_name
-    
-    print("Starting AI Processing Loop...")
+def publish_whois(camera, names):
+    current_time = time.time()
+    if names:
+        whois_msg = ", ".join(names)
+    else:
+        whois_msg = "No Face"
+
+    if whois_msg != camera.last_published_name or (current_time - camera.last_publish_time > 1.0):
+        if mqtt_client and mqtt_client.is_connected():
+            topic = MQTT_TOPIC_WHOIS.format(camera=camera.id)
+            t0 = time.perf_counter()
+            mqtt_client.publish(topic, whois_msg)
+            STAGE_SECONDS['publish'].observe(time.perf_counter() - t0)
+            print(f"Published WHOIS [{camera.id}]: {whois_msg}")
+            camera.last_published_name = whois_msg
+            camera.last_publish_time = current_time
+
+def processing_loop(worker_id, detector):
+    print(f"Starting AI Processing Loop (worker {worker_id})...")
     while True:
-        # 1. Get latest raw image safely
-        img_bytes = None
-        with frame_lock:
-            if raw_jpeg_bytes:
-                img_bytes = raw_jpeg_bytes
-        
-        if img_bytes:
-            try:
-                # Decode
-                np_arr = np.frombuffer(img_bytes, np.uint8)
-                img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-                
-                if img is not None:
-                    # Run AI
-                    img, names = detector.detect_and_recognize(img)
-                    
-                    # Logic: Publish MQTT
-                    current_time = time.time()
-                    if names:
-                        whois_msg = ", ".join(names)
-                    else:
-                        whois_msg = "No Face"
-
-                    if whois_msg != last_published_name or (current_time - last_publish_time > 1.0):
-                        if mqtt_client and mqtt_client.is_connected():
-                            mqtt_client.publish(MQTT_TOPIC_WHOIS, whois_msg)
-                            print(f"Published WHOIS: {whois_msg}")
-                            last_published_name = whois_msg
-                            last_publish_time = current_time
-
-                    # Re-encode for Web Stream
-                    ret, buffer = cv2.imencode('.jpg', img)
-                    if ret:
-                        with frame_lock:
-                            processed_jpeg_bytes = buffer.tobytes()
-            except Exception as e:
-                print(f"Processing Error: {e}")
+        # 1. Wait for a new frame from any camera (fair across cameras, each frame once)
+        camera, img_bytes, seq, received_at = scheduler.acquire()
 
-        # Limit CPU usage (approx 20 FPS max processing)
-        time.sleep(0.05)
+        processed = None
+        try:
+            # Decode
+            t0 = time.perf_counter()
+            if REDUCED_DECODE:
+                img, full_image = decode_for_detection(img_bytes, detector.input_w, detector.input_h,
+                                                       detector.preprocessor.letterbox)
+            else:
+                img, full_image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR), None
+
+            STAGE_SECONDS['decode'].observe(time.perf_counter() - t0)
+
+            if img is None:
+                FRAMES_FAILED.inc()
+            else:
+                # Run AI
+                names, detections = detector.detect(img, camera.tracker, full_image)
+
+                # Logic: Publish MQTT
+                publish_whois(camera, names)
+
+                # Web Stream: annotation and JPEG encoding only happen if a
+                # viewer asks for this frame (see LazyFrame)
+                if camera.broadcaster.clients > 0:
+                    processed = LazyFrame(img, lambda img, d=detections: annotate(img, d),
+                                          encode_seconds=STAGE_SECONDS['encode'])
+                camera.frame_age.observe(time.monotonic() - received_at)
+        except Exception as e:
+            FRAMES_FAILED.inc()
+            print(f"Processing Error [{camera.id}]: {e}")
+        finally:
+            scheduler.release(camera, processed)
+
+# ================= KNOWN FACES RELOAD =================
+def faces_watch_loop():
+    """ Picks up images added, changed or deleted in FACES_DIR by hand (enrol commands sync right away) """
+    while True:
+        time.sleep(FACES_RELOAD_INTERVAL)
+        try:
+            matcher.sync()
+        except Exception as e:
+            print(f"Known faces reload error: {e}")
+
+def handle_enroll(name, image_bytes):
+    try:
+        if image_bytes:
+            matcher.enroll(name, image_bytes)
+            print(f"Enrolled: {name}")
+        else:
+            matcher.remove(name)
+            print(f"Unenrolled: {name}")
+    except Exception as e:
+        print(f"Enrol Error [{name}]: {e}")
 
 # ================= MQTT LOGIC =================
+def on_connect(client, userdata, flags, rc):
+    client.subscribe([(MQTT_TOPIC_IMAGE, 0), (MQTT_TOPIC_ENROLL, 0)])
+
 def on_message(client, userdata, msg):
-    global raw_jpeg_bytes
-    with frame_lock:
-        raw_jpeg_bytes = msg.payload
+    if mqtt.topic_matches_sub(MQTT_TOPIC_ENROLL, msg.topic):
+        # Encoding takes a while: keep it off the network loop
+        name = msg.topic.rsplit('/', 1)[-1]
+        threading.Thread(target=handle_enroll, args=(name, msg.payload), daemon=True).start()
+        return
+
+    t0 = time.perf_counter()
+    camera_id = camera_from_topic(msg.topic, MQTT_TOPIC_IMAGE)
+    if camera_id is not None:
+        scheduler.put(camera_id, msg.payload)
+    STAGE_SECONDS['mqtt_receive'].observe(time.perf_counter() - t0)
 
 def start_mqtt():
     global mqtt_client
     mqtt_client = mqtt.Client()
     mqtt_client.username_pw_set(MQTT_USER, MQTT_PASS)
-    mqtt_client.on_connect = lambda c, u, f, r: c.subscribe(MQTT_TOPIC_IMAGE)
+    mqtt_client.on_connect = on_connect
     mqtt_client.on_message = on_message
     
     while True:
@@ -211,6 +469,42 @@ def start_mqtt():
             print(f"MQTT Error: {e}. Reconnecting in 5s...")
             time.sleep(5)
 
+# ================= STATS =================
+def collect_pipeline_stats():
+    """ Registry collector: counters kept by the scheduler, streams, trackers and pool """
+    for camera_id, counts in scheduler.stats().items():
+        labels = {'camera': camera_id}
+        yield 'webui_frames_received_total', 'counter', 'Frames received over MQTT', labels, counts['frames_received']
+        yield 'webui_frames_processed_total', 'counter', 'Frames run through the pipeline', labels, counts['frames_processed']
+        yield 'webui_frames_dropped_total', 'counter', 'Frames superseded by a newer one before processing', labels, counts['frames_superseded']
+
+        camera = scheduler.get(camera_id, create=False)
+        stream = camera.broadcaster.stats()
+        yield 'webui_stream_clients', 'gauge', 'Connected /video_feed clients', labels, stream['clients']
+        yield 'webui_stream_fps', 'gauge', 'Annotated frames published per second', labels, stream['fps']
+        yield 'webui_stream_frames_skipped_total', 'counter', 'Frames skipped by slow stream clients', labels, stream['frames_skipped']
+
+        tracks = camera.tracker.stats()
+        yield 'webui_tracks_active', 'gauge', 'Face tracks currently alive', labels, tracks['active_tracks']
+        yield 'webui_recognition_cache_hits_total', 'counter', 'Faces that reused their track identity', labels, tracks['recognition_hits']
+        yield 'webui_recognition_cache_misses_total', 'counter', 'Faces that went through recognition', labels, tracks['recognition_misses']
+
+    if matcher and matcher.pool:
+        for key, value in matcher.pool.stats().items():
+            kind = 'gauge' if key == 'in_flight' else 'counter'
+            name = f'webui_recognition_pool_{key}' + ('' if kind == 'gauge' else '_total')
+            yield name, kind, f'Recognition pool: {key}', {}, value
+
+REGISTRY.add_collector(collect_pipeline_stats)
+
+def stats_loop():
+    """ Periodically publishes a compact pipeline summary on MQTT_TOPIC_STATS """
+    while True:
+        time.sleep(STATS_INTERVAL)
+        if mqtt_client and mqtt_client.is_connected():
+            payload = json.dumps({'stages': REGISTRY.summary(), 'cameras': scheduler.stats()})
+            mqtt_client.publish(MQTT_TOPIC_STATS, payload)
+
 # ================= FLASK LOGIC =================
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -221,6 +515,7 @@ HTML_TEMPLATE = """
     <title>Security Feed</title>
     <style>
         body { margin: 0; padding: 0; background-color: #121212; font-family: 'Segoe UI', Roboto, Helvetica, Arial, sans-serif; color: #e0e0e0; display: flex; justify-content: center; align-items: center; height: 100vh; }
+        .grid { display: flex; flex-wrap: wrap; gap: 20px; justify-content: center; }
         .container { background-color: #1e1e1e; padding: 20px; border-radius: 12px; box-shadow: 0 8px 24px rgba(0, 0, 0, 0.5); text-align: center; border: 1px solid #333; }
         h2 { margin-top: 0; margin-bottom: 15px; font-weight: 600; color: #4CAF50; letter-spacing: 1px; }
         .video-frame { border: 2px solid #333; border-radius: 8px; max-width: 100%; height: auto; display: block; }
@@ -230,43 +525,102 @@ HTML_TEMPLATE = """
     </style>
 </head>
 <body>
+<div class="grid">
+{% for camera in cameras %}
 <div class="container">
-    <h2><span class="live-indicator"></span> LIVE FEED</h2>
-    <img src="/video_feed" class="video-frame" alt="Video Stream">
+    <h2><span class="live-indicator"></span> LIVE FEED &bull; {{ camera }}</h2>
+    <img src="/video_feed/{{ camera }}" class="video-frame" alt="Video Stream">
     <div class="status">System Online &bull; Always-On Recognition Active</div>
 </div>
+{% else %}
+<div class="container">
+    <h2><span class="live-indicator"></span> LIVE FEED</h2>
+    <div class="status">Waiting for cameras&hellip; (reload when a camera starts publishing)</div>
+</div>
+{% endfor %}
+</div>
 </body>
 </html>
 """
 
-def generate_frames():
-    global processed_jpeg_bytes
-    while True:
-        frame = None
-        with frame_lock:
-            if processed_jpeg_bytes:
-                frame = processed_jpeg_bytes
-        
-        if frame:
+def generate_frames(camera, quality, width):
+    # Blocks until a new frame is published; slow clients skip to the latest one.
+    # Each frame is encoded once per (quality, width), however many viewers want it.
+    for seq, frame in camera.broadcaster.subscribe():
+        jpeg = frame.jpeg(quality, width)
+        if jpeg:
             yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        
-        time.sleep(0.05) 
+                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return render_template_string(HTML_TEMPLATE, cameras=scheduler.ids())
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'preprocess': [d.preprocessor.stats() for d in detectors],
+        'cameras': scheduler.stats(),
+        'recognition_pool': matcher.pool.stats() if matcher and matcher.pool else None,
+        'streams': {cid: scheduler.get(cid, create=False).broadcaster.stats() for cid in scheduler.ids()},
+        'tracker': {cid: scheduler.get(cid, create=False).tracker.stats() for cid in scheduler.ids()},
+    })
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/faces')
+def faces_list():
+    return jsonify(matcher.names())
+
+@app.route('/faces/<name>', methods=['PUT', 'POST', 'DELETE'])
+def faces_enroll(name):
+    try:
+        if request.method == 'DELETE':
+            matcher.remove(name)
+        else:
+            matcher.enroll(name, request.get_data())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(matcher.names())
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/video_feed/<path:camera_id>')
+def video_feed(camera_id=None):
+    if camera_id is None:
+        ids = scheduler.ids()
+        camera_id = ids[0] if ids else DEFAULT_CAMERA
+    # Cameras are created by their first frame; a request for an unknown id must not add one.
+    # Only a single-camera setup (no '+' in the topic) may wait for its camera to appear.
+    single = '+' not in MQTT_TOPIC_IMAGE.split('/')
+    camera = scheduler.get(camera_id, create=single and camera_id == DEFAULT_CAMERA)
+    if camera is None:
+        return jsonify({'error': f"unknown camera '{camera_id}'"}), 404
+    quality = min(100, max(10, request.args.get('quality', STREAM_JPEG_QUALITY, type=int)))
+    width = max(0, request.args.get('width', 0, type=int))
+    return Response(generate_frames(camera, quality, width), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 if __name__ == '__main__':
+    # 0. AI Components
+    pool = RecognitionPool(RECOGNITION_PROCESSES, timeout=RECOGNITION_TIMEOUT) if RECOGNITION_PROCESSES > 0 else None
+    matcher = FaceMatcher(FACES_DIR, pool=pool)
+    detectors = [YoloFaceDetector(MODEL_PATH, matcher) for _ in range(max(1, NUM_WORKERS))]
+
     # 1. Thread for MQTT (Incoming Data)
     threading.Thread(target=start_mqtt, daemon=True).start()
     
-    # 2. Thread for Processing (AI + Logic)
-    threading.Thread(target=processing_loop, daemon=True).start()
+    # 2. Threads for Processing (AI + Logic), one per detector
+    for worker_id, detector in enumerate(detectors):
+        threading.Thread(target=processing_loop, args=(worker_id, detector), daemon=True).start()
     
-    # 3. Main Thread for Flask (Serving Web Page)
+    # 3. Known faces hot reload
+    if FACES_RELOAD_INTERVAL > 0:
+        threading.Thread(target=faces_watch_loop, daemon=True).start()
+
+    # 4. Optional periodic stats on MQTT
+    if STATS_INTERVAL > 0:
+        threading.Thread(target=stats_loop, daemon=True).start()
+
+    # 5. Main Thread for Flask (Serving Web Page)
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
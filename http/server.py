@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
+import argparse
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 import datetime
 import logging
 
@@ -24,10 +25,28 @@ async def get_time():
     # and it automatically converts it to a JSON response.
     return {"current_time": current_time}
 
+@app.post("/echo")
+async def echo(request: Request):
+    """
+    Handles POST requests to /echo by returning the body as sent,
+    so clients (e.g. bench_http_coap.py) can choose the payload size.
+    """
+    body = await request.body()
+    return Response(content=body, media_type="application/octet-stream")
+
 # 3. Main function to run the server
 if __name__ == "__main__":
-    print("Starting HTTP server on http://127.0.0.1:8000")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--quiet', action='store_true', help="no per-request logging")
+    args = parser.parse_args()
+
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"Starting HTTP server on http://127.0.0.1:{args.port}")
     print("Serving resource at /time")
     
     # Uvicorn runs the FastAPI application
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=args.port, access_log=not args.quiet,
+                log_level="warning" if args.quiet else "info")
\ No newline at end of file
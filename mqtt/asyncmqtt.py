@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+asyncio MQTT client on top of paho: paho's socket callbacks are driven by
+the event loop instead of a network thread per client, so one loop can
+serve many topics and devices.
+
+    import asyncio
+    from asyncmqtt import AsyncMqttClient
+
+    async def main():
+        async with AsyncMqttClient.from_env(client_id="semaforo-ctl", clean_session=False) as client:
+            await client.subscribe("/semaforo/#", qos=1)
+            await client.publish("/semaforo/red", "liga", qos=1)   # returns once PUBACKed
+            async for msg in client.messages():
+                print(msg.topic, msg.payload)
+
+    asyncio.run(main())
+
+Features:
+- reconnects with exponential backoff (plus jitter) and restores the
+  subscriptions, unless the broker kept them (persistent session)
+- persistent sessions: clean_session=False with a fixed client_id
+- max_inflight QoS 1/2 messages on the wire, and at most max_queued
+  unacknowledged messages in total: publish() waits for room (backpressure)
+  or, with block=False, raises asyncio.QueueFull
+- messages(): async iterator over incoming messages. When incoming_queue
+  messages are waiting, the socket is no longer read until messages() has
+  drained half of them, so TCP flow control holds further messages at the
+  broker (nothing acknowledged is lost). With drop_qos0=True, QoS 0 messages
+  that find the queue full are dropped (and counted) instead
+- shared(): one connection per broker/credentials/client id, reused by every
+  caller in the process
+
+python3 asyncmqtt.py sub '/semaforo/#'        # small CLI for trying it out
+python3 asyncmqtt.py pub /semaforo/red liga
+"""
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import uuid
+
+import paho.mqtt.client as mqtt
+
+class AsyncMqttClient:
+    def __init__(self, host, port=1883, username=None, password=None, client_id=None, clean_session=True,
+                 keepalive=60, max_inflight=20, max_queued=1000, incoming_queue=10000, drop_qos0=False,
+                 reconnect_min=1.0, reconnect_max=30.0):
+        if not clean_session and not client_id:
+            raise ValueError("Persistent sessions (clean_session=False) need a fixed client_id")
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.client_id = client_id or f"async-{uuid.uuid4().hex[:8]}"
+
+        self.client = mqtt.Client(client_id=self.client_id, clean_session=clean_session)
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.max_inflight_messages_set(max_inflight)
+        self.client.max_queued_messages_set(0)  # Bounded here instead, so publish() can wait for room
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_unsubscribe = self._on_subscribe
+        self.client.on_message = self._on_message
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        self.max_queued = max_queued
+        self.incoming_queue = incoming_queue
+        self.drop_qos0 = drop_qos0
+        self.reading = False     # Socket registered with add_reader; False while paused
+        self.subscriptions = {}  # topic -> qos, restored after reconnects
+        # mid -> Future resolved by PUBACK/PUBCOMP/SUBACK/UNSUBACK. Acks are only
+        # read on the loop, and publish()/subscribe() register the mid before
+        # yielding, so an ack never arrives before its Future
+        self.pending = {}
+        # mid -> (method, args) of SUBSCRIBE/UNSUBSCRIBE awaiting their ack. A lost
+        # connection moves them to self.resend, and _connected sends them again
+        self.requests = {}
+        self.resend = []         # (method, args, Future)
+        self.loop = None
+        self.connected = None
+        self.closing = False
+        self.supervisor = None
+        self.misc_task = None
+        self.refs = 0
+
+        # Stats
+        self.connects = 0
+        self.published = 0
+        self.received = 0
+        self.incoming_dropped = 0
+        self.incoming_pauses = 0
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """ Broker, port and credentials from MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD """
+        return cls(os.environ.get("MQTT_BROKER"), int(os.environ.get("MQTT_PORT", 1883)),
+                   os.environ.get("MQTT_USERNAME"), os.environ.get("MQTT_PASSWORD"), **kwargs)
+
+    # ================= LIFECYCLE =================
+    async def connect(self):
+        """ Connects (retrying with backoff) and keeps the connection up until close() """
+        if self.supervisor is not None:
+            await self.connected.wait()
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.connected = asyncio.Event()
+        self.lost = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.max_queued)
+        self.incoming = asyncio.Queue()  # Bounded by pausing the reader, see _on_message
+        self.supervisor = self.loop.create_task(self._supervise())
+        await self.connected.wait()
+
+    async def close(self, timeout=2.0):
+        """ Disconnects cleanly (waiting up to timeout for the DISCONNECT to go out) and stops the tasks """
+        self.closing = True
+        if self.loop is None:
+            return  # connect() was never called
+        if self.client.is_connected():
+            self.client.disconnect()
+            try:
+                await asyncio.wait_for(self.lost.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        tasks = [task for task in (self.supervisor, self.misc_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        sock = self.client.socket()
+        if sock is not None:
+            # The DISCONNECT did not go out in time, or the connect was still pending
+            self.loop.remove_reader(sock)
+            self.loop.remove_writer(sock)
+            self.reading = False
+            sock.close()
+
+        for future in list(self.pending.values()) + [future for _, _, future in self.resend]:
+            if not future.done():
+                future.cancel()
+        self.incoming.put_nowait(None)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _supervise(self):
+        delay = self.reconnect_min
+        first = True
+        while not self.closing:
+            if self.connected.is_set():
+                await self.lost.wait()
+                self.lost.clear()
+                continue
+            try:
+                self.lost.clear()
+                # The TCP connect blocks, so it runs off the loop; socket callbacks hop back via _in_loop
+                if first:
+                    await self.loop.run_in_executor(None, self.client.connect, self.host, self.port, self.keepalive)
+                else:
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                first = False
+                await self._wait_connack()
+                delay = self.reconnect_min
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                print(f"MQTT connect to {self.host}:{self.port} failed: {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+                delay = min(delay * 2, self.reconnect_max)
+
+    async def _wait_connack(self):
+        """ Waits for the CONNACK, or for the connection to drop first (e.g. a broker shutting down) """
+        waits = [self.loop.create_task(self.connected.wait()), self.loop.create_task(self.lost.wait())]
+        try:
+            await asyncio.wait(waits, timeout=self.keepalive, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in waits:
+                task.cancel()
+        if self.connected.is_set():
+            return
+        if self.lost.is_set():
+            raise ConnectionError("connection lost before CONNACK")
+        raise asyncio.TimeoutError("no CONNACK")
+
+    # ================= PAHO SOCKET CALLBACKS =================
+    def _in_loop(self, fn, *args):
+        """
+        Runs fn on the event loop: directly when paho calls back from the loop
+        (loop_read/loop_write/loop_misc), which matters for socket close since
+        the socket is gone right after; queued when it calls back from the
+        executor doing connect()/reconnect().
+        """
+        if threading.get_ident() == self.loop_thread:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._in_loop(self._add_socket, sock)
+
+    def _add_socket(self, sock):
+        if self.closing:
+            return  # A connect() that was running in the executor when close() was called
+        # A new connection is always read, or its CONNACK would never arrive;
+        # _on_message pauses it again if the queue is still full
+        self.loop.add_reader(sock, self.client.loop_read)
+        self.reading = True
+        if self.misc_task is None or self.misc_task.done():
+            self.misc_task = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._in_loop(self._remove_socket, sock)
+
+    def _remove_socket(self, sock):
+        self.loop.remove_reader(sock)
+        self.reading = False
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self.loop.add_writer, sock, self.client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self.loop.remove_writer, sock)
+
+    async def _misc_loop(self):
+        """ Keepalive pings and retries, which paho's network thread would otherwise do """
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    # ================= PAHO PROTOCOL CALLBACKS =================
+    def _on_connect(self, client, userdata, flags, rc):
+        self._in_loop(self._connected, flags, rc)
+
+    def _connected(self, flags, rc):
+        if rc != 0:
+            print(f"MQTT connection refused: {mqtt.connack_string(rc)}")
+            return
+        self.connects += 1
+        if self.subscriptions and not flags.get('session present'):
+            self.client.subscribe(list(self.subscriptions.items()))
+        # Requests cut off before their ack; the broker may never have seen them,
+        # session or not. Subscribing and unsubscribing twice is harmless
+        resend, self.resend = self.resend, []
+        for method, args, future in resend:
+            rc, mid = getattr(self.client, method)(*args)
+            if rc == mqtt.MQTT_ERR_SUCCESS:
+                self.pending[mid] = future
+                self.requests[mid] = (method, args)
+            else:
+                self.resend.append((method, args, future))
+        self.connected.set()
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._in_loop(self._disconnected, rc)
+
+    def _disconnected(self, rc):
+        self.connected.clear()
+        self.lost.set()
+        # Unlike QoS 1/2 publishes, which paho resends with the same mid,
+        # SUBSCRIBE/UNSUBSCRIBE are not retried: their acks would never come
+        for mid, (method, args) in list(self.requests.items()):
+            future = self.pending.pop(mid, None)
+            if future is not None and not future.done():
+                self.resend.append((method, args, future))
+        self.requests.clear()
+        if rc != 0 and not self.closing:
+            print(f"MQTT disconnected ({mqtt.error_string(rc)}), reconnecting...")
+
+    def _on_publish(self, client, userdata, mid):
+        self._resolve(mid)
+
+    def _on_subscribe(self, client, userdata, mid, *args):
+        self._resolve(mid)
+
+    def _resolve(self, mid):
+        # paho also calls on_publish for every QoS 0 message it writes; those
+        # mids (and the SUBACKs of resubscribes) have no Future and are ignored
+        self.requests.pop(mid, None)
+        future = self.pending.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(mid)
+
+    def _on_message(self, client, userdata, msg):
+        # paho acknowledges QoS 1/2 messages right after this returns, so they
+        # are always queued; reading stops instead while the queue is full
+        self.received += 1
+        droppable = msg.qos == 0 and self.drop_qos0
+        if droppable and self.incoming.qsize() >= self.incoming_queue:
+            self.incoming_dropped += 1
+            return
+        self.incoming.put_nowait(msg)
+        if self.reading and not droppable and self.incoming.qsize() >= self.incoming_queue:
+            self.loop.remove_reader(self.client.socket())
+            self.reading = False
+            self.incoming_pauses += 1
+
+    def _resume_reading(self):
+        sock = self.client.socket()
+        if not self.reading and sock is not None and self.incoming.qsize() <= self.incoming_queue // 2:
+            self.loop.add_reader(sock, self.client.loop_read)
+            self.reading = True
+
+    def _track(self, mid):
+        future = self.pending[mid] = self.loop.create_future()
+        return future
+
+    # ================= API =================
+    async def publish(self, topic, payload=None, qos=0, retain=False, wait=True, block=True):
+        """
+        Publishes; with wait=True and QoS 1/2, returns once the broker
+        acknowledged. While disconnected QoS 1/2 messages are kept and sent
+        after the reconnect; QoS 0 ones are dropped.
+        """
+        if not block and self.slots.locked():
+            raise asyncio.QueueFull()
+        await self.slots.acquire()
+        try:
+            info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        except Exception:
+            self.slots.release()
+            raise
+        self.published += 1
+        if qos == 0 or info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            self.slots.release()
+            return info.mid
+        future = self._track(info.mid)
+        future.add_done_callback(lambda _: self.slots.release())
+        if wait:
+            await future
+        return info.mid
+
+    async def subscribe(self, topic, qos=0):
+        self.subscriptions[topic] = qos
+        if not self.client.is_connected():
+            return  # Sent by _connected once the connection is up
+        await self._request('subscribe', (topic, qos))
+
+    async def unsubscribe(self, topic):
+        self.subscriptions.pop(topic, None)
+        if not self.client.is_connected():
+            return
+        await self._request('unsubscribe', (topic,))
+
+    async def _request(self, method, args):
+        """ Sends a SUBSCRIBE/UNSUBSCRIBE and waits for its ack, across reconnects """
+        rc, mid = getattr(self.client, method)(*args)
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            return
+        future = self._track(mid)
+        self.requests[mid] = (method, args)
+        await future
+
+    async def messages(self):
+        """ Incoming messages (paho MQTTMessage) until close() """
+        while True:
+            msg = await self.incoming.get()
+            if msg is None:
+                return
+            if not self.reading:
+                self._resume_reading()
+            yield msg
+
+    def stats(self):
+        return {
+            'connected': self.client.is_connected(),
+            'connects': self.connects,
+            'published': self.published,
+            'unacknowledged': len(self.pending),
+            'received': self.received,
+            'incoming_queued': self.incoming.qsize() if self.loop else 0,
+            'incoming_dropped': self.incoming_dropped,
+            'incoming_pauses': self.incoming_pauses,
+        }
+
+# ================= SHARED CONNECTIONS =================
+_shared = {}
+
+async def shared(host=None, port=None, username=None, password=None, client_id=None, **kwargs):
+    """
+    Returns the process-wide connected client for these broker settings
+    (defaults from the environment, like from_env), creating it on first use.
+    """
+    host = host or os.environ.get("MQTT_BROKER")
+    port = port or int(os.environ.get("MQTT_PORT", 1883))
+    username = username or os.environ.get("MQTT_USERNAME")
+    password = password or os.environ.get("MQTT_PASSWORD")
+    key = (host, port, username, client_id)
+    client = _shared.get(key)
+    if client is None:
+        client = _shared[key] = AsyncMqttClient(host, port, username, password, client_id, **kwargs)
+    client.refs += 1
+    await client.connect()
+    return client
+
+async def release(client):
+    """ Drops one reference from shared(); closes the connection with the last one """
+    client.refs -= 1
+    if client.refs <= 0:
+        for key, c in list(_shared.items()):
+            if c is client:
+                del _shared[key]
+        await client.close()
+
+# ================= CLI =================
+async def cli(argv):
+    if len(argv) >= 2 and argv[0] == 'sub':
+        async with AsyncMqttClient.from_env() as client:
+            for topic in argv[1:]:
+                await client.subscribe(topic, qos=1)
+            async for msg in client.messages():
+                print(f"[{msg.topic}] {msg.payload.decode('utf-8', errors='replace')}")
+    elif len(argv) == 3 and argv[0] == 'pub':
+        async with AsyncMqttClient.from_env() as client:
+            await client.publish(argv[1], argv[2], qos=1)
+    else:
+        print("Usage: asyncmqtt.py sub <topic> [<topic> ...] | asyncmqtt.py pub <topic> <message>")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(cli(sys.argv[1:]))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+MQTT end-to-end benchmark: N publishers and M subscribers over a set of
+topics, for every combination of QoS and payload size given. Each payload
+carries the publisher id, a sequence number and the send time, so the
+subscribers can measure delivery rate, loss, duplicates, reordering and
+end-to-end latency.
+
+By default a broker is started locally on a free port for the run (mosquitto
+if installed, otherwise amqtt), so it works on an isolated machine:
+
+    python3 benchmark.py --publishers 4 --subscribers 2 --qos 0 1 2 --payload 64 1024
+    python3 benchmark.py --messages 5000 --rate 1000 --topics 50
+    python3 benchmark.py --external          # use MQTT_BROKER / MQTT_USERNAME / MQTT_PASSWORD
+    python3 benchmark.py --broker-cmd "mosquitto -p {port}"
+"""
+
+import argparse
+import os
+import shlex
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+
+import paho.mqtt.client as mqtt
+
+HEADER = struct.Struct('!IId')  # publisher id, sequence number, send time (time.monotonic)
+
+# ================= LOCAL BROKER =================
+AMQTT_CONFIG = """listeners:
+  default:
+    type: tcp
+    bind: 127.0.0.1:{port}
+auth:
+  allow-anonymous: true
+  plugins: ['auth_anonymous']
+topic-check:
+  enabled: false
+"""
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class LocalBroker:
+    """ Runs a broker process on 127.0.0.1:<port> for the duration of a with block """
+    def __init__(self, command=None, port=None, startup_timeout=15):
+        self.port = port or free_port()
+        self.command = command
+        self.startup_timeout = startup_timeout
+        self.tmpdir = None
+        self.process = None
+
+    def resolve_command(self):
+        if self.command:
+            return self.command.format(port=self.port)
+        if shutil.which('mosquitto'):
+            return f"mosquitto -p {self.port}"
+        if shutil.which('amqtt'):
+            config = os.path.join(self.tmpdir, 'amqtt.yaml')
+            with open(config, 'w') as f:
+                f.write(AMQTT_CONFIG.format(port=self.port))
+            return f"amqtt -c {config}"
+        raise RuntimeError("No local broker found: install mosquitto or amqtt, or pass --broker-cmd / --external")
+
+    def __enter__(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='mqtt-bench-')
+        try:
+            command = self.resolve_command()
+        except RuntimeError:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            raise
+        print(f"Starting broker: {command}")
+        self.log = open(os.path.join(self.tmpdir, 'broker.log'), 'w')
+        self.process = subprocess.Popen(shlex.split(command), stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Broker exited with code {self.process.returncode}, "
+                                   f"see {self.log.name}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.5).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError(f"Broker did not listen on port {self.port} within {self.startup_timeout}s")
+
+    def __exit__(self, *exc):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+# ================= CLIENTS =================
+def make_client(name, broker, port, username, password):
+    client = mqtt.Client(client_id=f"bench-{name}-{uuid.uuid4().hex[:8]}", clean_session=True)
+    if username:
+        client.username_pw_set(username, password)
+    client.max_inflight_messages_set(1000)
+    client.connect(broker, port, keepalive=60)
+    client.loop_start()
+    return client
+
+class Subscriber:
+    """ Records, per publisher, which sequence numbers arrived, in what order and how late """
+    def __init__(self, index, publishers, messages):
+        self.index = index
+        self.seen = [bytearray(messages) for _ in range(publishers)]
+        self.last_seq = [-1] * publishers
+        self.latencies = array('d')
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.first = self.last = None
+        self.subscribed = threading.Event()
+
+    def on_subscribe(self, client, userdata, mid, granted_qos):
+        self.subscribed.set()
+
+    def on_message(self, client, userdata, msg):
+        now = time.monotonic()
+        publisher, seq, sent = HEADER.unpack_from(msg.payload)
+        self.received += 1
+        if self.first is None:
+            self.first = now
+        self.last = now
+        if self.seen[publisher][seq]:
+            self.duplicates += 1
+            return
+        self.seen[publisher][seq] = 1
+        if seq < self.last_seq[publisher]:
+            self.reordered += 1
+        else:
+            self.last_seq[publisher] = seq
+        self.latencies.append(now - sent)
+
+    def unique(self):
+        return sum(sum(s) for s in self.seen)
+
+def publish_loop(client, publisher, topics, prefix, messages, payload_size, qos, rate, start_at):
+    padding = bytes(max(0, payload_size - HEADER.size))
+    interval = 1.0 / rate if rate else 0.0
+    while time.monotonic() < start_at:
+        time.sleep(start_at - time.monotonic())
+    info = None
+    for seq in range(messages):
+        if interval:
+            # Deadline pacing: a slow publish does not lower the long-run rate
+            wait = start_at + seq * interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        topic = f"{prefix}/{(publisher + seq) % topics}"
+        payload = HEADER.pack(publisher, seq, time.monotonic()) + padding
+        info = client.publish(topic, payload, qos=qos)
+    return info
+
+# ================= SCENARIO =================
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+def run_scenario(args, broker, port, qos, payload_size):
+    print(f"Running QoS {qos}, {payload_size} byte payloads...")
+    prefix = f"bench/{uuid.uuid4().hex[:8]}"
+    subscribers, clients = [], []
+    try:
+        for i in range(args.subscribers):
+            sub = Subscriber(i, args.publishers, args.messages)
+            client = make_client(f"sub{i}", broker, port, args.username, args.password)
+            client.on_subscribe = sub.on_subscribe
+            client.on_message = sub.on_message
+            client.subscribe(f"{prefix}/#", qos=qos)
+            subscribers.append(sub)
+            clients.append(client)
+        for sub in subscribers:
+            if not sub.subscribed.wait(10):
+                raise RuntimeError("Subscription not acknowledged")
+
+        publishers = [make_client(f"pub{i}", broker, port, args.username, args.password)
+                      for i in range(args.publishers)]
+        clients.extend(publishers)
+
+        start_at = time.monotonic() + 0.2
+        threads, last_infos = [], [None] * args.publishers
+
+        def run(i):
+            last_infos[i] = publish_loop(publishers[i], i, args.topics, prefix, args.messages,
+                                         payload_size, qos, args.rate, start_at)
+
+        for i in range(args.publishers):
+            threads.append(threading.Thread(target=run, args=(i,)))
+            threads[-1].start()
+        for t in threads:
+            t.join()
+        for info in last_infos:
+            if info is not None and qos > 0:
+                info.wait_for_publish()
+        published = time.monotonic()
+
+        # Wait until everything arrived, or nothing new arrived for --drain seconds
+        expected = args.publishers * args.messages
+        last_total, last_change = -1, time.monotonic()
+        while True:
+            total = sum(s.received for s in subscribers)
+            if all(s.received - s.duplicates >= expected for s in subscribers):
+                break
+            if total != last_total:
+                last_total, last_change = total, time.monotonic()
+            elif time.monotonic() - last_change > args.drain:
+                break
+            time.sleep(0.05)
+    finally:
+        for client in clients:
+            client.loop_stop()
+            client.disconnect()
+
+    latencies = sorted(x for s in subscribers for x in s.latencies)
+    unique = sum(s.unique() for s in subscribers)
+    expected_total = expected * len(subscribers)
+    ends = [s.last for s in subscribers if s.last is not None]
+    elapsed = (max(ends) if ends else published) - start_at
+    return {
+        'qos': qos,
+        'payload': payload_size,
+        'sent': expected,
+        'publish_rate': expected / max(published - start_at, 1e-9),
+        'delivered': unique,
+        'delivery_rate': unique / max(elapsed, 1e-9),
+        'loss': 1 - unique / expected_total if expected_total else 0.0,
+        'duplicates': sum(s.duplicates for s in subscribers),
+        'reordered': sum(s.reordered for s in subscribers),
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+    }
+
+def print_results(results):
+    print(f"\n{'qos':>3} {'payload':>8} {'sent':>8} {'pub msg/s':>10} {'delivered':>10} {'recv msg/s':>11} "
+          f"{'loss %':>7} {'dup':>6} {'reord':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for r in results:
+        print(f"{r['qos']:>3} {r['payload']:>8} {r['sent']:>8} {r['publish_rate']:>10.0f} {r['delivered']:>10} "
+              f"{r['delivery_rate']:>11.0f} {r['loss'] * 100:>7.2f} {r['duplicates']:>6} {r['reordered']:>6} "
+              f"{r['p50'] * 1000:>8.2f} {r['p95'] * 1000:>8.2f} {r['p99'] * 1000:>8.2f} {r['max'] * 1000:>8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--publishers', type=int, default=2)
+    parser.add_argument('--subscribers', type=int, default=1)
+    parser.add_argument('--topics', type=int, default=10, help="publishers spread messages over this many topics")
+    parser.add_argument('--messages', type=int, default=2000, help="messages per publisher")
+    parser.add_argument('--rate', type=float, default=0, help="messages/s per publisher (0 = as fast as possible)")
+    parser.add_argument('--qos', type=int, nargs='+', choices=(0, 1, 2), default=[0, 1])
+    parser.add_argument('--payload', type=int, nargs='+', default=[64, 1024], help="payload sizes in bytes")
+    parser.add_argument('--drain', type=float, default=3, help="seconds without deliveries before giving up")
+    parser.add_argument('--external', action='store_true', help="use the broker from MQTT_BROKER instead of a local one")
+    parser.add_argument('--broker-cmd', help="command that starts a broker, with {port} in it")
+    args = parser.parse_args()
+    args.username = args.password = None
+
+    if args.payload and min(args.payload) < HEADER.size:
+        print(f"Payloads are at least {HEADER.size} bytes (the header); smaller sizes are padded up.")
+
+    results = []
+    try:
+        if args.external:
+            broker = os.environ.get("MQTT_BROKER")
+            port = 1883
+            args.username = os.environ.get("MQTT_USERNAME")
+            args.password = os.environ.get("MQTT_PASSWORD")
+            for qos in args.qos:
+                for size in args.payload:
+                    results.append(run_scenario(args, broker, port, qos, size))
+        else:
+            with LocalBroker(args.broker_cmd) as local:
+                for qos in args.qos:
+                    for size in args.payload:
+                        results.append(run_scenario(args, '127.0.0.1', local.port, qos, size))
+    except KeyboardInterrupt:
+        print("Interrupted")
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    print(f"{args.publishers} publishers x {args.messages} messages, {args.subscribers} subscribers, "
+          f"{args.topics} topics, rate {args.rate or 'max'}")
+    print_results(results)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,33 @@
 #!/usr/bin/env python3
 # /home/ubuntu/iot/mqtt/read
-# Simple MQTT subscriber that prints messages from /AulaIoTPPGIa
+"""
+Prints messages from /AulaIoTPPGIa, or records them.
 
+    read.py                                        # print /AulaIoTPPGIa
+    read.py -t 'fleet/+/telemetry' -t 'fleet/#'    # print several / wildcard topics
+    read.py -t 'fleet/#' --record fleet.db         # archive to SQLite
+    read.py -t 'fleet/#' --record fleet.jsonl      # archive to JSON lines
+
+Runs on asyncmqtt's event loop, which reconnects with backoff and restores
+the subscriptions. When recording, the loop only queues each message; a
+writer thread stores the queue in batches, so disk I/O never runs on the
+network loop. Per-topic rates, queue depth and overflows are printed every
+--stats seconds.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import queue
+import sqlite3
 import sys
+import threading
+import time
 import uuid
 import os
-import paho.mqtt.client as mqtt
+
+from asyncmqtt import AsyncMqttClient
 
 BROKER = os.environ.get("MQTT_BROKER")
 PORT = 1883
@@ -13,40 +35,219 @@ USERNAME = os.environ.get("MQTT_USERNAME")
 PASSWORD = os.environ.get("MQTT_PASSWORD")
 TOPIC = "/AulaIoTPPGIa"
 
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print("Connected to broker")
-        client.subscribe(TOPIC)
-        print(f"Subscribed to {TOPIC}")
-    else:
-        print(f"Connection failed with code {rc}")
-        sys.exit(1)
+# ================= SINKS =================
+class JsonlSink:
+    """ One JSON object per line: ts, topic, qos, retain and payload (text) or payload_b64 (binary) """
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, batch):
+        lines = []
+        for ts, topic, payload, qos, retain in batch:
+            record = {'ts': ts, 'topic': topic, 'qos': qos, 'retain': retain}
+            try:
+                record['payload'] = payload.decode('utf-8')
+            except UnicodeDecodeError:
+                record['payload_b64'] = base64.b64encode(payload).decode('ascii')
+            lines.append(json.dumps(record, ensure_ascii=False))
+        self.file.write('\n'.join(lines) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class SqliteSink:
+    """ messages(ts, topic, qos, retain, payload) indexed by (topic, ts) and by ts; one transaction per batch """
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS messages ("
+                        "id INTEGER PRIMARY KEY, ts REAL NOT NULL, topic TEXT NOT NULL, "
+                        "qos INTEGER, retain INTEGER, payload BLOB)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS messages_topic_ts ON messages (topic, ts)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts)")
+        self.db.commit()
+
+    def write(self, batch):
+        with self.db:
+            self.db.executemany("INSERT INTO messages (ts, topic, payload, qos, retain) VALUES (?, ?, ?, ?, ?)",
+                                batch)
+
+    def close(self):
+        self.db.close()
+
+def open_sink(path):
+    if path.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SqliteSink(path)
+    return JsonlSink(path)
+
+# ================= RECORDER =================
+class Recorder:
+    """
+    Bounded hand-off from the event loop to a batching writer thread.
+    When the queue is full, record() either waits for room (the default:
+    the client then stops reading and TCP flow control holds messages at
+    the broker) or drops the message; both are counted.
+    """
+    def __init__(self, sink, queue_size=100000, batch_size=1000, block=True):
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.block = block
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+
+        # Stats
+        self.received = 0
+        self.written = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+        self.overflows = 0   # Messages that found the queue full
+        self.dropped = 0
+        self.max_depth = 0
+        self.topic_counts = {}
+
+    def start(self):
+        self.thread.start()
+
+    async def record(self, msg):
+        item = (time.time(), msg.topic, msg.payload, msg.qos, int(msg.retain))
+        self.received += 1
+        self.topic_counts[msg.topic] = self.topic_counts.get(msg.topic, 0) + 1
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflows += 1
+            if self.block:
+                await asyncio.get_running_loop().run_in_executor(None, self.queue.put, item)
+            else:
+                self.dropped += 1
+                return
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
 
-def on_message(client, userdata, msg):
+    def writer(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            start = time.perf_counter()
+            try:
+                self.sink.write(batch)
+                self.written += len(batch)
+            except Exception as e:
+                print(f"Write failed, {len(batch)} messages lost: {e}")
+            self.write_seconds += time.perf_counter() - start
+            self.batches += 1
+            if stop:
+                return
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.sink.close()
+
+class StatsPrinter:
+    def __init__(self, recorder, top=10):
+        self.recorder = recorder
+        self.top = top
+        self.last_counts = {}
+        self.last_time = time.monotonic()
+
+    def print(self):
+        r = self.recorder
+        now = time.monotonic()
+        interval = max(now - self.last_time, 1e-9)
+        counts = r.topic_counts.copy()
+        rates = sorted(((n - self.last_counts.get(t, 0)) / interval, t) for t, n in counts.items())
+        rates.reverse()
+        self.last_counts, self.last_time = counts, now
+
+        total = sum(rate for rate, _ in rates)
+        batch_ms = r.write_seconds / r.batches * 1000 if r.batches else 0.0
+        print(f"[Stats] {total:.1f} msg/s over {len(counts)} topics, received {r.received}, written {r.written}, "
+              f"queue {r.queue.qsize()} (max {r.max_depth}), overflows {r.overflows}, dropped {r.dropped}, "
+              f"{r.batches} batches ({batch_ms:.2f} ms avg)")
+        for rate, topic in rates[:self.top]:
+            if rate > 0:
+                print(f"    {rate:>10.1f} msg/s  {topic}")
+
+# ================= SUBSCRIBER =================
+def print_message(msg):
     try:
         payload = msg.payload.decode('utf-8', errors='replace')
     except Exception:
         payload = str(msg.payload)
     print(f"[{msg.topic}] {payload}")
 
-def main():
-    client_id = f"mqtt-reader-{uuid.uuid4().hex[:8]}"
-    client = mqtt.Client(client_id=client_id, clean_session=True)
-    client.username_pw_set(USERNAME, PASSWORD)
-    client.on_connect = on_connect
-    client.on_message = on_message
+async def print_stats(printer, interval):
+    while True:
+        await asyncio.sleep(interval)
+        printer.print()
+
+async def run(args, topics):
+    recorder = printer = stats_task = None
+    if args.record:
+        recorder = Recorder(open_sink(args.record), args.queue_size, args.batch_size, block=not args.drop)
+        recorder.start()
+        printer = StatsPrinter(recorder)
+        print(f"Recording to {args.record}")
 
+    client_id = f"mqtt-reader-{uuid.uuid4().hex[:8]}"
     try:
-        client.connect(BROKER, PORT, keepalive=60)
-    except Exception as e:
-        print(f"Could not connect to broker: {e}")
+        async with AsyncMqttClient(BROKER, PORT, USERNAME, PASSWORD, client_id=client_id) as client:
+            print("Connected to broker")
+            for topic in topics:
+                await client.subscribe(topic, args.qos)
+            print(f"Subscribed to {', '.join(topics)}")
+            if recorder is not None and args.stats:
+                stats_task = asyncio.ensure_future(print_stats(printer, args.stats))
+
+            async for msg in client.messages():
+                if recorder is None:
+                    print_message(msg)
+                else:
+                    await recorder.record(msg)
+    finally:
+        if stats_task is not None:
+            stats_task.cancel()
+        if recorder is not None:
+            recorder.stop()
+            printer.print()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-t', '--topic', action='append', help=f"topic filter, repeatable (default {TOPIC})")
+    parser.add_argument('--qos', type=int, choices=(0, 1, 2), default=0)
+    parser.add_argument('--record', metavar='FILE', help="archive to FILE: .db/.sqlite = SQLite, anything else = JSONL")
+    parser.add_argument('--queue-size', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--drop', action='store_true', help="drop messages when the queue is full instead of blocking")
+    parser.add_argument('--stats', type=float, default=10, help="seconds between stats lines when recording (0 = never)")
+    args = parser.parse_args()
+    topics = args.topic or [TOPIC]
+
+    if not BROKER:
+        print("MQTT_BROKER is not set")
         sys.exit(1)
 
     try:
-        client.loop_forever()
+        asyncio.run(run(args, topics))
     except KeyboardInterrupt:
         print("Interrupted, disconnecting...")
-        client.disconnect()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
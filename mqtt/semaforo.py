@@ -1,28 +1,272 @@
 #!/usr/bin/env python3
+"""
+Traffic-light controller. Without --config it drives one light set on
+/semaforo/{red,yellow,green}; with --config it drives every intersection
+listed in a JSON file over a single MQTT connection (see semaforo.json):
 
-# 
+    {
+      "mode": "pipelined",
+      "intersections": [
+        {"name": "av-brasil-1", "topic_base": "/semaforo/av-brasil-1/",
+         "sequence": [["red", 7], ["green", 5], ["yellow", 2]]}
+      ]
+    }
 
+Modes:
+  pipelined  each phase change publishes the three lamp topics (liga/desliga)
+             with QoS 1 back to back, without waiting for each PUBACK in turn
+  composite  each phase change is one retained QoS 1 message on
+             <topic_base>state, e.g. {"phase": "red", "red": "liga", ...},
+             so a light that reconnects gets the current state at once
+
+Phase boundaries follow a fixed monotonic timeline (see DeadlineScheduler),
+so publish latency and reconnects do not make the cycle drift; --align lines
+the timeline up with the wall clock so separate controllers share it.
+
+Publish latency (send to last PUBACK of a phase change) and phase jitter
+(actual minus planned phase start) are reported per intersection every
+--report seconds.
+"""
+
+import argparse
+import heapq
+import json
+import os
 import sys
+import threading
 import time
-import os
+from collections import deque
 
 import paho.mqtt.client as mqtt
 
+LIGHTS = ('red', 'yellow', 'green')
+DEFAULT_SEQUENCE = [
+    ( 'red', 7 ),
+    ( 'green', 5 ),
+    ( 'yellow', 2 )
+]
+
+class Intersection:
+    def __init__(self, name, topic_base, sequence, offset=0.0):
+        self.name = name
+        self.topic_base = topic_base
+        self.sequence = [(light, float(delay)) for light, delay in sequence]
+        self.offset = float(offset)  # Seconds after start of the first phase change
+        self.index = -1
+
+        # Stats
+        self.changes = 0
+        self.acked = 0
+        self.skipped = 0
+        self.latencies = deque(maxlen=1000)
+        self.jitter = deque(maxlen=1000)  # Actual minus planned phase start, seconds
+
+    def advance(self):
+        self.index = (self.index + 1) % len(self.sequence)
+        return self.sequence[self.index]
+
+    def cycle(self):
+        return sum(delay for _, delay in self.sequence)
+
+# ================= SCHEDULER =================
+class DeadlineScheduler:
+    """
+    Keeps every intersection's phase boundaries on a fixed timeline: the next
+    boundary is the planned one plus the phase duration, never "now plus the
+    duration", so publish latency, reconnects and sleep overshoot do not add
+    up over cycles.
+
+    After a stall the scheduler catches up: a late phase is published at once
+    and only lasts until its planned end. Phases that ended entirely during
+    the stall are skipped, not flashed, and counted.
+    """
+    def __init__(self, intersections, start):
+        self.queue = [(start + inter.offset, i, inter) for i, inter in enumerate(intersections)]
+        heapq.heapify(self.queue)
+
+    def next_due(self):
+        return self.queue[0][0]
+
+    def run_due(self, publish):
+        """ Calls publish(intersection, light, duration) for every phase that has started """
+        while self.queue:
+            planned, i, inter = self.queue[0]
+            now = time.monotonic()
+            if planned > now:
+                return
+
+            cycle = inter.cycle()
+            if now - planned >= cycle:
+                # Stalled for whole cycles: jump over them in one step
+                cycles = int((now - planned) // cycle)
+                planned += cycles * cycle
+                inter.skipped += cycles * len(inter.sequence)
+
+            light, duration = inter.advance()
+            while planned + duration <= now:
+                planned += duration
+                inter.skipped += 1
+                light, duration = inter.advance()
+
+            inter.jitter.append(now - planned)
+            publish(inter, light, planned + duration - now)
+            heapq.heapreplace(self.queue, (planned + duration, i, inter))
+
+class PhaseChange:
+    __slots__ = ('intersection', 'sent', 'remaining')
+
+    def __init__(self, intersection, sent, remaining):
+        self.intersection = intersection
+        self.sent = sent
+        self.remaining = remaining
+
+class Controller:
+    """
+    Publishes phase changes for all intersections on one client and matches
+    PUBACKs (on_publish) back to the phase change they belong to.
+
+    publish() is never called with self.lock held: paho runs on_publish with
+    its own message lock taken, and publish() needs that lock too. A PUBACK
+    that arrives before its mid is registered is parked in self.early.
+    """
+    def __init__(self, client, mode='pipelined', verbose=False):
+        self.client = client
+        self.mode = mode
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.pending = {}   # mid -> PhaseChange
+        self.early = set()  # mids acknowledged before they were registered
+        self.failed = 0
+        client.on_publish = self.on_publish
+
+    def messages(self, intersection, light):
+        states = {name: 'liga' if name == light else 'desliga' for name in LIGHTS}
+        if self.mode == 'composite':
+            payload = json.dumps(dict(phase=light, **states))
+            return [(intersection.topic_base + 'state', payload, True)]
+        return [(intersection.topic_base + name, states[name], False) for name in LIGHTS]
+
+    def publish_phase(self, intersection, light):
+        messages = self.messages(intersection, light)
+        change = PhaseChange(intersection, time.monotonic(), len(messages))
+        mids = []
+        for topic, payload, retain in messages:
+            try:
+                info = self.client.publish(topic, payload=payload, qos=1, retain=retain)
+            except Exception as e:
+                print(f"[{intersection.name}] Publish failed: {e}")
+                self.failed += 1
+                change.remaining -= 1
+                continue
+            # While disconnected paho queues QoS 1 messages and sends them on reconnect
+            mids.append(info.mid)
+        intersection.changes += 1
+
+        with self.lock:
+            for mid in mids:
+                if mid in self.early:
+                    self.early.discard(mid)
+                    self._acked(change)
+                else:
+                    self.pending[mid] = change
+
+    def on_publish(self, client, userdata, mid):
+        with self.lock:
+            change = self.pending.pop(mid, None)
+            if change is None:
+                self.early.add(mid)
+                return
+            self._acked(change)
+
+    def _acked(self, change):
+        change.remaining -= 1
+        if change.remaining == 0:
+            change.intersection.acked += 1
+            change.intersection.latencies.append(time.monotonic() - change.sent)
+
+    def report(self, intersections):
+        with self.lock:
+            in_flight = len(self.pending)
+        print(f"{'':<20} {'':>8} {'':>8} {'publish latency ms':^26}  {'phase jitter ms':^26}")
+        print(f"{'intersection':<20} {'changes':>8} {'acked':>8} {'p50':>8} {'p95':>8} {'max':>8}  "
+              f"{'p50':>8} {'p95':>8} {'max':>8} {'skipped':>8}")
+        for inter in intersections:
+            lat = percentiles(inter.latencies)
+            jit = percentiles(inter.jitter)
+            print(f"{inter.name:<20} {inter.changes:>8} {inter.acked:>8} {lat[0]:>8.1f} {lat[1]:>8.1f} {lat[2]:>8.1f}  "
+                  f"{jit[0]:>8.1f} {jit[1]:>8.1f} {jit[2]:>8.1f} {inter.skipped:>8}")
+        print(f"Messages in flight: {in_flight}, failed publishes: {self.failed}")
+
+def percentiles(values):
+    """ p50, p95 and max of a sample of seconds, in ms """
+    values = sorted(values)
+    if not values:
+        return 0.0, 0.0, 0.0
+    return (values[len(values) // 2] * 1000,
+            values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+            values[-1] * 1000)
+
+def on_disconnect(client, userdata, rc):
+    if rc != 0:
+        print("MQTT client disconnected, reconnecting...")
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    intersections = []
+    for i, entry in enumerate(config['intersections']):
+        name = entry.get('name', f'intersection-{i}')
+        intersection = Intersection(name,
+                                    entry.get('topic_base', f'/semaforo/{name}/'),
+                                    entry.get('sequence', DEFAULT_SEQUENCE),
+                                    entry.get('offset', 0.0))
+        # The scheduler divides by the cycle length and steps through the phases
+        if not intersection.sequence:
+            raise ValueError(f"{name}: empty sequence")
+        if any(delay < 0 for _, delay in intersection.sequence):
+            raise ValueError(f"{name}: negative phase duration")
+        if intersection.cycle() <= 0:
+            raise ValueError(f"{name}: all phase durations are zero")
+        intersections.append(intersection)
+    if not intersections:
+        raise ValueError("no intersections")
+    return config.get('mode', 'pipelined'), intersections
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', help="JSON file with the intersections to drive")
+    parser.add_argument('--mode', choices=('pipelined', 'composite'), help="overrides the config file mode")
+    parser.add_argument('--max-inflight', type=int, default=100, help="QoS 1 messages awaiting PUBACK at once")
+    parser.add_argument('--align', type=float, default=0,
+                        help="start the timeline on a wall-clock multiple of this many seconds, so "
+                             "controllers in different processes keep their offsets (0 = start now)")
+    parser.add_argument('--report', type=float, default=30, help="seconds between latency reports (0 = never)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print every phase change")
+    args = parser.parse_args()
+
     broker = os.environ.get("MQTT_BROKER")
     port = 1883
     username = os.environ.get("MQTT_USERNAME")
     password = os.environ.get("MQTT_PASSWORD")
-    
-    sequence = [
-        ( 'red', 7 ),
-        ( 'green', 5 ),
-        ( 'yellow', 2 )
-    ]
+
+    if args.config:
+        try:
+            mode, intersections = load_config(args.config)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Invalid config {args.config}: {e}")
+            sys.exit(1)
+    else:
+        mode, intersections = 'pipelined', [Intersection('semaforo', '/semaforo/', DEFAULT_SEQUENCE)]
+    mode = args.mode or mode
+    verbose = args.verbose or len(intersections) == 1
 
     client = mqtt.Client()
     client.username_pw_set(username, password)
-    topic_base = "/semaforo/"
+    client.max_inflight_messages_set(args.max_inflight)
+    # The network thread reconnects on its own, backing off from 1s to 30s
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    client.on_disconnect = on_disconnect
+    controller = Controller(client, mode, verbose)
 
     try:
         client.connect(broker, port, keepalive=60)
@@ -31,53 +275,36 @@ def main():
         sys.exit(2)
 
     client.loop_start()
-    
-    while (True):
-        # ensure we're connected, try to reconnect with exponential backoff if not
-        if not client.is_connected():
-            print("MQTT client disconnected, attempting to reconnect...")
-            backoff = 1
-            while not client.is_connected():
-                try:
-                    client.reconnect()
-                    print("Reconnected to broker")
-                    break
-                except Exception as e:
-                    print(f"Reconnect failed: {e}; retrying in {backoff}s")
-                    time.sleep(backoff)
-                    backoff = min(backoff * 2, 30)
-        
-        next = sequence.pop(0)
-        sequence.append(next)
-        light, delay = next
-        
-        try:
-            red = 'desliga'
-            yellow = 'desliga'
-            green = 'desliga'
-            if light == 'red':
-                red = 'liga'
-            elif light == 'yellow':
-                yellow = 'liga'
-            elif light == 'green':
-                green = 'liga'
-            
-            info = client.publish(topic_base + 'red', payload=red, qos=1)
-            info.wait_for_publish()
-            print("Published red light command")
-            info = client.publish(topic_base + 'yellow', payload=yellow, qos=1)
-            info.wait_for_publish()
-            print("Published yellow light command")
-            info = client.publish(topic_base + 'green', payload=green, qos=1)
-            info.wait_for_publish()
-            print("Published green light command")
-        
-            print(f"Set light to {light} for {delay} seconds")
-        except Exception as e:
-            print("Publish failed:", e)
-
-        time.sleep(delay)
+    print(f"Driving {len(intersections)} intersection(s) in {mode} mode")
+
+    start = time.monotonic()
+    if args.align:
+        start += args.align - time.time() % args.align
+    scheduler = DeadlineScheduler(intersections, start)
+
+    def publish(inter, light, duration):
+        controller.publish_phase(inter, light)
+        if verbose:
+            print(f"[{inter.name}] Set light to {light} for {duration:.1f} seconds")
+
+    next_report = time.monotonic() + args.report if args.report else float('inf')
+    try:
+        while True:
+            scheduler.run_due(publish)
+
+            now = time.monotonic()
+            if now >= next_report:
+                controller.report(intersections)
+                next_report = now + args.report
+            wait = min(scheduler.next_due(), next_report) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+    except KeyboardInterrupt:
+        controller.report(intersections)
+    finally:
+        client.loop_stop()
+        client.disconnect()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,189 @@
+"""
+Tests for asyncmqtt against a broker started locally for the module
+(mosquitto or amqtt, as in benchmark.py); skipped when neither is installed.
+
+    python3 -m pytest test_asyncmqtt.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from asyncmqtt import AsyncMqttClient
+from benchmark import LocalBroker
+
+@pytest.fixture(scope='module')
+def broker():
+    local = LocalBroker()
+    try:
+        local.__enter__()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    yield local
+    local.__exit__()
+
+def client(broker, **kwargs):
+    return AsyncMqttClient('127.0.0.1', broker.port, reconnect_min=0.1, reconnect_max=0.5, **kwargs)
+
+def test_qos0_mids_do_not_resolve_qos1_after_wrap(broker):
+    async def main():
+        async with client(broker) as pub:
+            # QoS 0 publishes across the wrap: mids 65534, 65535, 1, 2, 3
+            pub.client._last_mid = 65533
+            mids = [await pub.publish('test/wrap', b'0', qos=0) for _ in range(5)]
+            assert mids == [65534, 65535, 1, 2, 3]
+            await asyncio.sleep(0.2)
+            assert not pub.pending
+
+            # A QoS 1 publish that reuses mid 1 must wait for its own PUBACK
+            pub.client._last_mid = 0
+            mid = await pub.publish('test/wrap', b'1', qos=1, wait=False)
+            assert mid == 1 and 1 in pub.pending
+            await asyncio.wait_for(pub.pending[1], 5)
+            assert not pub.pending
+            assert pub.slots._value == pub.max_queued
+
+    asyncio.run(main())
+
+def test_full_incoming_queue_pauses_reading_without_loss(broker):
+    async def main():
+        async with client(broker, incoming_queue=10) as sub, client(broker) as pub:
+            await sub.subscribe('test/incoming', qos=1)
+            for i in range(100):
+                await pub.publish('test/incoming', str(i), qos=1, wait=False)
+            await asyncio.sleep(0.5)
+            assert not sub.reading and sub.incoming.qsize() <= 11
+
+            received = []
+            async for msg in sub.messages():
+                received.append(int(msg.payload))
+                if len(received) == 100:
+                    break
+            assert received == list(range(100))
+            assert sub.incoming_dropped == 0 and sub.incoming_pauses >= 1
+
+    asyncio.run(main())
+
+def test_drop_qos0_when_opted_in(broker):
+    async def main():
+        async with client(broker, incoming_queue=10, drop_qos0=True) as sub, client(broker) as pub:
+            await sub.subscribe('test/drop', qos=0)
+            for i in range(100):
+                await pub.publish('test/drop', str(i), qos=0)
+            await asyncio.sleep(0.5)
+            assert sub.reading
+            assert sub.incoming.qsize() == 10 and sub.incoming_dropped == 90
+
+    asyncio.run(main())
+
+def test_close_without_connect_and_after_failed_connect(broker):
+    async def main():
+        await client(broker).close()
+
+        unreachable = AsyncMqttClient('127.0.0.1', 1, reconnect_min=0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(unreachable.connect(), 0.5)
+        await unreachable.close()
+        assert unreachable.supervisor.done()
+
+        c = client(broker)
+        await c.connect()
+        sock = c.client.socket()
+        await c.close()
+        assert c.supervisor.done() and c.misc_task.done()
+        assert c.client.socket() is None and sock.fileno() == -1
+        assert [task for task in asyncio.all_tasks() if task is not asyncio.current_task()] == []
+
+    asyncio.run(main())
+
+def test_publish_backpressure(broker):
+    async def main():
+        async with client(broker, max_queued=5) as pub:
+            # Hold the PUBACKs in the socket so the five publishes stay unacknowledged
+            pub.loop.remove_reader(pub.client.socket())
+            for i in range(5):
+                await pub.publish('test/backpressure', str(i), qos=1, wait=False)
+            with pytest.raises(asyncio.QueueFull):
+                await pub.publish('test/backpressure', 'full', qos=1, block=False)
+
+            waiting = asyncio.ensure_future(pub.publish('test/backpressure', 'waits', qos=1))
+            await asyncio.sleep(0.3)
+            assert not waiting.done() and len(pub.pending) == 5
+
+            pub.loop.add_reader(pub.client.socket(), pub.client.loop_read)
+            await asyncio.wait_for(waiting, 5)
+            assert not pub.pending and pub.slots._value == 5
+
+    asyncio.run(main())
+
+def test_reconnect_resubscribes_after_broker_restart():
+    async def main():
+        loop = asyncio.get_running_loop()
+        first = LocalBroker()
+        try:
+            await loop.run_in_executor(None, first.__enter__)
+        except RuntimeError as e:
+            pytest.skip(str(e))
+        second = LocalBroker(port=first.port)
+        try:
+            async with client(first) as sub:
+                await sub.subscribe('test/reconnect', qos=1)
+                await loop.run_in_executor(None, first.__exit__)
+                await loop.run_in_executor(None, second.__enter__)
+                for _ in range(100):
+                    if sub.connects == 2:
+                        break
+                    await asyncio.sleep(0.1)
+                assert sub.connects == 2
+
+                # The restarted broker has no session, so the subscription was sent again
+                async with client(second) as pub:
+                    await pub.publish('test/reconnect', 'after restart', qos=1)
+                msg = await asyncio.wait_for(sub.messages().__anext__(), 5)
+                assert msg.payload == b'after restart'
+        finally:
+            for local in (first, second):
+                if local.process is not None:
+                    local.__exit__()
+
+    asyncio.run(main())
+
+def test_subscribe_survives_broker_restart_before_suback():
+    async def main():
+        loop = asyncio.get_running_loop()
+        first = LocalBroker()
+        try:
+            await loop.run_in_executor(None, first.__enter__)
+        except RuntimeError as e:
+            pytest.skip(str(e))
+        second = LocalBroker(port=first.port)
+        try:
+            async with client(first) as sub:
+                # Stop reading so the client only notices the broker is gone
+                # after the SUBSCRIBE went out and before any SUBACK
+                sock = sub.client.socket()
+                sub.loop.remove_reader(sock)
+                await loop.run_in_executor(None, first.__exit__)
+                subscribing = asyncio.ensure_future(sub.subscribe('test/pending', qos=1))
+                await asyncio.sleep(0.2)
+                assert not subscribing.done()
+
+                await loop.run_in_executor(None, second.__enter__)
+                sub.loop.add_reader(sock, sub.client.loop_read)
+                await asyncio.wait_for(subscribing, 10)
+                assert sub.connects == 2 and not sub.pending and not sub.resend
+
+                async with client(second) as pub:
+                    await pub.publish('test/pending', 'subscribed', qos=1)
+                msg = await asyncio.wait_for(sub.messages().__anext__(), 5)
+                assert msg.payload == b'subscribed'
+        finally:
+            for local in (first, second):
+                if local.process is not None:
+                    local.__exit__()
+
+    asyncio.run(main())
@@ -1,25 +1,132 @@
 #!/usr/bin/env python3
+"""
+Publishes to /semaforo/commands (or --topic).
 
+    write.py <message>                  # one message
+    write.py --bulk commands.txt        # one message per line, one connection
+    cat batch.txt | write.py --bulk - --per-line-topic
+
+In bulk mode up to --window QoS 1 messages are in flight (sent, not yet
+acknowledged) at once. With --per-line-topic each line is "<topic> <payload>".
+Messages per second and ack latency are reported at the end.
+"""
+
+import argparse
 import sys
+import threading
 import time
 import os
 
 import paho.mqtt.client as mqtt
 
+class BulkPublisher:
+    """
+    Keeps at most `window` unacknowledged QoS 1 publishes in flight and
+    records send-to-PUBACK latency for each one. on_publish can run before
+    publish() has returned the mid, so such acks are parked in self.early.
+    """
+    def __init__(self, client, window, qos=1):
+        self.client = client
+        self.qos = qos
+        self.slots = threading.BoundedSemaphore(window)
+        self.lock = threading.Lock()
+        self.sent = {}    # mid -> send time
+        self.early = {}   # mid -> ack time, for acks that beat the registration
+        self.latencies = []
+        self.published = 0
+        self.failed = 0
+        self.idle = threading.Condition(self.lock)
+        client.on_publish = self.on_publish
+
+    def publish(self, topic, payload):
+        self.slots.acquire()
+        start = time.monotonic()
+        try:
+            info = self.client.publish(topic, payload=payload, qos=self.qos)
+        except Exception as e:
+            print("Publish failed:", e)
+            self.failed += 1
+            self.slots.release()
+            return
+        self.published += 1
+        if self.qos == 0:
+            self.slots.release()
+            return
+        with self.lock:
+            acked = self.early.pop(info.mid, None)
+            if acked is None:
+                self.sent[info.mid] = start
+            else:
+                self._acked(acked - start)
+
+    def on_publish(self, client, userdata, mid):
+        if self.qos == 0:
+            return  # paho reports every QoS 0 write here; there is nothing to wait for
+        now = time.monotonic()
+        with self.lock:
+            start = self.sent.pop(mid, None)
+            if start is None:
+                self.early[mid] = now
+                return
+            self._acked(now - start)
+
+    def _acked(self, latency):
+        self.latencies.append(latency)
+        self.slots.release()
+        if not self.sent:
+            self.idle.notify_all()
+
+    def wait(self, timeout):
+        """ Waits until every message is acknowledged; False on timeout """
+        with self.lock:
+            return self.idle.wait_for(lambda: not self.sent, timeout)
+
+def read_messages(source, default_topic, per_line_topic):
+    for line in source:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        if per_line_topic:
+            topic, _, payload = line.partition(' ')
+            yield topic, payload
+        else:
+            yield default_topic, line
+
+def report(publisher, elapsed):
+    count = len(publisher.latencies)
+    rate = publisher.published / elapsed if elapsed > 0 else 0.0
+    print(f"Published {publisher.published} messages in {elapsed:.2f}s ({rate:.0f} msg/s), "
+          f"{count} acknowledged, {publisher.failed} failed")
+    if count:
+        lat = sorted(publisher.latencies)
+        pick = lambda q: lat[min(count - 1, int(count * q))] * 1000
+        print(f"Ack latency ms: mean {sum(lat) / count * 1000:.2f}, p50 {pick(0.5):.2f}, "
+              f"p95 {pick(0.95):.2f}, p99 {pick(0.99):.2f}, max {lat[-1] * 1000:.2f}")
+
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: write.py <message>")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('message', nargs='?')
+    parser.add_argument('--topic', default="/semaforo/commands")
+    parser.add_argument('--bulk', metavar='FILE', help="publish every line of FILE ('-' for stdin)")
+    parser.add_argument('--per-line-topic', action='store_true', help="lines are '<topic> <payload>'")
+    parser.add_argument('--window', type=int, default=100, help="max unacknowledged QoS 1 messages")
+    parser.add_argument('--qos', type=int, choices=(0, 1), default=1)
+    parser.add_argument('--timeout', type=float, default=30, help="seconds to wait for the last acks")
+    args = parser.parse_args()
+
+    if args.message is None and args.bulk is None:
+        print("Usage: write.py <message> | write.py --bulk <file|->")
         sys.exit(1)
 
-    message = sys.argv[1]
     broker = os.environ.get("MQTT_BROKER")
     port = 1883
     username = os.environ.get("MQTT_USERNAME")
     password = os.environ.get("MQTT_PASSWORD")
-    topic = "/semaforo/commands"
+    topic = args.topic
 
     client = mqtt.Client()
     client.username_pw_set(username, password)
+    client.max_inflight_messages_set(args.window)
 
     try:
         client.connect(broker, port, keepalive=60)
@@ -28,16 +135,38 @@ def main():
         sys.exit(2)
 
     client.loop_start()
+    if args.bulk is None:
+        try:
+            info = client.publish(topic, payload=args.message, qos=args.qos)
+            info.wait_for_publish()
+        except Exception as e:
+            print("Publish failed:", e)
+            sys.exit(3)
+        finally:
+            time.sleep(0.1)
+            client.loop_stop()
+            client.disconnect()
+        return
+
+    publisher = BulkPublisher(client, args.window, args.qos)
+    source = sys.stdin if args.bulk == '-' else open(args.bulk)
+    start = time.monotonic()
     try:
-        info = client.publish(topic, payload=message, qos=1)
-        info.wait_for_publish()
-    except Exception as e:
-        print("Publish failed:", e)
-        sys.exit(3)
+        for msg_topic, payload in read_messages(source, topic, args.per_line_topic):
+            publisher.publish(msg_topic, payload)
+        if not publisher.wait(args.timeout):
+            print(f"Timed out waiting for {len(publisher.sent)} acknowledgements")
+    except KeyboardInterrupt:
+        print("Interrupted")
     finally:
-        time.sleep(0.1)
+        elapsed = time.monotonic() - start
+        if source is not sys.stdin:
+            source.close()
         client.loop_stop()
         client.disconnect()
+    report(publisher, elapsed)
+    if publisher.failed or publisher.sent:
+        sys.exit(3)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()